@@ -0,0 +1,453 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Times the Yasso15 model and ModelRunner and keeps a history of the timings
+
+Runs the model on the inputs in test/data and on demo_data.txt: single
+mod5c calls of each model backend, compute_steady_state and run_model at
+several sample sizes, simulation lengths and climate and soil carbon input
+modes, also with the whole trajectory model calls and, in the constant
+modes, with the propagator cache. The best time of a few repeats of each
+case, per call for mod5c, is appended to a JSON history file together with
+the host, the versions and an optional label such as a git revision. A
+case is flagged as a regression when it is slower than the median of its
+earlier timings on the same host by more than the threshold, and the exit
+status is then 1.
+
+    python benchmark.py [options]
+    python benchmark.py --quick --label `git rev-parse --short HEAD`
+
+The timings of different hosts are not compared, and neither are those of
+the cases whose name is not in the history yet.
+
+With --accuracy the solvers and matrix exponentials of the model backends
+are instead compared to the default dense solution with the Taylor series
+on the climates and litter in test/data, timesteps from a month to 10000
+years and a few parameter sets. The largest difference relative to the
+largest compartment of the state is reported for each, and the exit status
+is 1 if one is over the tolerance.
+
+    python benchmark.py --accuracy
+"""
+
+import argparse
+import codecs
+import json
+import os
+import platform
+import sys
+import timeit
+from datetime import datetime
+
+import numpy
+
+import modeldata
+from modelcall import BACKENDS, SOLVERS, EXPMS, y15
+from yasso_batch import program_dir, default_parameter_set, \
+                        parameter_file, create_runner
+
+HISTORY_FILE = 'benchmark_history.json'
+# the previous timings a case is compared to
+BASELINE_RUNS = 5
+# the relative slowdown flagged as a regression
+THRESHOLD = 0.2
+SAMPLE_SIZES = (10, 100, 1000)
+TIMESTEPS = (10, 100)
+QUICK_SAMPLE_SIZES = (10, 100)
+QUICK_TIMESTEPS = (10,)
+# the climate and soil carbon input modes run
+MODES = (('constant yearly', 'constant yearly'), ('yearly', 'yearly'),
+         ('monthly', 'monthly'), ('yearly', 'zero'))
+# model calls timed per repeat in the mod5c case
+MOD5C_CALLS = 1000
+SEED = 1
+# the solver and matrix exponential of the kernel options besides the
+# default dense solution with the Taylor series
+KERNEL_OPTIONS = (('block', 'block', 'taylor'), ('pade', 'dense', 'pade'),
+                  ('block-pade', 'block', 'pade'))
+# timestep durations in years and number of parameter sets of --accuracy
+ACCURACY_TIMESTEPS = (1 / 12., 1., 10., 100., 10000.)
+ACCURACY_PARAMETER_SETS = 20
+# the largest difference to the default kernel allowed in --accuracy,
+# relative to the largest compartment
+ACCURACY_TOLERANCE = 1e-3
+
+
+def test_data(datadir):
+    """
+    Returns a modeldata.ModelData of the input files in test/data: the
+    non-woody and the woody litter as the initial state and the constant
+    input, the yearly and monthly input and climate
+    """
+    def table(name, cls, timestep=False):
+        rows = numpy.loadtxt(os.path.join(datadir, name), ndmin=2)
+        if timestep:
+            # the yearly climate has no timestep column
+            rows = numpy.column_stack((numpy.arange(1, len(rows) + 1), rows))
+        return modeldata.values_array(rows, cls)
+    md = modeldata.ModelData()
+    litter = numpy.concatenate((
+                 table('input_nonwoody.dat', modeldata.LitterComponent),
+                 table('input_woody.dat', modeldata.LitterComponent)))
+    md.initial_litter = litter.view(numpy.recarray)
+    md.constant_litter = litter.copy().view(numpy.recarray)
+    md.yearly_litter = table('yearly_input.dat',
+                             modeldata.TimedLitterComponent)
+    md.monthly_litter = table('monthly_input.dat',
+                              modeldata.TimedLitterComponent)
+    md.yearly_climate = table('yearly_climate.dat', modeldata.YearlyClimate,
+                              True)
+    md.monthly_climate = table('monthly_climate.dat',
+                               modeldata.MonthlyClimate)
+    climate = md.yearly_climate[0]
+    md.constant_climate = modeldata.ConstantClimate(
+                              mean_temperature=climate.mean_temperature,
+                              annual_rainfall=climate.annual_rainfall,
+                              variation_amplitude=climate.variation_amplitude)
+    md.data_file = os.path.join(datadir, '*.dat')
+    return md
+
+def demo_data(filename):
+    """
+    Returns a modeldata.ModelData of the demo data file
+    """
+    md = modeldata.ModelData()
+    md.load(filename)
+    return md
+
+def input_data(exedir):
+    """
+    Returns the (name, model data) pairs of the inputs
+    """
+    return [('test', test_data(os.path.join(exedir, 'test', 'data'))),
+            ('demo', demo_data(os.path.join(exedir, 'demo_data.txt')))]
+
+def usable(md, climate_mode, litter_mode):
+    """
+    Returns True if the model data has the input of the modes
+    """
+    sections = {'yearly': md.yearly_litter, 'monthly': md.monthly_litter,
+                'constant yearly': md.constant_litter}
+    if litter_mode in sections and len(sections[litter_mode])==0:
+        return False
+    md.climate_mode = climate_mode
+    md.litter_mode = litter_mode
+    return modeldata.check_settings(md) is None
+
+def best_time(func, repeat):
+    """
+    Returns the shortest of the running times of func in seconds
+    """
+    times = []
+    for i in range(repeat):
+        start = timeit.default_timer()
+        func()
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+def mod5c_case(kernel, params, solver='dense', expm='taylor'):
+    """
+    Returns a function calling the mod5c of the model backend MOD5C_CALLS
+    times with the first parameter set and a non-woody and a woody litter
+    """
+    theta = numpy.array(params[0], dtype=numpy.float32)
+    climate = numpy.array([3.8, 722.0, 11.4], dtype=numpy.float32)
+    init = numpy.array([0.3, 0.4, 0.1, 0.2, 0.0], dtype=numpy.float32)
+    infall = numpy.array([0.6, 0.7, 0.1, 0.5, 0.0], dtype=numpy.float32)
+    codes = (SOLVERS.index(solver), EXPMS.index(expm))
+    def run():
+        for i in range(MOD5C_CALLS // 2):
+            kernel.mod5c(theta, 1.0, climate, init, infall, 0.0, 0.0, False,
+                         *codes)
+            kernel.mod5c(theta, 1.0, climate, init, infall, 10.0, 0.0, False,
+                         *codes)
+    return run
+
+def cases(parfile, backends, samples, timesteps, exedir):
+    """
+    Yields the name of each case, a function running it once and the
+    number of calls its time is divided by
+    """
+    inputs = input_data(exedir)
+    for backend in backends:
+        runner = create_runner(parfile, backend=backend, seed=SEED,
+                               cache_propagators=False)
+        trajectory = create_runner(parfile, backend=backend, seed=SEED,
+                                   cache_propagators=False, trajectory=True)
+        # the timesteps are then solved with y15_numpy, whatever the backend
+        cached = create_runner(parfile, backend=backend, seed=SEED,
+                               cache_propagators=True)
+        yield ('mod5c/%s/per call' % backend,
+               mod5c_case(runner.kernel, runner.param_set), MOD5C_CALLS)
+        for option, solver, expm in KERNEL_OPTIONS:
+            yield ('mod5c/%s/%s/per call' % (backend, option),
+                   mod5c_case(runner.kernel, runner.param_set, solver, expm),
+                   MOD5C_CALLS)
+        for name, md in inputs:
+            for n in samples:
+                if not usable(md, 'constant yearly', 'constant yearly'):
+                    break
+                yield ('steady_state/%s/%s/n%d' % (backend, name, n),
+                       lambda runner=runner, md=md, n=n:
+                           _steady_state(runner, md, n), 1)
+            for climate_mode, litter_mode in MODES:
+                if not usable(md, climate_mode, litter_mode):
+                    continue
+                for n in samples:
+                    for t in timesteps:
+                        yield ('run_model/%s/%s/%s-%s/n%d/t%d'
+                               % (backend, name, climate_mode, litter_mode,
+                                  n, t),
+                               lambda runner=runner, md=md, n=n, t=t,
+                                      modes=(climate_mode, litter_mode):
+                                   _run_model(runner, md, modes, n, t), 1)
+                        if climate_mode==litter_mode=='constant yearly':
+                            yield ('run_model/%s/cached/%s/%s-%s/n%d/t%d'
+                                   % (backend, name, climate_mode,
+                                      litter_mode, n, t),
+                                   lambda runner=cached, md=md, n=n, t=t,
+                                          modes=(climate_mode, litter_mode):
+                                       _run_model(runner, md, modes, n, t),
+                                   1)
+                        if not trajectory._use_trajectory():
+                            continue
+                        yield ('run_model/%s/trajectory/%s/%s-%s/n%d/t%d'
+                               % (backend, name, climate_mode, litter_mode,
+                                  n, t),
+                               lambda runner=trajectory, md=md, n=n, t=t,
+                                      modes=(climate_mode, litter_mode):
+                                   _run_model(runner, md, modes, n, t), 1)
+
+def _steady_state(runner, md, samples):
+    md.climate_mode = md.litter_mode = 'constant yearly'
+    md.sample_size = samples
+    runner.compute_steady_state(md)
+
+def _run_model(runner, md, modes, samples, timesteps):
+    md.climate_mode, md.litter_mode = modes
+    md.sample_size = samples
+    md.simulation_length = timesteps
+    runner.run_model(md)
+
+
+def kernel_inputs(params, datadir):
+    """
+    Returns the mod5c_batch arguments of every combination of the parameter
+    sets, the yearly and monthly climates and the litters in test/data and
+    the ACCURACY_TIMESTEPS, the litter is both the initial state and the
+    yearly input
+    """
+    def rows(name):
+        return numpy.loadtxt(os.path.join(datadir, name), ndmin=2)
+    yearly = rows('yearly_climate.dat')
+    monthly = rows('monthly_climate.dat')
+    # monthly rain as yearly rain, no temperature amplitude
+    climates = numpy.concatenate((yearly, numpy.column_stack(
+                   (monthly[:, 1], 12 * monthly[:, 2],
+                    numpy.zeros(len(monthly))))))
+    litter = numpy.concatenate((rows('input_nonwoody.dat'),
+                                rows('input_woody.dat')))
+    # the masses of the AWENH compartments and the size
+    states = litter[:, 0, None] * litter[:, 2:12:2]
+    sizes = litter[:, 12]
+    steps = numpy.array(ACCURACY_TIMESTEPS)
+    ip, ic, il, it = [index.ravel() for index in numpy.meshgrid(
+                         numpy.arange(len(params)),
+                         numpy.arange(len(climates)),
+                         numpy.arange(len(litter)), numpy.arange(len(steps)),
+                         indexing='ij')]
+    f32 = numpy.float32
+    return (numpy.array(params[ip], dtype=f32, order='F'),
+            numpy.array(steps[it], dtype=f32),
+            numpy.array(climates[ic], dtype=f32, order='F'),
+            numpy.array(states[il], dtype=f32, order='F'),
+            numpy.array(states[il], dtype=f32, order='F'),
+            numpy.array(sizes[il], dtype=f32), numpy.zeros(len(ip), dtype=f32))
+
+def accuracy(parfile, backends, exedir):
+    """
+    Returns the largest difference of each kernel option of each backend
+    to the default dense solution with the Taylor series of the backend,
+    relative to the largest compartment of the state, by case name
+    """
+    differences = {}
+    for backend in backends:
+        runner = create_runner(parfile, backend=backend, seed=SEED)
+        params = runner.param_set
+        params = params[numpy.linspace(0, len(params) - 1,
+                                       ACCURACY_PARAMETER_SETS).astype(int)]
+        args = kernel_inputs(params, os.path.join(exedir, 'test', 'data'))
+        default = runner.kernel.mod5c_batch(*(args + (False,)))
+        scale = numpy.abs(default).max(axis=1)
+        for option, solver, expm in KERNEL_OPTIONS:
+            result = runner.kernel.mod5c_batch(*(args + (
+                         False, SOLVERS.index(solver), EXPMS.index(expm))))
+            differences['accuracy/%s/%s' % (backend, option)] = float(
+                (numpy.abs(result - default).max(axis=1) / scale).max())
+    return differences
+
+def print_accuracy(differences, tolerance, out=sys.stdout):
+    width = max([len(case) for case in differences] + [4])
+    out.write('%-*s %10s\n' % (width, 'case', 'difference'))
+    for case in sorted(differences):
+        out.write('%-*s %10.3g %s\n' % (width, case, differences[case],
+                                        'FAIL' if differences[case] > tolerance
+                                        else ''))
+
+
+def load_history(filename):
+    """
+    Returns the runs in the history file, an empty list if there is none
+    """
+    if not os.path.exists(filename):
+        return []
+    f = codecs.open(filename, 'r', 'utf8')
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+def save_history(filename, history):
+    f = codecs.open(filename, 'w', 'utf8')
+    try:
+        f.write(json.dumps(history, indent=1, sort_keys=True) + '\n')
+    finally:
+        f.close()
+
+def baseline(history, host, case, runs=BASELINE_RUNS):
+    """
+    Returns the median of the last timings of the case on the host, None
+    if it has not been timed there
+    """
+    times = [run['results'][case] for run in history
+             if run['host']==host and case in run['results']]
+    if not times:
+        return None
+    return float(numpy.median(times[-runs:]))
+
+def compare(results, history, host, threshold=THRESHOLD):
+    """
+    Returns a (case, time, baseline, relative change, flag) row of each
+    case, the flag is 'REGRESSION' for the slowdowns over the threshold
+    and 'faster' for the speedups over it
+    """
+    rows = []
+    for case in sorted(results):
+        base = baseline(history, host, case)
+        if base is None or base==0:
+            rows.append((case, results[case], None, None, ''))
+            continue
+        change = results[case] / base - 1
+        if change > threshold:
+            flag = 'REGRESSION'
+        elif change < -threshold:
+            flag = 'faster'
+        else:
+            flag = ''
+        rows.append((case, results[case], base, change, flag))
+    return rows
+
+def print_report(rows, out=sys.stdout):
+    width = max([len(row[0]) for row in rows] + [4])
+    out.write('%-*s %10s %10s %8s\n' % (width, 'case', 'time (s)',
+                                        'baseline', 'change'))
+    for case, time, base, change, flag in rows:
+        if base is None:
+            out.write('%-*s %10.4g %10s %8s\n' % (width, case, time, '-',
+                                                 '-'))
+        else:
+            out.write('%-*s %10.4g %10.4g %+7.1f%% %s\n'
+                      % (width, case, time, base, 100 * change, flag))
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+                description='Times the Yasso15 model and ModelRunner and '
+                            'flags the regressions against the earlier '
+                            'timings')
+    parser.add_argument('-p', '--param', default=None,
+                        help='parameter set name in the param directory or '
+                        'path to a parameter file, by default the one in '
+                        'yasso.ini')
+    parser.add_argument('--backend', action='append', choices=BACKENDS,
+                        help='model backend to time, by default all the '
+                        'available ones')
+    parser.add_argument('--quick', action='store_true',
+                        help='time only the smaller sample sizes and '
+                        'simulation lengths')
+    parser.add_argument('-k', '--filter', default=None,
+                        help='time only the cases whose name contains this')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='number of times each case is run, the best '
+                        'time is kept')
+    parser.add_argument('--history', default=HISTORY_FILE,
+                        help='JSON file of the earlier timings')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='relative slowdown flagged as a regression')
+    parser.add_argument('-l', '--label', default='',
+                        help='label of the run in the history, e.g. the git '
+                        'revision')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='compare to the history without saving the run')
+    parser.add_argument('--accuracy', action='store_true',
+                        help='compare the solvers and matrix exponentials '
+                        'to the default ones instead of timing')
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error('repeat must be at least 1')
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    exedir = program_dir()
+    if args.param is None:
+        args.param = default_parameter_set(exedir)
+    parfile = parameter_file(args.param, exedir)
+    backends = args.backend
+    if backends is None:
+        backends = [backend for backend in BACKENDS
+                    if backend!='fortran' or y15 is not None]
+    if args.accuracy:
+        try:
+            differences = accuracy(parfile, backends, exedir)
+        except Exception as error:
+            sys.stderr.write('Error: %s\n' % error)
+            return 1
+        print_accuracy(differences, ACCURACY_TOLERANCE)
+        if max(differences.values()) > ACCURACY_TOLERANCE:
+            return 1
+        return 0
+    if args.quick:
+        samples, timesteps = QUICK_SAMPLE_SIZES, QUICK_TIMESTEPS
+    else:
+        samples, timesteps = SAMPLE_SIZES, TIMESTEPS
+    results = {}
+    try:
+        for case, func, calls in cases(parfile, backends, samples,
+                                       timesteps, exedir):
+            if args.filter is not None and args.filter not in case:
+                continue
+            results[case] = best_time(func, args.repeat) / calls
+            sys.stderr.write('%s %.4g\n' % (case, results[case]))
+    except Exception as error:
+        sys.stderr.write('Error: %s\n' % error)
+        return 1
+    history = load_history(args.history)
+    host = platform.node()
+    rows = compare(results, history, host, args.threshold)
+    print_report(rows)
+    if not args.dry_run:
+        history.append({'time': datetime.now().isoformat(),
+                        'label': args.label, 'host': host,
+                        'python': platform.python_version(),
+                        'numpy': numpy.__version__, 'repeat': args.repeat,
+                        'results': results})
+        save_history(args.history, history)
+    regressions = [row[0] for row in rows if row[4]=='REGRESSION']
+    if regressions:
+        sys.stderr.write('%d regressions against the median of the last %d '
+                         'runs\n' % (len(regressions), BASELINE_RUNS))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,2 +1,3 @@
-#f2py -m y15 y15_subroutine.f90 only: mod5c
-f2py -c --fcompiler=gnu95 -m y15 y15_subroutine.f90 only: mod5c
+#f2py -m y15 y15_subroutine.f90 only: mod5c mod5c_batch mod5c_trajectory
+f2py -c --fcompiler=gnu95 -m y15 y15_subroutine.f90 only: mod5c mod5c_batch mod5c_trajectory
+#f2py -c --fcompiler=gnu95 --f90flags=-fopenmp -lgomp -m y15 y15_subroutine.f90 only: mod5c mod5c_batch mod5c_trajectory
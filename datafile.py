@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Reader of the sectioned data file format of Yasso15
+
+The data is in sections started by a [name] line and in whitespace
+delimited rows, # starts a comment line. The file is read line by line in
+a single pass: the values of each section are collected as they come and
+converted into a single float array per section, so that large generated
+input files do not build a Python list per row. Errors are reported with
+the line number of the offending row. The module does not depend on the
+user interface or on the model.
+"""
+
+import re
+from collections import defaultdict
+
+import numpy
+
+SECTION_PATTERN = re.compile(r'\[([\w+\s*]+)\]')
+DATA_PATTERN = re.compile(r'[+-Ee\d+\.\d*\s*]+')
+
+VALUE_ERRMSG = "There's an error on line %s\n  %s"\
+               "for section %s\n"\
+               "Values must be space separated and . is the decimal "\
+               "separator"
+
+
+class Section(object):
+    """
+    The rows of a data file section: the values of all the rows in a single
+    float array, the number of values of each row (0 for an empty row) and
+    the line number of each row
+    """
+
+    def __init__(self, name, values, lengths, lines):
+        self.name = name
+        self.values = values
+        self.lengths = lengths
+        self.lines = lines
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def table(self, width, errmsg, stop_at_empty=False, max_rows=None,
+              errors=None):
+        """
+        Returns the non-empty rows as a (n, width) array, up to the first row
+        with another number of values
+
+        width -- number of values of a row
+        errmsg -- what the rows should contain, for the error message
+        stop_at_empty -- an empty row ends the table
+        max_rows -- number of rows read at most, including the empty ones
+        errors -- list to append the error message of a row with a wrong
+                  number of values to, by default a ValueError is raised
+        """
+        lengths = self.lengths[:max_rows]
+        if stop_at_empty:
+            empty = numpy.flatnonzero(lengths==0)
+            if len(empty):
+                lengths = lengths[:empty[0]]
+        bad = numpy.flatnonzero((lengths!=0) & (lengths!=width))
+        if len(bad):
+            row = bad[0]
+            msg = "%s\n%s data values found, %s needed on line %s for "\
+                  "section %s" % (errmsg, lengths[row], width,
+                                  self.lines[row], self.name)
+            if errors is None:
+                raise ValueError(msg)
+            errors.append(msg)
+            lengths = lengths[:row]
+        return self.values[:lengths.sum()].reshape(-1, width)
+
+
+def read_sections(lines, errors=None, first_line=1):
+    """
+    Reads the data file format in a single pass. Returns a dict of section
+    name -> Section of the sections with rows, the rows before the first
+    section header are in the section None.
+
+    lines -- iterable over the lines of the data file
+    errors -- list to append the error messages of the rows that cannot be
+              read to, the rows are skipped. By default a ValueError is
+              raised.
+    first_line -- line number of the first line
+    """
+    match_section = SECTION_PATTERN.match
+    match_data = DATA_PATTERN.match
+    active = None
+    tokens = defaultdict(list)
+    lengths = defaultdict(list)
+    linenos = defaultdict(list)
+    for linecount, line in enumerate(lines, first_line):
+        if line[:1]=='[':
+            # a section header never matches the data pattern
+            m = match_section(line)
+            if m is not None:
+                active = m.group(1)
+            continue
+        d = match_data(line)
+        if d is not None:
+            vals = d.group(0).split()
+            tokens[active].extend(vals)
+            lengths[active].append(len(vals))
+            linenos[active].append(linecount)
+    data = {}
+    for name in lengths:
+        data[name] = _section(name, tokens[name], lengths[name],
+                              linenos[name], errors)
+    return data
+
+def _section(name, tokens, lengths, linenos, errors):
+    """
+    Converts the values of a section into floats at once, row by row only
+    if there are values that are not numbers
+    """
+    try:
+        values = numpy.array(tokens, dtype=float)
+    except ValueError:
+        values = []
+        rows = []
+        start = 0
+        for i, length in enumerate(lengths):
+            vals = tokens[start:start+length]
+            start += length
+            try:
+                values.extend([float(val) for val in vals])
+                rows.append(i)
+            except ValueError:
+                msg = VALUE_ERRMSG % (linenos[i], ' '.join(vals) + '\n', name)
+                if errors is None:
+                    raise ValueError(msg)
+                errors.append(msg)
+        values = numpy.array(values, dtype=float)
+        lengths = [lengths[i] for i in rows]
+        linenos = [linenos[i] for i in rows]
+    return Section(name, values, numpy.array(lengths, dtype=int),
+                   numpy.array(linenos, dtype=int))
+
+def _join(parts):
+    """
+    Joins the rows of the parts of a section into a single Section
+    """
+    if len(parts)==1:
+        return parts[0]
+    return Section(parts[0].name,
+                   numpy.concatenate([part.values for part in parts]),
+                   numpy.concatenate([part.lengths for part in parts]),
+                   numpy.concatenate([part.lines for part in parts]))
+
+
+class SectionReader(object):
+    """
+    Reads the text of a data file as read_sections, keeping the sections
+    read so that a text read again, e.g. after editing and saving it, only
+    has its changed sections parsed again
+    """
+
+    def __init__(self):
+        self._chunks = {}
+
+    def read(self, text, errors=None):
+        """
+        Returns the sections of the text as read_sections
+
+        text -- the whole data file
+        errors -- list to append the error messages of the rows that cannot
+                  be read to, by default a ValueError is raised
+        """
+        parts = defaultdict(list)
+        chunks = {}
+        for first_line, chunk in _split_sections(text):
+            key = (first_line, chunk)
+            if key in self._chunks:
+                data, chunk_errors = self._chunks[key]
+            else:
+                chunk_errors = []
+                data = read_sections(chunk.splitlines(True), chunk_errors,
+                                     first_line)
+            chunks[key] = (data, chunk_errors)
+            if chunk_errors:
+                if errors is None:
+                    raise ValueError(chunk_errors[0])
+                errors.extend(chunk_errors)
+            for name, section in data.items():
+                parts[name].append(section)
+        # the sections of the previous text no longer in this one are
+        # forgotten
+        self._chunks = chunks
+        return dict((name, _join(sections))
+                    for name, sections in parts.items())
+
+def _split_sections(text):
+    """
+    Splits the text into the lines before the first section header and
+    into the sections from their header up to the next one. Yields the
+    number of the first line and the text of each part.
+    """
+    lines = text.splitlines(True)
+    start = 0
+    for i, line in enumerate(lines):
+        if i > start and line[:1]=='[' and SECTION_PATTERN.match(line):
+            yield start + 1, ''.join(lines[start:i])
+            start = i
+    if lines:
+        yield start + 1, ''.join(lines[start:])
@@ -3,27 +3,71 @@
 
 #from __future__ import with_statement
 
-import y15
+try:
+    import y15
+except ImportError:
+    # the compiled model is optional, the NumPy backend is used without it
+    y15 = None
+import y15_numpy
 import numpy
-import math
+import binascii
+import hashlib
+import os
 import struct
 
 from datetime import date
 from dateutil.relativedelta import relativedelta
-from collections import defaultdict
-import random
+import multiprocessing
+import multiprocessing.pool
+import modeldata
+import onlinestats
 import stats
-from pyface.api import ProgressDialog
-from traitsui.message import error
 
 # the order in which data comes in (defined by list index) and in which
 # it should passed to the model (defined in the tuple)
 VALUESPEC = [('mass', None), ('acid', 0), ('water', 1), ('ethanol', 2),
              ('non_soluble', 3), ('humus', 4)]
+# the attributes of a litter component in the order of VALUESPEC
+LITTER_ATTRS = [attr for name, ind in VALUESPEC
+                for attr in (name, name + '_std')]
 STARTDATE = date(2, 1, 1)
 STEADY_STATE_TIMESTEP = 10000.
 # constants for the model parameters
 PARAM_SAMPLES = 10000
+# how many samples are advanced together through the timesteps when the
+# batched model entry point is available
+BATCH_SIZE = 1000
+# the implementations of the model that can be used
+BACKENDS = ('fortran', 'numpy')
+# the solvers of the model equation by the solver code of the backends,
+# see y15_numpy.mod5c_batch
+SOLVERS = ('dense', 'block')
+# the matrix exponentials by the expm code of the backends
+EXPMS = ('taylor', 'pade')
+# extension of the binary cache of a parameter file
+PARAM_CACHE_EXT = '.npy'
+# the moment results: the model data attribute, the result array and its
+# column
+MOMENT_RESULTS = [('stock_tom', 'stock', 2),
+                  ('stock_woody', 'stock', 3),
+                  ('stock_non_woody', 'stock', 4),
+                  ('stock_acid', 'stock', 5),
+                  ('stock_water', 'stock', 6),
+                  ('stock_ethanol', 'stock', 7),
+                  ('stock_non_soluble', 'stock', 8),
+                  ('stock_humus', 'stock', 9),
+                  ('change_tom', 'change', 2),
+                  ('change_woody', 'change', 3),
+                  ('change_non_woody', 'change', 4),
+                  ('change_acid', 'change', 5),
+                  ('change_water', 'change', 6),
+                  ('change_ethanol', 'change', 7),
+                  ('change_non_soluble', 'change', 8),
+                  ('change_humus', 'change', 9),
+                  ('co2', 'co2', 2)]
+# how many values of the stored results are read at a time for the modes
+# and the percentiles of a streamed run
+MOMENT_BLOCK = 1000000
 
 class ModelRunner(object):
     """
@@ -32,18 +76,106 @@ class ModelRunner(object):
     to the model
     """
 
-    def __init__(self, parfile):
+    def __init__(self, parfile, batch_size=BATCH_SIZE, backend=None,
+                 cache_propagators=False, seed=None, solver='dense',
+                 expm='taylor', threads=1, kernel_threads=None,
+                 trajectory=False):
         """
         Constructor.
+
+        parfile -- the model parameter file
+        batch_size -- number of samples computed with a single model call
+                      per timestep, 1 calls the model once per sample
+        backend -- 'fortran' for the compiled y15 module or 'numpy' for
+                   y15_numpy, by default fortran if it is available
+        cache_propagators -- reuse the solution operators of timesteps with
+                             the same parameters, climate, size class,
+                             duration and leaching in the batched runs of
+                             constant yearly climate and litter, where
+                             they repeat from timestep to timestep. The
+                             operators are computed in double precision
+                             with y15_numpy whatever the backend.
+        seed -- seed of the random draws, the same seed gives the same
+                results regardless of the batch size and the number of
+                processes, by default every run is seeded from the OS
+        solver -- 'dense' solves the 5x5 system of the compartments,
+                  'block' only the 4x4 AWEN block and humus in closed form,
+                  which is faster and more accurate for humus
+        expm -- the matrix exponential: 'taylor' for the fixed Taylor
+                series or 'pade' for the Pade approximant of the degree
+                and scaling needed for the working precision, which takes
+                fewer matrix products
+        threads -- number of threads the samples of a run are split into,
+                   in contiguous shards of samples as with the processes
+                   of run_model. The model calls release the GIL, so the
+                   shards run concurrently in this process without forking
+                   or copying the data to other processes. The timesteps
+                   cached with cache_propagators are solved in NumPy,
+                   which holds the GIL for part of the time.
+        kernel_threads -- number of OpenMP threads of the batched model
+                          calls of a y15 module compiled with OpenMP, by
+                          default the OpenMP default (OMP_NUM_THREADS).
+                          With more than one thread the timesteps are
+                          solved with these calls also when
+                          cache_propagators is set. Ignored by the serial
+                          build and the numpy backend.
+        trajectory -- run each sample through all the timesteps with a
+                      single mod5c_trajectory call per size class instead
+                      of calling the model timestep by timestep, the
+                      inputs of the timesteps are drawn at once. The
+                      results agree with the timestep by timestep run
+                      within single precision, as the state is no longer
+                      passed through the masses and percentages of
+                      _endstate2initial between the timesteps. Meant for
+                      the fortran backend, numpy computes the propagators
+                      of every sample without the cache. Ignored if the y15
+                      module has no mod5c_trajectory.
         """
-        self.param_set = []
-        self._param_file_shape = None
-        with open(parfile) as f:
-            for line in f:
-                line_split = line.split()
-                self.param_set.append([float(v.strip()) for v in line_split])
-                if line.strip():
-                    self._param_file_shape = len(line_split)
+        if backend is None:
+            backend = 'fortran' if y15 is not None else 'numpy'
+        if backend not in BACKENDS:
+            raise Exception("Unknown model backend %s." % backend)
+        if backend == 'fortran':
+            if y15 is None:
+                raise Exception("The compiled y15 model module is missing.")
+            self.kernel = y15.yasso
+        else:
+            self.kernel = y15_numpy
+        self.backend = backend
+        if solver not in SOLVERS:
+            raise Exception("Unknown model solver %s." % solver)
+        self.solver = solver
+        self._solver_code = SOLVERS.index(solver)
+        if expm not in EXPMS:
+            raise Exception("Unknown matrix exponential %s." % expm)
+        self.expm = expm
+        self._expm_code = EXPMS.index(expm)
+        if cache_propagators:
+            self.propagators = y15_numpy.PropagatorCache(
+                                   solver=self._solver_code,
+                                   expm=self._expm_code)
+        else:
+            self.propagators = None
+        self._cache_timesteps = False
+        self.batch_size = batch_size
+        self.seed = seed
+        self.threads = threads
+        self.kernel_threads = kernel_threads
+        # 0 leaves the number of threads to OpenMP
+        self._kernel_threads = kernel_threads or 0
+        self.trajectory = trajectory
+        # for creating the runners of the sample shards
+        self._runner_args = {'parfile': parfile, 'batch_size': batch_size,
+                             'backend': backend,
+                             'cache_propagators': cache_propagators,
+                             'solver': solver, 'expm': expm,
+                             'kernel_threads': kernel_threads,
+                             'trajectory': trajectory}
+        self.param_set = load_parameter_set(parfile)
+        if self.param_set is None:
+            self._param_file_shape = None
+        else:
+            self._param_file_shape = self.param_set.shape[1]
                     
     def is_usable_parameter_file(self):
         """Returns True, if the parameter file has a suitable number of
@@ -57,9 +189,7 @@ class ModelRunner(object):
         """
         self.simulation = False
         self.md = modeldata
-        self.steady_state = numpy.empty(shape=(0,6), dtype=numpy.float32)
-        self.timemap = defaultdict(list)
-        self.area_timemap = defaultdict(list)
+        self._read_sections()
         samplesize = self.md.sample_size
         timesteps = 1
         self.timestep_length = STEADY_STATE_TIMESTEP
@@ -68,65 +198,413 @@ class ModelRunner(object):
         self.ml_run = True
         self.infall = {}
         self.initial_mode = 'zero'
+        self._init_draws()
+        self._set_input_timeline(timesteps)
         timemsg = None
-        for j in range(samplesize):
-            self.draw = True
-            self._predict_steady_state(j)
-            self.ml_run = False
+        # one result row per sample and size class
+        self.__create_input(0)
+        self.steady_state = numpy.zeros(shape=(samplesize * len(self.initial),
+                                               6), dtype=numpy.float32)
+        self.ss_rows = 0
+        if self._use_batch():
+            self._predict_steady_state_batch(samplesize)
+        else:
+            for j in range(samplesize):
+                self.draw = True
+                self.draws = None if self.ml_run else self._draw_sample(j, 1)
+                self._predict_steady_state(j)
+                self.ml_run = False
         self._steadystate2initial()
         return self.ss_result
 
 
-    def run_model(self, modeldata):
-        self.simulation = True
-        self.md = modeldata
-        self.c_stock = numpy.empty(shape=(0,10), dtype=numpy.float32)
-        self.c_change = numpy.empty(shape=(0,10), dtype=numpy.float32)
-        self.co2_yield = numpy.empty(shape=(0,3), dtype=numpy.float32)
-        self.timemap = defaultdict(list)
-        self.area_timemap = defaultdict(list)
+    def run_model(self, modeldata, progress=None, processes=1, store=None,
+                  quantiles=False, online=False):
+        """
+        Runs the simulation and returns the C stock, C change and CO2
+        production results. The moment results are set to the model data.
+        If not all the timesteps could be simulated, timemsg tells why.
+
+        modeldata -- the input data and settings, the Yasso user interface
+                     or a modeldata.ModelData
+        progress -- optional callback called as progress(done, total) with
+                    the number of samples done, returning False cancels
+                    the run
+        processes -- number of worker processes the samples are split
+                     into, in contiguous shards of samples, by default the
+                     samples are split between the threads of the runner
+        store -- directory the results are written into a block of samples
+                 at a time during the run, see modeldata.ResultStore. Only
+                 a block of samples is then kept in memory, the moments are
+                 accumulated as the samples finish and the results returned
+                 are memory mapped from the files.
+        quantiles -- the 95% confidence limits are the 2.5 and 97.5
+                     percentiles of the samples instead of the mean -+ 2
+                     standard deviations, estimated with a quantile sketch
+                     in an online run
+        online -- the samples are run a block of samples at a time as with
+                  store, but only their statistics are kept and the results
+                  returned are empty. The mode is estimated from the
+                  densest centroid once there are more samples than the
+                  quantile sketch keeps, see onlinestats.QuantileSketch.
+                  The moments of the samples done can be read with
+                  online_moments during the run, e.g. in the progress
+                  callback.
+        """
+        self._start_run(modeldata)
+        self.progress = progress
         samplesize = self.md.sample_size
-        msg = "Simulating %d samples for %d timesteps" % (samplesize,
-                                                    self.md.simulation_length)
-        progress = ProgressDialog(title="Simulation", message=msg,
-                                  max=samplesize, show_time=True,
-                                  can_cancel=True)
-        progress.open()
         timesteps = self.md.simulation_length
-        self.timestep_length = self.md.timestep_length
+        self.timemsg = None
+        processes = min(processes, samplesize)
+        threads = 1 if processes > 1 else min(self.threads, samplesize)
+        if store is not None or online:
+            self._run_streaming(store, processes, threads)
+        else:
+            self._init_results(samplesize, timesteps)
+            if processes > 1:
+                self._run_shards(processes)
+            elif threads > 1:
+                self._run_shards(threads, threads=True)
+            else:
+                self._run_samples(samplesize, timesteps)
+        if self.timesteps_done < timesteps:
+            self.timemsg = "Simulation extends too far into the future."\
+                           " Couldn't allocate inputs to all timesteps"
+        self._flatten_results()
+        if store is not None:
+            self._fill_stored_moment_results(quantiles)
+        elif online:
+            for resto, res in self.online_moments(quantiles).items():
+                setattr(self.md, resto, res)
+        else:
+            self._fill_moment_results()
+        self._report_progress(samplesize)
+        return self.c_stock, self.c_change, self.co2_yield
+
+    def _start_run(self, modeldata):
+        """
+        Sets up the runner for a simulation of the model data
+        """
+        self.timeline_climate, self.timeline_duration = \
+            self.climate_timeline(modeldata)
+        self.progress = None
         self.ml_run = True
         self.infall = {}
         self.initial_mode = self.md.initial_mode
         if self.initial_mode=='steady state':
-            self.initial_def = self.md.steady_state
+            self.initial_def = self.sections['steady_state']
         else:
-            self.initial_def = self.md.initial_litter
-        timemsg = None
-        for j in range(samplesize):
-            (cont, skip) = progress.update(j)
-            if not cont or skip:
+            self.initial_def = self.sections['initial_litter']
+        self._init_draws()
+        self._set_input_timeline(len(self.timeline_duration))
+        # the propagators repeat only if the climate and litter do, the
+        # cache would keep the timesteps from the kernel threads
+        self._cache_timesteps = self.propagators is not None \
+            and self.md.climate_mode=='constant yearly' \
+            and self.md.litter_mode=='constant yearly' \
+            and (self.kernel_threads or 1) <= 1
+
+    def _read_sections(self):
+        """
+        Takes the data sections of the model data as record arrays, see
+        modeldata.record_array
+        """
+        self.sections = dict((name,
+                              modeldata.record_array(getattr(self.md, name),
+                                                     cls))
+                             for name, cls in modeldata.SECTIONS)
+
+    def climate_timeline(self, modeldata, timesteps=None):
+        """
+        Computes the climate of the simulation timesteps once for all the
+        samples. Returns a (n, 3) array of the mean temperature, annual
+        rainfall and temperature amplitude and a (n,) array of the
+        timestep durations in years. n is less than the number of timesteps
+        if the simulation extends too far into the future.
+
+        modeldata -- the input data and settings
+        timesteps -- number of timesteps, by default the simulation length
+        """
+        self.simulation = True
+        self.md = modeldata
+        self._read_sections()
+        self.timestep_length = self.md.timestep_length
+        if timesteps is None:
+            timesteps = self.md.simulation_length
+        self.curr_yr_ind = 0
+        self.curr_month_ind = 0
+        climate = []
+        duration = []
+        for k in range(timesteps):
+            cl = self._construct_climate(k)
+            if cl==-1:
                 break
-            self.draw = True
-            self.curr_yr_ind = 0
-            self.curr_month_ind = 0
-            for k in range(timesteps):
-                self._predict_timestep(j, k)
-            self.ml_run = False
-        self._fill_moment_results()
-        progress.update(samplesize)
-        if timemsg is not None:
-            error(timemsg, title='Error handling timesteps',
-                  buttons=['OK'])
-        return self.c_stock, self.c_change, self.co2_yield
+            climate.append((cl['temp'], cl['rain'], cl['amplitude']))
+            duration.append(cl['duration'])
+        return (numpy.array(climate, dtype=float).reshape(-1, 3),
+                numpy.array(duration, dtype=float))
+
+    def _timestep_climate(self, timestep):
+        """
+        Returns the climate of a simulation timestep from the climate
+        timeline in the form of _construct_climate, -1 if the timestep is
+        beyond it
+        """
+        if timestep >= len(self.timeline_duration):
+            return -1
+        temp, rain, amplitude = self.timeline_climate[timestep].tolist()
+        return {'duration': float(self.timeline_duration[timestep]),
+                'temp': temp, 'rain': rain, 'amplitude': amplitude}
+
+    def _init_draws(self, entropy=None):
+        """
+        Sets up the random draws of a run: the entropy the random
+        generators of the samples are seeded from and the indices of the
+        size classes in the drawn deviates
+
+        entropy -- entropy of the run, by default the seed of the runner or
+                   fresh entropy from the OS
+        """
+        if entropy is None:
+            entropy = self.seed
+        if entropy is None:
+            entropy = int(binascii.hexlify(os.urandom(16)), 16)
+        self.entropy = entropy
+        sizeclasses = set()
+        for name in ('initial_litter', 'steady_state', 'constant_litter',
+                     'monthly_litter', 'yearly_litter'):
+            sizeclasses.update(self.sections[name].size_class.tolist())
+        self.sc_index = dict((sc, i)
+                             for i, sc in enumerate(sorted(sizeclasses)))
+
+    def _draw_sample(self, sample, timesteps):
+        """
+        Draws all the random numbers of a sample up front from a random
+        generator of its own, so that the results do not depend on the
+        order in which the samples are run: the parameter set row and the
+        standard normal deviates of the initial state by size class and of
+        the input by timestep and size class
+
+        sample -- sample ordinal within the run
+        timesteps -- number of timesteps
+        """
+        # the generator is seeded from a hash of the entropy, the phase
+        # (steady state or simulation) and the sample, RandomState for the
+        # NumPy versions without SeedSequence
+        key = '%d %d %d' % (self.entropy, int(self.simulation), sample)
+        digest = hashlib.sha256(key.encode('ascii')).digest()
+        rng = numpy.random.RandomState(numpy.frombuffer(digest, dtype='<u4'))
+        shape = (len(self.sc_index), len(VALUESPEC))
+        return {'param_index': int(rng.randint(1, PARAM_SAMPLES)),
+                'initial': rng.standard_normal(shape),
+                'infall': rng.standard_normal((timesteps,) + shape)}
+
+    def _run_samples(self, samplesize, timesteps, ml_run=True):
+        """
+        Runs the samples through the timesteps into the result arrays.
+        Returns False if cancelled.
+
+        samplesize -- number of samples
+        timesteps -- number of timesteps to simulate
+        ml_run -- the first sample is the maximum likelihood run
+        """
+        if self._use_trajectory():
+            self.ml_run = ml_run
+            for j in range(samplesize):
+                if not self._report_progress(j):
+                    return False
+                self.draws = None if self.ml_run else \
+                    self._draw_sample(self.first_sample + j, timesteps)
+                self._predict_trajectory(j, timesteps)
+                self.ml_run = False
+                self.samples_done = j + 1
+        elif self._use_batch():
+            for start in range(0, samplesize, self.batch_size):
+                samples = range(start, min(start + self.batch_size,
+                                           samplesize))
+                if not self._predict_sample_block(samples, timesteps,
+                                                  ml_run):
+                    return False
+                self.samples_done = samples[-1] + 1
+        else:
+            self.ml_run = ml_run
+            for j in range(samplesize):
+                if not self._report_progress(j):
+                    return False
+                self.draw = True
+                self.draws = None if self.ml_run else \
+                    self._draw_sample(self.first_sample + j, timesteps)
+                for k in range(timesteps):
+                    self._predict_timestep(j, k)
+                self.ml_run = False
+                self.samples_done = j + 1
+        return True
+
+    def _run_streaming(self, path, processes, threads=1):
+        """
+        Runs the samples a block of samples at a time accumulating their
+        statistics and writing the results into a modeldata.ResultStore in
+        the directory if given. The result arrays are then the memory
+        mapped arrays of the store, empty without one.
+
+        path -- the directory of the store or None
+        processes -- number of worker processes and shards
+        threads -- number of threads and shards if there is one process
+        """
+        samplesize = self.md.sample_size
+        timesteps = self.md.simulation_length
+        steps = min(timesteps, len(self.timeline_duration))
+        if path is None:
+            store = None
+        else:
+            store = modeldata.ResultStore(path, samplesize, steps)
+        if processes > 1 or threads > 1:
+            self.first_sample = 0
+            self.samples_done = 0
+            self.timesteps_done = timesteps
+            if processes > 1:
+                self._run_shards(processes, store, steps)
+            else:
+                self._run_shards(threads, store, steps, threads=True)
+        else:
+            self._stream_samples(store, 0, samplesize, timesteps, steps)
+        if store is None:
+            self._init_results(0, steps)
+            self.timesteps_done = min(self.timesteps_done, steps)
+            self.samples_done = 0
+        else:
+            store.flush()
+            self.stock_data = store.stock
+            self.change_data = store.change
+            self.co2_data = store.co2
+        self.first_sample = 0
+
+    def _stream_samples(self, store, first, samplesize, timesteps, steps):
+        """
+        Runs the samples in blocks of the batch size, writes the results of
+        each block into the store and adds them to the statistics. The
+        statistics by result array name are in the attribute statistics
+        during the run.
+
+        store -- the modeldata.ResultStore or None
+        first -- ordinal of the first sample
+        samplesize -- number of samples
+        timesteps -- number of timesteps to simulate
+        steps -- number of timesteps kept, less than timesteps if the
+                 simulation extends too far into the future
+        """
+        self.statistics = dict((name, onlinestats.SampleStatistics(shape))
+                               for name, shape in self._result_shapes(steps))
+        block = max(self.batch_size, 1)
+        samples_done = 0
+        timesteps_done = timesteps
+        for start in range(first, first + samplesize, block):
+            self._init_results(min(block, first + samplesize - start),
+                               timesteps, start)
+            completed = self._run_samples(self.stock_data.shape[0],
+                                          timesteps, start==0)
+            n = self.samples_done
+            blocks = {'stock': self.stock_data[:n, :steps+1],
+                      'change': self.change_data[:n, :steps],
+                      'co2': self.co2_data[:n, :steps]}
+            if store is not None:
+                store.write(start, blocks)
+            for name in blocks:
+                self.statistics[name].add(blocks[name])
+            samples_done = start - first + n
+            timesteps_done = min(timesteps_done, self.timesteps_done)
+            if not completed:
+                break
+        self.samples_done = samples_done
+        self.timesteps_done = timesteps_done
+
+    def _result_shapes(self, steps):
+        """
+        Returns the names of the result arrays and the shapes of the
+        results of a sample with the timesteps
+        """
+        return [(name, (steps + int(initial), columns))
+                for name, columns, initial in modeldata.ResultStore.ARRAYS]
+
+    def _run_shards(self, processes, store=None, steps=None, threads=False):
+        """
+        Splits the samples into contiguous shards run in a pool of worker
+        processes and merges the results in order. The samples draw their
+        random numbers from the entropy of the run, so the results are the
+        same as in a single process.
+
+        processes -- number of worker processes or threads and shards
+        store -- the modeldata.ResultStore the shards of a streamed run
+                 write their results into
+        steps -- number of timesteps kept in a streamed run, the shards
+                 then return their statistics, which are merged into the
+                 attribute statistics as the shards finish
+        threads -- the shards are run in a pool of threads, each with a
+                   runner of its own
+        """
+        samplesize = self.md.sample_size
+        bounds = [samplesize * i // processes for i in range(processes + 1)]
+        md = modeldata.snapshot(self.md)
+        path = None if store is None else store.path
+        runner_args = self._runner_args
+        if runner_args['kernel_threads'] is None:
+            # the shards already use the CPUs
+            runner_args = dict(runner_args, kernel_threads=1)
+        tasks = [(runner_args, md, bounds[i], bounds[i+1] - bounds[i],
+                  self.entropy, path, steps) for i in range(processes)]
+        if steps is not None:
+            self.statistics = dict(
+                (name, onlinestats.SampleStatistics(shape))
+                for name, shape in self._result_shapes(steps))
+        if threads:
+            pool = multiprocessing.pool.ThreadPool(processes)
+        else:
+            pool = multiprocessing.Pool(processes)
+        try:
+            shards = pool.imap(_run_shard, tasks)
+            for first, last, shard in zip(bounds, bounds[1:], shards):
+                results, samples_done, timesteps_done = shard
+                if steps is None:
+                    stock, change, co2 = results
+                    self.stock_data[first:last] = stock
+                    self.change_data[first:last] = change
+                    self.co2_data[first:last] = co2
+                else:
+                    for name in self.statistics:
+                        self.statistics[name].merge(results[name])
+                self.timesteps_done = min(self.timesteps_done,
+                                          timesteps_done)
+                self.samples_done = first + samples_done
+                if not self._report_progress(last):
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _report_progress(self, done):
+        """
+        Passes the number of samples done to the progress callback, returns
+        False if the run should be cancelled
+
+        done -- number of samples done from the first sample of the result
+                arrays
+        """
+        if self.progress is None:
+            return True
+        return self.progress(self.first_sample + done,
+                             self.md.sample_size) is not False
 
     def _add_c_stock_result(self, sample, timestep, sc, endstate):
         """
-        Adds model result to the C stock
+        Adds model result to the C stock, the results of the size classes
+        are summed up
 
-        res -- model results augmented with timestep, iteration and
-               sizeclass data
+        sample -- sample ordinal
+        timestep -- timestep ordinal
+        sc -- size class of the result
+        endstate -- the model result
         """
-        cs = self.c_stock
         # if sizeclass is non-zero, all the components are added together
         # to get the mass of wood
         if sc>=self.md.woody_size_limit:
@@ -137,29 +615,19 @@ class ModelRunner(object):
             totalom = endstate.sum()
             woody = 0.0
             nonwoody = totalom
-        res = numpy.concatenate(([float(sample), float(timestep), totalom,
-                                  woody, nonwoody], endstate))
-        res.shape = (1, 10)
-        # find out whether there are already results for this timestep and
-        # iteration
-        criterium = (cs[:,0]==res[0,0]) & (cs[:,1]==res[0,1])
-        target = numpy.where(criterium)[0]
-        if len(target) == 0:
-            self.c_stock = numpy.append(cs, res, axis=0)
-        else:
-            # if there are, add the new results to the existing ones
-            self.c_stock[target[0],2:] = numpy.add(cs[target[0],2:], res[0,2:])
+        res = numpy.concatenate(([totalom, woody, nonwoody], endstate))
+        self.stock_data[sample, timestep, 2:] += res
 
     def _add_steady_state_result(self, sc, endstate):
         """
-        Adds model result to the C stock
+        Adds model result to the steady state results
 
-        res -- model results augmented with timestep, iteration and
-               sizeclass data
+        sc -- size class of the result
+        endstate -- the model result
         """
-        res = numpy.concatenate(([float(sc)], endstate))
-        res.shape = (1, 6)
-        self.steady_state= numpy.append(self.steady_state, res, axis=0)
+        self.steady_state[self.ss_rows, 0] = sc
+        self.steady_state[self.ss_rows, 1:] = endstate
+        self.ss_rows += 1
 
     def _calculate_c_change(self, s, ts):
         """
@@ -168,17 +636,8 @@ class ModelRunner(object):
         s -- sample ordinal
         ts -- timestep ordinal
         """
-        cc = self.c_change
-        cs = self.c_stock
-        criterium = (cs[:,0]==s) & (cs[:,1]==ts)
-        nowtarget = numpy.where(criterium)[0]
-        criterium = (cs[:,0]==s) & (cs[:,1]==ts-1)
-        prevtarget = numpy.where(criterium)[0]
-        if len(nowtarget) > 0 and len(prevtarget)>0:
-            stepinf = numpy.array([[s, ts, 0., 0., 0., 0., 0., 0., 0., 0.]],
-                                  dtype=numpy.float32)
-            self.c_change = numpy.append(cc, stepinf, axis=0)
-            self.c_change[-1, 2:] = cs[nowtarget, 2:] - cs[prevtarget, 2:]
+        cs = self.stock_data[s]
+        self.change_data[s, ts-1, 2:] = cs[ts, 2:] - cs[ts-1, 2:]
 
     def _calculate_co2_yield(self, s, ts):
         """
@@ -187,17 +646,10 @@ class ModelRunner(object):
         s -- sample ordinal
         ts -- timestep ordinal
         """
-        cs = self.c_stock
-        cy = self.co2_yield
-        stepinf = numpy.array([[s, ts, 0.]], dtype=numpy.float32)
-        self.co2_yield = numpy.append(cy, stepinf, axis=0)
-        # total organic matter at index 3
-        criterium = (cs[:,0]==s) & (cs[:,1]==ts)
-        rowind = numpy.where(criterium)[0]
-        if len(rowind)>0:
-            atend = cs[rowind[0], 2]
-            co2_as_c = self.ts_initial + self.ts_infall - atend
-            self.co2_yield[-1, 2] = co2_as_c
+        # total organic matter at index 2
+        atend = self.stock_data[s, ts, 2]
+        co2_as_c = self.ts_initial + self.ts_infall - atend
+        self.co2_data[s, ts-1, 2] = co2_as_c
 
     def _construct_climate(self, timestep):
         """
@@ -243,22 +695,26 @@ class ModelRunner(object):
         else:
             # use the first year for steady state computation
             months = range(12)
+            self.curr_month_ind = 0
         rain = 0.0
         temp = 0.0
         maxtemp = 0.0
         mintemp = 0.0
-        maxind = len(self.md.monthly_climate) - 1
+        climate = self.sections['monthly_climate']
+        temperature = climate.temperature.tolist()
+        rainfall = climate.rainfall.tolist()
+        maxind = len(climate) - 1
         for m in months:
             if self.curr_month_ind > maxind:
                 self.curr_month_ind = 0
-            mtemp = self.md.monthly_climate[self.curr_month_ind].temperature
+            mtemp = temperature[self.curr_month_ind]
             temp += mtemp
             if mtemp < mintemp:
                 mintemp = mtemp
             if mtemp > maxtemp:
                 maxtemp = mtemp
             # monthly rain converted into yearly rain
-            rain += 12 * self.md.monthly_climate[self.curr_month_ind].rainfall
+            rain += 12 * rainfall[self.curr_month_ind]
             self.curr_month_ind += 1
         cl['rain'] = rain / len(months)
         cl['temp'] = temp / len(months)
@@ -300,16 +756,17 @@ class ModelRunner(object):
             firstyearweight = 1.0
             if now.year==end.year and not(end.month==12 and end.day==31):
                 addyear = False
-        maxind = len(self.md.yearly_climate) - 1
+        climate = self.sections['yearly_climate']
+        maxind = len(climate) - 1
         for ind in range(len(years)):
             if self.curr_yr_ind > maxind:
                 self.curr_yr_ind = 0
-            cy = self.md.yearly_climate[self.curr_yr_ind]
+            cy = climate[self.curr_yr_ind]
             if self.simulation and cy.timestep==0:
                 # timestep 0 is used only for steady state calculation
                 self.curr_yr_ind += 1
                 if self.curr_yr_ind <= maxind:
-                    cy = self.md.yearly_climate[self.curr_yr_ind]
+                    cy = climate[self.curr_yr_ind]
             if ind == 0:
                 weight = firstyearweight
                 passedzero = False
@@ -326,7 +783,7 @@ class ModelRunner(object):
         if weight < 1.0 and addyear:
             self.curr_yr_ind -= 1
             if self.curr_yr_ind < 0:
-                self.curr_yr_ind = len(self.md.yearly_climate) - 1
+                self.curr_yr_ind = maxind
         cl['rain'] = rain / len(years)
         cl['temp'] = temp / len(years)
         cl['amplitude'] = ampl / len(years)
@@ -336,79 +793,159 @@ class ModelRunner(object):
         """
         Sums up the non-woody initial states and inputs into a single
         initial state and input. Matches the woody inital states and
-        inputs by size class.
+        inputs by size class. The input is taken from the input timeline.
         """
-        self.litter = {}
         if timestep == 0:
             self.initial = {}
             if self.initial_mode!='zero':
                 self._define_components(self.initial_def, self.initial)
-        if self.md.litter_mode == 'constant yearly':
-            self._define_components(self.md.constant_litter, self.litter)
-        elif self.md.litter_mode == 'zero':
-            # Not setting litter to anything. Will be rectified in
-            # _fill_input
-            pass
-        else:
-            timeind = self._map_timestep2timeind(timestep)
-            if self.md.litter_mode=='monthly':
-                infdata = self.md.monthly_litter
-            elif self.md.litter_mode=='yearly':
-                infdata = self.md.yearly_litter
-            self._define_components(infdata, self.litter, tsind=timeind)
-        self._fill_input()
-        
-    
+        self.litter = self.timeline_litter[timestep]
+        self._fill_input(timestep)
 
-    def _define_components(self, fromme, tome, tsind=None):
+    def _set_input_timeline(self, timesteps):
         """
-        Adds the component specification to list to be passed to the model
+        Indexes the litter input and the area changes of the timesteps
+        once for all the samples, see _input_timeline, and keeps the input
+        of each timestep by size class for __create_input
 
-        fromme -- the component specification from the ui
-        tome -- the list on its way to the model
-        tsind -- indices if the components are taken from a timeseries
+        timesteps -- number of timesteps
         """
-        sizeclasses = defaultdict(list)
-        if tsind is None:
-            for i in range(len(fromme)):
-                sizeclasses[fromme[i].size_class].append(i)
-        else:
-            for i in tsind:
-                sizeclasses[fromme[i].size_class].append(i)
-        for sc in sizeclasses:
-            m, m_std, a, a_std, w, w_std = (0., 0., 0., 0., 0., 0.)
-            e, e_std, n, n_std, h, h_std = (0., 0., 0., 0., 0., 0.)
-            for ind in sizeclasses[sc]:
-                litter = fromme[ind]
-                mass = litter.mass
-                m += mass
-                a += mass * litter.acid
-                w += mass * litter.water
-                e += mass * litter.ethanol
-                n += mass * litter.non_soluble
-                h += mass * litter.humus
-                m_std += mass * litter.mass_std
-                a_std += mass * litter.acid_std
-                w_std += mass * litter.water_std
-                e_std += mass * litter.ethanol_std
-                n_std += mass * litter.non_soluble_std
-                h_std += mass * litter.humus_std
-            if m > 0.:
-                tome[sc] = [m , m_std / m, a / m, a_std / m, w / m, w_std / m,
-                            e / m, e_std / m, n / m, n_std / m,
-                            h / m, h_std / m]
+        litter, defined, self.timeline_area = self._input_timeline(timesteps)
+        # by timestep and size class index for _predict_trajectory
+        self.timeline_input = litter
+        sizeclasses = sorted(self.sc_index)
+        self.timeline_litter = [dict(zip(sizeclasses, rows))
+                                for rows in litter.tolist()]
+        self.timeline_sizeclasses = [
+            [sc for sc, isdef in zip(sizeclasses, row) if isdef]
+            for row in defined.tolist()]
+
+    def _input_timeline(self, timesteps):
+        """
+        Computes the litter input of the timesteps in a single pass over
+        the input and area change timeseries. Returns a (n, s, 12) array of
+        the input of the s size classes of self.sc_index in the form of
+        _define_components, a (n, s) array telling which size classes have
+        input defined at each timestep and a list of the n relative area
+        multipliers of the timesteps.
+
+        timesteps -- number of timesteps
+        """
+        mode = self.md.litter_mode
+        area = [1.] * timesteps
+        if mode=='constant yearly':
+            infall = self.sections['constant_litter']
+            litter, defined = self._litter_sums(infall,
+                                                numpy.zeros(len(infall),
+                                                            dtype=int), 1)
+            return (numpy.repeat(litter, timesteps, axis=0),
+                    numpy.repeat(defined, timesteps, axis=0), area)
+        elif mode not in ('monthly', 'yearly'):
+            nsc = len(self.sc_index)
+            return (numpy.zeros((timesteps, nsc, 12)),
+                    numpy.zeros((timesteps, nsc), dtype=bool), area)
+        infall = self.sections[mode + '_litter']
+        records, tinds = self._map_records(infall, timesteps)
+        litter, defined = self._litter_sums(infall[records], tinds, timesteps)
+        if self.simulation:
+            # area changes scale the masses at the end of the timestep
+            changes = self.sections['area_change'].rel_change.tolist()
+            records, tinds = self._map_records(self.sections['area_change'],
+                                               timesteps)
+            for i, k in zip(records.tolist(), tinds.tolist()):
+                area[k] = area[k] * (1. + changes[i])
+        return litter, defined, area
+
+    def _map_records(self, timeseries, timesteps):
+        """
+        Maps the records of a litter input or area change timeseries to
+        the timesteps their dates fall on. Returns the record indices and
+        the corresponding timestep indices.
+
+        timeseries -- record array with a timestep field in months or years
+                      depending on the litter mode
+        timesteps -- number of timesteps
+        """
+        steps = timeseries.timestep
+        if not self.simulation:
+            # for steady state computation include year 0 or first 12 months
+            if self.md.litter_mode=='monthly':
+                incl = (steps >= 1) & (steps <= 12)
             else:
-                tome[sc] = [0., 0., 0., 0., 0., 0., 0., 0., 0., 0., 0., 0.]
+                incl = steps==0
+            if not incl.any() and self.md.litter_mode=='yearly':
+                # if no year 0 specification, use the one for year 1
+                incl = steps==1
+            records = numpy.flatnonzero(incl)
+            return records, numpy.zeros(len(records), dtype=int)
+        # the first month/year has index number 1, the inputs fall on the
+        # first day of a month counted from STARTDATE as do the timesteps
+        if self.md.litter_mode=='monthly':
+            months = steps - 1
+        else:
+            months = 12 * (steps - 1)
+        if self.md.duration_unit=='month':
+            steplen = self.timestep_length
+        elif self.md.duration_unit=='year':
+            steplen = 12 * self.timestep_length
+        tinds = months // steplen
+        records = numpy.flatnonzero((months >= 0) & (tinds < timesteps))
+        return records, tinds[records]
+
+    def _litter_sums(self, records, tinds, timesteps):
+        """
+        Sums up the litter components by timestep and size class weighting
+        the composition by mass. Returns the (timesteps, s, 12) input array
+        in the form of _define_components and the (timesteps, s) array of
+        the size classes defined.
+
+        records -- record array of the litter components
+        tinds -- the timestep index of each of the components
+        timesteps -- number of timesteps
+        """
+        nsc = len(self.sc_index)
+        sums = numpy.zeros((timesteps, nsc, 12))
+        defined = numpy.zeros((timesteps, nsc), dtype=bool)
+        if len(records):
+            values = numpy.column_stack([records[attr]
+                                         for attr in LITTER_ATTRS])
+            mass = values[:,0:1]
+            weighted = numpy.column_stack((mass, mass * values[:,1:]))
+            scinds = [self.sc_index[sc] for sc in records.size_class.tolist()]
+            # unbuffered, so the components are summed up in order
+            numpy.add.at(sums, (tinds, scinds), weighted)
+            defined[tinds, scinds] = True
+        m = sums[:,:,0:1]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            litter = numpy.where(m > 0., sums / m, 0.)
+        litter[:,:,0:1] = numpy.where(m > 0., m, 0.)
+        return litter, defined
 
-    def _draw_from_distr(self, values, pairs, randomize):
+    def _define_components(self, fromme, tome):
+        """
+        Adds the component specification to list to be passed to the model:
+        the total mass of each size class and the composition and relative
+        standard deviations weighted by mass
+
+        fromme -- record array of the component specification from the ui
+        tome -- the size classes on their way to the model
+        """
+        litter = self._litter_sums(fromme, numpy.zeros(len(fromme), dtype=int),
+                                   1)[0][0].tolist()
+        # in the order the size classes appear in
+        for sc in fromme.size_class.tolist():
+            tome[sc] = litter[self.sc_index[sc]]
+
+    def _draw_from_distr(self, values, pairs, deviates=None):
         """
         Draw a sample from the normal distribution based on the mean and std
         pairs
 
         values -- a vector containing mean and standard deviation pairs
         pairs -- how many pairs the vector contains
-        randomize -- boolean for really drawing a random sample instead of
-                  using the maximum likelihood values
+        deviates -- standard normal deviates of the pairs for really drawing
+                    a random sample, None for using the maximum likelihood
+                    values
         """
         # sample size one less than pairs specification as pairs contain
         # the total mass and component percentages. These are transformed
@@ -418,8 +955,8 @@ class ModelRunner(object):
             vs = pairs[i]
             mean = values[2*i]
             std = values[2*i+1]
-            if std>0.0 and randomize:
-                samplemean = random.gauss(mean, std)
+            if std>0.0 and deviates is not None:
+                samplemean = mean + std * deviates[i]
             else:
                 samplemean = mean
             if vs[0] == 'mass':
@@ -434,6 +971,34 @@ class ModelRunner(object):
         sample[pairs[waterind][1]] = remainingmass
         return sample
 
+    def _draw_components(self, values, deviates=None):
+        """
+        Draws the component masses of n rows at once in the same way as
+        _draw_from_distr, returns a (n, 5) array
+
+        values -- (n, 12) array of mean and standard deviation pairs in the
+                  order of VALUESPEC
+        deviates -- (n, 6) standard normal deviates of the pairs, None for
+                    the maximum likelihood values
+        """
+        mean = values[:, 0::2]
+        std = values[:, 1::2]
+        if deviates is not None:
+            mean = numpy.where(std > 0.0, mean + std * deviates, mean)
+        mass = mean[:, 0]
+        remainingmass = mass
+        sample = numpy.empty((len(values), len(VALUESPEC) - 1))
+        for i, (name, ind) in enumerate(VALUESPEC):
+            if name == 'mass':
+                continue
+            elif name != 'water':
+                sample[:, ind] = mass * mean[:, i]
+                remainingmass = remainingmass - sample[:, ind]
+            else:
+                waterind = ind
+        sample[:, waterind] = remainingmass
+        return sample
+
     def _endstate2initial(self, sizeclass, endstate, timestep):
         """
         Transfers the endstate masses to the initial state description of
@@ -452,23 +1017,19 @@ class ModelRunner(object):
         humus = endstate[4] / mass_sum
 
         # area change scaling
-        if self.md.litter_mode in ('monthly', 'yearly'):
-            for listind in self.area_timemap[timestep]:
-                change = self.md.area_change[listind]
-                mass = mass * (1. + change.rel_change)
+        mass = mass * self.timeline_area[timestep]
         self.initial[sizeclass] = [mass, 0., acid, 0., water, 0., ethanol, 0.,
                                    nonsoluble, 0., humus, 0.]
 
-    def _fill_input(self):
+    def _fill_input(self, timestep):
         """
         Makes sure that both the initial state and litter input have the same
-        size classes
+        size classes. The input timeline has the input of all the size
+        classes, zero where not defined.
+
+        timestep -- the timestep the input is for
         """
-        for sc in self.initial:
-            if sc not in self.litter:
-                self.litter[sc] = [0., 0., 0., 0., 0., 0.,
-                                   0., 0., 0., 0., 0., 0.]
-        for sc in self.litter:
+        for sc in self.timeline_sizeclasses[timestep]:
             if sc not in self.initial:
                 self.initial[sc] = [0., 0., 0., 0., 0., 0.,
                                     0., 0., 0., 0., 0., 0.]
@@ -478,93 +1039,140 @@ class ModelRunner(object):
         Fills the result arrays used for storing the calculated moments
          common format: time, mean, mode, var, skewness, kurtosis,
                         95% confidence lower limit, 95% upper limit
+        The moments of all the timesteps and columns of a result array are
+        computed at once over its (samples, timesteps, columns) block with
+        stats.describe.
         """
-        toprocess = [('stock_tom', self.c_stock, 2),
-                     ('stock_woody', self.c_stock, 3),
-                     ('stock_non_woody', self.c_stock, 4),
-                     ('stock_acid', self.c_stock, 5),
-                     ('stock_water', self.c_stock, 6),
-                     ('stock_ethanol',  self.c_stock, 7),
-                     ('stock_non_soluble', self.c_stock, 8),
-                     ('stock_humus', self.c_stock, 9),
-                     ('change_tom', self.c_change, 2),
-                     ('change_woody', self.c_change, 3),
-                     ('change_non_woody', self.c_change, 4),
-                     ('change_acid', self.c_change, 5),
-                     ('change_water', self.c_change, 6),
-                     ('change_ethanol', self.c_change, 7),
-                     ('change_non_soluble', self.c_change, 8),
-                     ('change_humus', self.c_change, 9),
-                     ('co2', self.co2_yield, 2)]
-        for (resto, dataarr, dataind) in toprocess:
-            # filter time steps
-            ts = numpy.unique(dataarr[:,1])
-            # extract data for the timestep
-            for timestep in ts:
-                ind = numpy.where(dataarr[:,1]==timestep)
-                mean = stats.mean(dataarr[ind[0], dataind])
-                mode_res = stats.mode(dataarr[ind[0], dataind])
-                mode = mode_res[0]
-                var = stats.var(dataarr[ind[0], dataind])
-                skew = stats.skew(dataarr[ind[0], dataind])
-                kurtosis = stats.kurtosis(dataarr[ind[0], dataind])
-                if var>0.0:
-                    sd2 = 2 * math.sqrt(var)
-                else:
-                    sd2 = var
-                res = [[timestep, mean, mode[0], var, skew, kurtosis,
-                       mean - sd2, mean + sd2]]
-                if resto=='stock_tom':
-                    self.md.stock_tom = numpy.append(self.md.stock_tom,
-                                                     res, axis=0)
-                elif resto=='stock_woody':
-                    self.md.stock_woody = numpy.append(self.md.stock_woody,
-                                                       res, axis=0)
-                elif resto=='stock_non_woody':
-                    self.md.stock_non_woody = numpy.append(\
-                            self.md.stock_non_woody, res, axis=0)
-                elif resto=='stock_acid':
-                    self.md.stock_acid = numpy.append(self.md.stock_acid,
-                                                      res, axis=0)
-                elif resto=='stock_water':
-                    self.md.stock_water = numpy.append(self.md.stock_water,
-                                                       res, axis=0)
-                elif resto=='stock_ethanol':
-                    self.md.stock_ethanol = numpy.append(self.md.stock_ethanol,
-                                                         res, axis=0)
-                elif resto=='stock_non_soluble':
-                    self.md.stock_non_soluble= numpy.append(
-                                        self.md.stock_non_soluble, res, axis=0)
-                elif resto=='stock_humus':
-                    self.md.stock_humus = numpy.append(self.md.stock_humus,
-                                                       res, axis=0)
-                elif resto=='change_tom':
-                    self.md.change_tom = numpy.append(self.md.change_tom,
-                                                      res, axis=0)
-                elif resto=='change_woody':
-                    self.md.change_woody = numpy.append(self.md.change_woody,
-                                                        res, axis=0)
-                elif resto=='change_non_woody':
-                    self.md.change_non_woody = numpy.append(\
-                            self.md.change_non_woody, res, axis=0)
-                elif resto=='change_acid':
-                    self.md.change_acid = numpy.append(self.md.change_acid,
-                                                       res, axis=0)
-                elif resto=='change_water':
-                    self.md.change_water = numpy.append(self.md.change_water,
-                                                        res, axis=0)
-                elif resto=='change_ethanol':
-                    self.md.change_ethanol = numpy.append(
-                                            self.md.change_ethanol, res, axis=0)
-                elif resto=='change_non_soluble':
-                    self.md.change_non_soluble=numpy.append(
-                                        self.md.change_non_soluble, res, axis=0)
-                elif resto=='change_humus':
-                    self.md.change_humus = numpy.append(self.md.change_humus,
-                                                        res, axis=0)
-                elif resto=='co2':
-                    self.md.co2 = numpy.append(self.md.co2, res, axis=0)
+        arrays = self._done_results()
+        for name, columns, initial in modeldata.ResultStore.ARRAYS:
+            dataarr = arrays[name]
+            comps = [(resto, dataind) for resto, arrname, dataind
+                     in MOMENT_RESULTS if arrname==name]
+            if dataarr.size == 0:
+                for resto, dataind in comps:
+                    setattr(self.md, resto, numpy.empty(shape=(0, 8)))
+                continue
+            # samples on the first axis, the result columns from 2 on
+            data = dataarr[:,:,2:]
+            n, minmax, mean, var, skew, kurtosis = stats.describe(data)
+            mode = stats.mode(data)[0][0]
+            sd2 = numpy.where(var>0.0, 2 * numpy.sqrt(numpy.abs(var)), var)
+            for resto, dataind in comps:
+                col = dataind - 2
+                res = numpy.empty(shape=(data.shape[1], 8))
+                res[:,0] = dataarr[0,:,1]
+                res[:,1] = mean[:,col]
+                res[:,2] = mode[:,col]
+                res[:,3] = var[:,col]
+                res[:,4] = skew[:,col]
+                res[:,5] = kurtosis[:,col]
+                res[:,6] = mean[:,col] - sd2[:,col]
+                res[:,7] = mean[:,col] + sd2[:,col]
+                setattr(self.md, resto, res)
+
+    def online_moments(self, quantiles=False):
+        """
+        Returns the moment results of the samples done in an online or a
+        streamed run as a dict by model data attribute (stock_tom, co2
+        etc.), in the format of _fill_moment_results, computed from the
+        statistics accumulated. Can be called during the run, e.g. to plot
+        the moments as the samples finish.
+
+        quantiles -- the confidence limits are the 2.5 and 97.5 percentiles
+                     of the quantile sketch instead of the mean -+ 2 std
+        """
+        results = {}
+        for name, columns, initial in modeldata.ResultStore.ARRAYS:
+            statistics = self.statistics[name]
+            acc = statistics.moments
+            steps = min(self.timesteps_done + int(initial), len(acc.mean))
+            if statistics.count == 0:
+                steps = 0
+            mean = acc.mean[:steps]
+            var = acc.variance()[:steps]
+            sd2 = numpy.where(var>0.0, 2 * numpy.sqrt(numpy.abs(var)), var)
+            skew = acc.skewness()[:steps]
+            kurtosis = acc.kurtosis()[:steps]
+            mode = statistics.sketch.mode()[:steps]
+            if quantiles:
+                lower = statistics.sketch.percentile(2.5)[:steps]
+                upper = statistics.sketch.percentile(97.5)[:steps]
+            else:
+                lower = mean - sd2
+                upper = mean + sd2
+            for resto, arrname, dataind in MOMENT_RESULTS:
+                if arrname != name:
+                    continue
+                res = numpy.empty(shape=(steps, 8))
+                res[:,0] = numpy.arange(steps) + 1 - int(initial)
+                res[:,1] = mean[:,dataind]
+                res[:,2] = mode[:,dataind]
+                res[:,3] = var[:,dataind]
+                res[:,4] = skew[:,dataind]
+                res[:,5] = kurtosis[:,dataind]
+                res[:,6] = lower[:,dataind]
+                res[:,7] = upper[:,dataind]
+                results[resto] = res
+        return results
+
+    def _fill_stored_moment_results(self, quantiles=False):
+        """
+        Fills the moment results of a streamed run as _fill_moment_results,
+        the mean, var, skewness and kurtosis from the statistics
+        accumulated. The modes, and the percentiles if asked, need all the
+        samples of a timestep, so the stored results are read a few
+        timesteps at a time.
+
+        quantiles -- the confidence limits are the 2.5 and 97.5 percentiles
+                     of the samples instead of the mean -+ 2 std
+        """
+        n = self.samples_done
+        arrays = self._done_results()
+        results = self.online_moments()
+        for name, columns, initial in modeldata.ResultStore.ARRAYS:
+            data = arrays[name]
+            comps = [(results[resto], dataind) for resto, arrname, dataind
+                     in MOMENT_RESULTS if arrname==name]
+            if data.size == 0:
+                continue
+            chunk = max(1, MOMENT_BLOCK // (n * columns))
+            for start in range(0, data.shape[1], chunk):
+                block = numpy.array(data[:, start:start+chunk])
+                for res, dataind in comps:
+                    values = block[:,:,dataind]
+                    res[start:start+chunk,2] = stats.mode(values)[0][0]
+                    if quantiles:
+                        res[start:start+chunk,6:] = numpy.percentile(
+                            values, [2.5, 97.5], axis=0).T
+        for resto, res in results.items():
+            setattr(self.md, resto, res)
 
+    def _done_results(self):
+        """
+        Returns the computed samples and timesteps of the result arrays,
+        indexed by sample, timestep and column, as a dict by name
+        """
+        n = self.samples_done
+        t = self.timesteps_done
+        return {'stock': self.stock_data[:n, :t+1],
+                'change': self.change_data[:n, :t],
+                'co2': self.co2_data[:n, :t]}
+
+    def _flatten_results(self):
+        """
+        Exposes the computed samples and timesteps of the result arrays in
+        the layout of one row per sample and timestep:
+         c_stock & c_change: sample, timestep, tom, woody, non-woody, acid,
+                             water, ethanol, non soluble, humus
+         co2_yield: sample, timestep, CO2 production
+        The rows are views on the result arrays unless the simulation was
+        cut short in time.
+        """
+        n = self.samples_done
+        t = self.timesteps_done
+        self.c_stock = self.stock_data[:n, :t+1].reshape(-1, 10)
+        self.c_change = self.change_data[:n, :t].reshape(-1, 10)
+        self.co2_yield = self.co2_data[:n, :t].reshape(-1, 3)
 
     def _get_now_and_end(self, timestep):
         """
@@ -589,76 +1197,27 @@ class ModelRunner(object):
             end = -1
         return now, end
 
-    def _map_timestep2timeind(self, timestep):
+    def _init_results(self, samples, timesteps, first=0):
         """
-        Convert the timestep index to the nearest time defined in the litter
-        timeseries array
+        Allocates the result arrays indexed by sample, timestep and column,
+        columns as in _flatten_results. The stock has the initial state at
+        timestep 0, change and CO2 start from timestep 1.
 
-        timestep -- ordinal number of the simulation run timestep
+        samples -- number of samples
+        timesteps -- number of simulation timesteps
+        first -- ordinal of the first sample
         """
-        if not self.simulation and timestep not in self.timemap:
-            # for steady state computation include year 0 or first 12 months
-            if self.md.litter_mode=='monthly':
-                incl = range(1, 13)
-                infall = self.md.monthly_litter
-            elif self.md.litter_mode=='yearly':
-                incl = [0]
-                infall = self.md.yearly_litter
-            elif self.md.litter_mode=='zero':
-                infall = []
-            for ind in range(len(infall)):
-                if infall[ind].timestep in incl:
-                    self.timemap[timestep].append(ind)
-            if timestep not in self.timemap and self.md.litter_mode=='yearly':
-                # if no year 0 specification, use the one for year 1
-                for ind in range(len(infall)):
-                    if infall[ind].timestep==1:
-                        self.timemap[timestep].append(ind)
-        if self.simulation and timestep not in self.timemap:
-            # now for the simulation run
-            now, end = self._get_now_and_end(timestep)
-            if self.md.duration_unit=='month':
-                dur = relativedelta(months=self.timestep_length)
-            elif self.md.duration_unit=='year':
-                dur = relativedelta(years=self.timestep_length)
-            end = now + dur - relativedelta(days=1)
-            if self.md.litter_mode=='monthly':
-                inputdur = relativedelta(months=1)
-                infall = self.md.monthly_litter
-            elif self.md.litter_mode=='yearly':
-                inputdur = relativedelta(years=1)
-                infall = self.md.yearly_litter
-            elif self.md.litter_mode=='zero':
-                inputdur = relativedelta(years=1)
-                infall = self.md.zero_litter
-            # the first mont/year will have index number 1, hence deduce 1 m/y
-            start = STARTDATE - inputdur
-            for ind in range(len(infall)):
-                incl = self._test4inclusion(ind, infall, now, start, end)
-                if incl:
-                    self.timemap[timestep].append(ind)
-            # check for possible area reductions to be mapped
-            areachange = self.md.area_change
-            for ind in range(len(areachange)):
-                incl = self._test4inclusion(ind, areachange, now, start, end)
-                if incl:
-                    self.area_timemap[timestep].append(ind)
-        if timestep not in self.timemap:
-            self.timemap[timestep] = []
-        if timestep not in self.area_timemap:
-            self.area_timemap[timestep] = []
-        return self.timemap[timestep]
-
-    def _test4inclusion(self, ind, dataarray, now, start, end):
-        relamount = int(dataarray[ind].timestep)
-        if self.md.litter_mode=='monthly':
-            inputdate = start + relativedelta(months=relamount)
-        else:
-            inputdate = start + relativedelta(years=relamount)
-        if inputdate>=now and inputdate<=end:
-            return True
-        else:
-            return False
+        self.stock_data = numpy.zeros((samples, timesteps + 1, 10))
+        self.change_data = numpy.zeros((samples, timesteps, 10))
+        self.co2_data = numpy.zeros((samples, timesteps, 3))
+        steps = numpy.arange(timesteps + 1)
+        for res, start in ((self.stock_data, 0), (self.change_data, 1),
+                           (self.co2_data, 1)):
+            res[:,:,0] = numpy.arange(first, first + samples)[:,None]
+            res[:,:,1] = steps[start:start + res.shape[1]]
+        self.first_sample = first
+        self.samples_done = 0
+        self.timesteps_done = timesteps
 
     def _predict(self, sc, initial, litter, climate, steady_state=False):
         """
@@ -671,25 +1230,81 @@ class ModelRunner(object):
         climate -- climate conditions for the timestep
         draw -- should the values be drawn from the distribution or not
         """
+        par, dur, cl, init, inf, sc, leach = self._model_input(sc, initial,
+                                                               litter, climate)
+        if self._param_file_shape == 35:
+            # The Yasso15 -model call.
+            endstate = self.kernel.mod5c(par, dur, cl, init, inf, sc, leach,
+                    steady_state, self._solver_code, self._expm_code)
+        else:
+            raise Exception("Invalid number of parameters in parameter file.")
+            # This would be how the old model used this.
+            #if cl[1] == 0.0:
+            #    cl[1] = 0.1 # The Fortran routine fails if precipitation is 0.
+            #endstate = y07.yasso.mod5c(par, dur, cl, init, inf, sc, leach)
+        return init, endstate.copy()
+
+    def _predict_batch(self, rows, keys=None, steady_state=False):
+        """
+        Runs the model once for a set of model inputs
+
+        rows -- list of (par, dur, cl, init, inf, sc, leach) tuples as
+                prepared by _model_input
+        keys -- propagator cache keys for the rows, see _propagator_key
+        """
+        if self._param_file_shape != 35:
+            raise Exception("Invalid number of parameters in parameter file.")
+        na = numpy.array
+        f32 = numpy.float32
+        par = na([r[0] for r in rows], dtype=f32, order='F')
+        dur = na([r[1] for r in rows], dtype=f32)
+        cl = na([r[2] for r in rows], dtype=f32, order='F')
+        init = na([r[3] for r in rows], dtype=f32, order='F')
+        inf = na([r[4] for r in rows], dtype=f32, order='F')
+        sc = na([r[5] for r in rows], dtype=f32)
+        leach = na([r[6] for r in rows], dtype=f32)
+        if keys is not None and self._cache_timesteps \
+                and not steady_state:
+            return self.propagators.predict(keys, par, dur, cl, init, inf,
+                                            sc, leach)
+        return self.kernel.mod5c_batch(par, dur, cl, init, inf, sc, leach,
+                                       steady_state, self._solver_code,
+                                       self._expm_code, self._kernel_threads)
+
+    def _model_input(self, sc, initial, litter, climate):
+        """
+        Draws the model parameters, initial state and input for a single
+        model call and converts them into the form the model expects
+
+        sc -- non-woody / size of the woody material modelled
+        initial -- system state at the beginning of the timestep
+        litter -- litter input for the timestep
+        climate -- climate conditions for the timestep
+        """
         # model parameters
         if self.ml_run:
             # maximum likelihood estimates for the model parameters
+            self.param_index = 0
             self.param = self.param_set[0]
         elif self.draw:
-            which = random.randint(1, PARAM_SAMPLES - 1)
+            which = self.draws['param_index']
+            self.param_index = which
             self.param = self.param_set[which]
         # and mean values for the initial state and input
         if self.ml_run:
-            initial = self._draw_from_distr(initial, VALUESPEC, False)
-            self.infall[sc] = self._draw_from_distr(litter, VALUESPEC, False)
-        elif self.draw:
-            initial = self._draw_from_distr(initial, VALUESPEC, True)
-            self.infall[sc] = self._draw_from_distr(litter, VALUESPEC, True)
+            initial = self._draw_from_distr(initial, VALUESPEC)
+            self.infall[sc] = self._draw_from_distr(litter, VALUESPEC)
         else:
-            # initial values drawn randomly only for the "draw" run
-            # i.e. for the first run after maximum likelihood run
-            initial = self._draw_from_distr(initial, VALUESPEC, False)
-            self.infall[sc] = self._draw_from_distr(litter, VALUESPEC, True)
+            ind = self.sc_index[sc]
+            infall = self.draws['infall'][self.curr_timestep, ind].tolist()
+            if self.draw:
+                initial = self._draw_from_distr(initial, VALUESPEC,
+                                    self.draws['initial'][ind].tolist())
+            else:
+                # initial values drawn randomly only for the "draw" run
+                # i.e. for the first run after maximum likelihood run
+                initial = self._draw_from_distr(initial, VALUESPEC)
+            self.infall[sc] = self._draw_from_distr(litter, VALUESPEC, infall)
         # climate
         na = numpy.array
         f32 = numpy.float32
@@ -707,30 +1322,19 @@ class ModelRunner(object):
         # If we're using steady state as original state,
         # the leach parameters are not allowed to be set.
         leach = self.md.leach_parameter
-        if self._param_file_shape == 35:
-            # The Yasso15 -model call.
-            endstate = y15.yasso.mod5c(par, dur, cl, init, inf, sc, leach, 
-                    steady_state)
-        else:
-            raise Exception("Invalid number of parameters in parameter file.")
-            # This would be how the old model used this.
-            #if cl[1] == 0.0:
-            #    cl[1] = 0.1 # The Fortran routine fails if precipitation is 0.
-            #endstate = y07.yasso.mod5c(par, dur, cl, init, inf, sc, leach)
-        
         self.ts_initial += sum(initial)
         self.ts_infall += sum(self.infall[sc])
-        return init, endstate.copy()
+        return par, dur, cl, init, inf, sc, leach
 
     def _predict_timestep(self, sample, timestep):
         """
         Loops over all the size classes for the given sample and timestep
         """
-        climate = self._construct_climate(timestep)
+        climate = self._timestep_climate(timestep)
         if climate==-1:
-            timemsg = "Simulation extends too far into the future."\
-                      " Couldn't allocate inputs to all timesteps"
+            self.timesteps_done = min(self.timesteps_done, timestep)
             return
+        self.curr_timestep = timestep
         self.ts_initial = 0.0
         self.ts_infall = 0.0
         self.__create_input(timestep)
@@ -746,11 +1350,181 @@ class ModelRunner(object):
         self._calculate_c_change(sample, timestep+1)
         self._calculate_co2_yield(sample, timestep+1)
 
+    def _predict_sample_block(self, samples, timesteps, ml_run=True):
+        """
+        Runs a block of samples through all the timesteps calling the model
+        once per timestep for all the samples and size classes in the block.
+        The sample specific state is swapped in and out of the runner
+        around the per sample bookkeeping. Returns False if cancelled.
+
+        samples -- the sample ordinals in the block
+        timesteps -- number of timesteps to simulate
+        ml_run -- sample 0 is the maximum likelihood run
+        """
+        states = [{'ml_run': ml_run and j == 0, 'draw': True, 'initial': {},
+                   'param': None, 'param_index': None, 'ts_initial': 0.0,
+                   'ts_infall': 0.0,
+                   'draws': None if ml_run and j == 0 else
+                       self._draw_sample(self.first_sample + j, timesteps)}
+                  for j in samples]
+        for k in range(timesteps):
+            done = samples[0] + len(samples) * k // timesteps
+            if not self._report_progress(done):
+                return False
+            climate = self._timestep_climate(k)
+            if climate==-1:
+                self.timesteps_done = min(self.timesteps_done, k)
+                return True
+            self.curr_timestep = k
+            rows = []
+            keys = []
+            calls = []
+            for j, state in zip(samples, states):
+                self._set_sample_state(state)
+                self.ts_initial = 0.0
+                self.ts_infall = 0.0
+                self.__create_input(k)
+                for sizeclass in self.initial:
+                    row = self._model_input(sizeclass,
+                                            self.initial[sizeclass],
+                                            self.litter[sizeclass], climate)
+                    rows.append(row)
+                    if self._cache_timesteps:
+                        keys.append(self._propagator_key(row))
+                    calls.append((j, state, sizeclass))
+                    self.draw = False
+                self._get_sample_state(state)
+            if not rows:
+                continue
+            endstates = self._predict_batch(rows, keys or None)
+            for i, (j, state, sizeclass) in enumerate(calls):
+                self._set_sample_state(state)
+                if k==0:
+                    self._add_c_stock_result(j, k, sizeclass, rows[i][3])
+                self._add_c_stock_result(j, k+1, sizeclass, endstates[i])
+                self._endstate2initial(sizeclass, endstates[i], k)
+            for j, state in zip(samples, states):
+                self._set_sample_state(state)
+                self._calculate_c_change(j, k+1)
+                self._calculate_co2_yield(j, k+1)
+        self.ml_run = False
+        return True
+
+    def _predict_trajectory(self, sample, timesteps):
+        """
+        Runs a sample through all the timesteps with a single
+        mod5c_trajectory call per size class. The area changes are applied
+        by the model between the timesteps and the C change and CO2 results
+        are computed from the trajectories.
+
+        sample -- sample ordinal
+        timesteps -- number of timesteps to simulate
+        """
+        steps = min(timesteps, len(self.timeline_duration))
+        self.timesteps_done = min(self.timesteps_done, steps)
+        if steps == 0:
+            return
+        self.curr_timestep = 0
+        self.__create_input(0)
+        # the size classes in the order the timesteps would add them
+        for k in range(1, steps):
+            self._fill_input(k)
+        if self.ml_run:
+            self.param_index = 0
+        else:
+            self.param_index = self.draws['param_index']
+        self.param = self.param_set[self.param_index]
+        f32 = numpy.float32
+        par = numpy.array(self.param, dtype=f32)
+        dur = numpy.array(self.timeline_duration[:steps], dtype=f32)
+        cl = numpy.array(self.timeline_climate[:steps], dtype=f32, order='F')
+        area = numpy.array(self.timeline_area[:steps], dtype=f32)
+        ts_initial = numpy.zeros(steps)
+        ts_infall = numpy.zeros(steps)
+        stock = self.stock_data[sample]
+        for i, sc in enumerate(self.initial):
+            ind = self.sc_index[sc]
+            litter = self.timeline_input[:steps, ind]
+            if self.ml_run:
+                initial = self._draw_from_distr(self.initial[sc], VALUESPEC)
+                infall = self._draw_components(litter)
+            else:
+                # the initial state drawn only for the first size class as
+                # in the "draw" run of _model_input
+                deviates = self.draws['initial'][ind].tolist() if i == 0 \
+                           else None
+                initial = self._draw_from_distr(self.initial[sc],
+                                                VALUESPEC, deviates)
+                infall = self._draw_components(
+                             litter, self.draws['infall'][:steps, ind])
+            # convert input to yearly input in all cases
+            inf = infall.astype(f32)
+            if self.md.litter_mode!='constant yearly':
+                inf = inf / dur[:,None]
+            xt = self.kernel.mod5c_trajectory(
+                     par, dur, cl, numpy.array(initial, dtype=f32),
+                     numpy.asfortranarray(inf), sc, self.md.leach_parameter,
+                     area, self._solver_code, self._expm_code)
+            ts_initial[0] += sum(initial)
+            ts_initial[1:] += xt[1:steps].sum(axis=1) * area[:steps-1]
+            ts_infall += infall.sum(axis=1)
+            totalom = xt.sum(axis=1)
+            stock[:steps+1, 2] += totalom
+            if sc>=self.md.woody_size_limit:
+                stock[:steps+1, 3] += totalom
+            else:
+                stock[:steps+1, 4] += totalom
+            stock[:steps+1, 5:] += xt
+        self.change_data[sample, :steps, 2:] = stock[1:steps+1, 2:] \
+                                               - stock[:steps, 2:]
+        self.co2_data[sample, :steps, 2] = ts_initial + ts_infall \
+                                           - stock[1:steps+1, 2]
+
+    def _get_sample_state(self, state):
+        """
+        Stores the sample specific attributes into the state dictionary
+        """
+        for attr in state:
+            state[attr] = getattr(self, attr)
+
+    def _propagator_key(self, row):
+        """
+        The propagator of a model call depends on the parameter set row,
+        climate, size class, duration and leaching
+
+        row -- (par, dur, cl, init, inf, sc, leach) as prepared by
+               _model_input
+        """
+        par, dur, cl, init, inf, sc, leach = row
+        return (self.param_index, tuple(cl), sc, dur, leach)
+
+    def _set_sample_state(self, state):
+        """
+        Restores the sample specific attributes from the state dictionary
+        """
+        for attr in state:
+            setattr(self, attr, state[attr])
+
+    def _use_batch(self):
+        """
+        Returns True if the samples should be computed in blocks with the
+        batched model entry point
+        """
+        return self.batch_size > 1 and hasattr(self.kernel, 'mod5c_batch')
+
+    def _use_trajectory(self):
+        """
+        Returns True if the samples should be run through the timesteps
+        with the whole trajectory model entry point
+        """
+        return self.trajectory and hasattr(self.kernel, 'mod5c_trajectory')
+
     def _predict_steady_state(self, sample):
         """
         Makes a single prediction for the steady state for each sizeclass
         """
         climate = self._construct_climate(0)
+        self.curr_timestep = 0
         self.ts_initial = 0.0
         self.ts_infall = 0.0
         self.__create_input(0)
@@ -762,47 +1536,140 @@ class ModelRunner(object):
             self._add_steady_state_result(sizeclass, endstate)
             self.draw = False
 
+    def _predict_steady_state_batch(self, samplesize):
+        """
+        Solves the steady states of all the samples and size classes with
+        a single batched model call. The climate and the input definition
+        are the same for all the samples.
+
+        samplesize -- number of samples
+        """
+        climate = self._construct_climate(0)
+        self.curr_timestep = 0
+        self.ts_initial = 0.0
+        self.ts_infall = 0.0
+        rows = []
+        for j in range(samplesize):
+            self.draw = True
+            self.draws = None if self.ml_run else self._draw_sample(j, 1)
+            for sizeclass in self.initial:
+                rows.append(self._model_input(sizeclass,
+                                              self.initial[sizeclass],
+                                              self.litter[sizeclass],
+                                              climate))
+                self.draw = False
+            self.ml_run = False
+        if not rows:
+            return
+        n = len(rows)
+        self.steady_state[:n, 0] = [row[5] for row in rows]
+        self.steady_state[:n, 1:] = self._predict_batch(rows,
+                                                        steady_state=True)
+        self.ss_rows = n
+
     def _steadystate2initial(self):
         """
         Transfers the endstate masses to the initial state description of
         masses and percentages with standard deviations. Std set to zero.
         """
-        self.ss_result = []
-        ss = self.steady_state
-        sizeclasses = numpy.unique(ss[:,0])
-        for sc in sizeclasses:
-            criterium = (ss[:,0]==sc)
-            target = numpy.where(criterium)[0]
-            div = len(target)
-            masses = [ss[t, 1:].sum() for t in target]
-            mass_sum = sum(masses)
-            m = mass_sum / div
-            m_std = self._std(masses)
-            acids = ss[target, 1] / masses
-            a = acids.sum() / div
-            a_std = self._std(acids)
-            waters = ss[target, 2] / masses
-            w = waters.sum() / div
-            w_std = self._std(waters)
-            ethanols = ss[target, 3] / masses
-            e = ethanols.sum() / div
-            e_std = self._std(ethanols)
-            nonsolubles = ss[target, 4] / masses
-            n = nonsolubles.sum() / div
-            n_std = self._std(nonsolubles)
-            humuses = ss[target, 5] / masses
-            h = humuses.sum() / div
-            h_std = self._std(humuses)
-            self.ss_result.append([m, m_std, a, a_std, w, w_std,
-                                   e, e_std, n, n_std, h, h_std, sc])
-
-    def _std(self, data):
-        """
-        Computes the standard deviation
-        """
-        var = stats.var(data)
-        if var>0.0:
-            sd = math.sqrt(var)
-        else:
-            sd = 0.0
-        return sd
+        ss = self.steady_state[:self.ss_rows]
+        sizeclasses, groups = numpy.unique(ss[:,0], return_inverse=True)
+        counts = numpy.bincount(groups, minlength=len(sizeclasses))[:,None]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            masses = ss[:,1:].sum(axis=1)
+            # mass and the fractions of the AWENH compartments per row
+            values = numpy.column_stack((masses, ss[:,1:] / masses[:,None]))
+            means = numpy.zeros((len(sizeclasses), 6))
+            numpy.add.at(means, groups, values)
+            means /= counts
+            sqdevs = numpy.zeros((len(sizeclasses), 6))
+            numpy.add.at(sqdevs, groups, (values - means[groups])**2)
+            var = sqdevs / (counts - 1)
+            std = numpy.where(var > 0.0, numpy.sqrt(numpy.abs(var)), 0.0)
+        # rows of mean, std pairs followed by the size class
+        result = numpy.empty((len(sizeclasses), 13))
+        result[:,0:12:2] = means
+        result[:,1:12:2] = std
+        result[:,12] = sizeclasses
+        self.ss_result = result.tolist()
+
+
+def load_parameter_set(parfile):
+    """
+    Returns the parameter sets of a parameter file as a read-only float32
+    array, one set per row, or None if the rows have different lengths.
+    The parsed parameters are cached in a binary file beside the parameter
+    file, which is memory mapped so that the processes running the model
+    share its pages. The cache gets the modification time of the parameter
+    file and is rewritten when the parameter file is changed.
+
+    parfile -- the model parameter file
+    """
+    cachefile = os.path.splitext(parfile)[0] + PARAM_CACHE_EXT
+    mtime = os.path.getmtime(parfile)
+    if os.path.exists(cachefile) and \
+            abs(os.path.getmtime(cachefile) - mtime) < 1e-3:
+        try:
+            return numpy.load(cachefile, mmap_mode='r')
+        except (IOError, ValueError):
+            pass
+    params = _read_parameter_file(parfile)
+    if params is None:
+        return None
+    tmpfile = '%s.%d.tmp' % (cachefile, os.getpid())
+    try:
+        with open(tmpfile, 'wb') as f:
+            numpy.save(f, params)
+        os.utime(tmpfile, (mtime, mtime))
+        try:
+            os.rename(tmpfile, cachefile)
+        except OSError:
+            # Windows does not replace an existing file
+            os.remove(cachefile)
+            os.rename(tmpfile, cachefile)
+        return numpy.load(cachefile, mmap_mode='r')
+    except (IOError, OSError):
+        # e.g. no write access to the parameter directory
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        return params
+
+def _read_parameter_file(parfile):
+    """
+    Parses the whitespace delimited parameter file, empty lines are
+    skipped
+    """
+    rows = []
+    with open(parfile) as f:
+        for line in f:
+            line_split = line.split()
+            if line_split:
+                rows.append([float(v) for v in line_split])
+    if not rows or len(set(len(row) for row in rows)) > 1:
+        return None
+    return numpy.array(rows, dtype=numpy.float32)
+
+
+def _run_shard(task):
+    """
+    Runs a shard of the samples in a worker process or thread, see
+    ModelRunner._run_shards. Returns the result arrays of the shard, or
+    the statistics of a streamed run, and the numbers of samples and
+    timesteps done.
+    """
+    runner_args, md, first, samplesize, entropy, path, steps = task
+    runner = ModelRunner(**runner_args)
+    runner._start_run(md)
+    runner._init_draws(entropy)
+    if steps is not None:
+        store = None if path is None else modeldata.ResultStore(path)
+        runner._stream_samples(store, first, samplesize,
+                               md.simulation_length, steps)
+        if store is not None:
+            store.flush()
+        results = runner.statistics
+    else:
+        runner._init_results(samplesize, md.simulation_length, first)
+        runner._run_samples(samplesize, md.simulation_length, first==0)
+        results = (runner.stock_data, runner.change_data, runner.co2_data)
+    return results, runner.samples_done, runner.timesteps_done
@@ -0,0 +1,519 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Yasso15 input data and run settings without the user interface
+
+ModelData holds the same data and settings as the Yasso user interface
+class in yasso.py, so that ModelRunner can be run without traits, pyface
+or a GUI toolkit. The data sections are kept in NumPy record arrays with
+a field per value of the section rows, which both the model and the
+tables of the user interface use directly. The module also reads the
+sectioned data file format and writes the result files in the format of
+the user interface. The data files are read with datafile.
+"""
+
+import io
+import json
+import os
+
+import numpy
+from numpy.lib.format import open_memmap
+
+from datafile import read_sections
+
+# the choices of the run settings, the first one is the default
+INITIAL_MODES = ('non zero', 'zero', 'steady state')
+LITTER_MODES = ('zero', 'yearly', 'constant yearly', 'monthly')
+CLIMATE_MODES = ('yearly', 'constant yearly', 'monthly')
+DURATION_UNITS = ('year', 'month')
+RESULT_TYPES = ('C stock', 'C change', 'CO2 production')
+# the run settings used by ModelRunner
+SETTINGS = ('data_file', 'leaching', 'initial_mode', 'litter_mode',
+            'climate_mode', 'woody_size_limit', 'sample_size',
+            'duration_unit', 'timestep_length', 'simulation_length')
+# the columns of the result files
+RESULT_COLUMNS = {
+    'C stock': 'sample, time step, total om, woody om, non-woody om,'
+               ' acid, water, ethanol, non-soluble, humus',
+    'C change': 'sample, time step, total om, woody om, non-woody om,'
+                ' acid, water, ethanol, non soluble, humus',
+    'CO2 production': 'sample, time step, CO2 production (in carbon)'}
+MOMENT_COLUMNS = 'component, time step, mean, mode, var, skewness, '\
+                 'kurtosis, 95% confidence lower limit, 95% upper limit'
+# the result arrays and the moment tables of the model data by result type
+RESULT_ARRAYS = {'C stock': 'c_stock', 'C change': 'c_change',
+                 'CO2 production': 'co2_yield'}
+MOMENT_ARRAYS = {
+    'C stock': ('stock_tom', 'stock_woody', 'stock_non_woody', 'stock_acid',
+                'stock_water', 'stock_ethanol', 'stock_non_soluble',
+                'stock_humus'),
+    'C change': ('change_tom', 'change_woody', 'change_non_woody',
+                 'change_acid', 'change_water', 'change_ethanol',
+                 'change_non_soluble', 'change_humus'),
+    'CO2 production': ('co2',)}
+# the file of the settings and the columns in a binary result directory
+METADATA_FILE = 'metadata.json'
+
+LITTER_ERRMSG = 'Soil carbon components should contain: \n'\
+                ' mass, mass std, acid, acid std, water, water std,\n'\
+                ' ethanol, ethanol std, non soluble, non soluble std,'\
+                '\n humus, humus std, size class'
+TIMED_LITTER_ERRMSG = 'timed soil carbon components should contain: \n'\
+                      ' timestep, mass, mass std, acid, acid std, water, '\
+                      'water std,\n'\
+                      ' ethanol, ethanol std, non soluble, non soluble std,'\
+                      '\n humus, humus std, size class'
+AREA_CHANGE_ERRMSG = 'Area change should contain:\n'\
+                     '  timestep, relative area change'
+CONSTANT_CLIMATE_ERRMSG = 'Constant climate should contain: mean '\
+                          'temperature,\nannual rainfall and temperature '\
+                          'variation amplitude'
+MONTHLY_CLIMATE_ERRMSG = 'Monthly climate data should contain: month,\n'\
+                         'temperature and rainfall'
+YEARLY_CLIMATE_ERRMSG = 'Yearly climate should contain: timestep, mean '\
+                        'temperature,\nannual rainfall and temperature '\
+                        'variation amplitude'
+
+
+class Record(object):
+    """
+    Plain container for one row of a data file section
+    """
+    fields = ()
+    int_fields = ('timestep', 'month')
+
+    def __init__(self, **kwargs):
+        for name in self.fields:
+            value = kwargs.get(name, 0)
+            if name in self.int_fields:
+                value = int(value)
+            else:
+                value = float(value)
+            setattr(self, name, value)
+
+    @classmethod
+    def from_values(cls, vals):
+        return cls(**dict(zip(cls.fields, vals)))
+
+    @classmethod
+    def record_dtype(cls):
+        """The dtype of the record arrays of the section"""
+        return numpy.dtype([(name, int if name in cls.int_fields else float)
+                            for name in cls.fields])
+
+class LitterComponent(Record):
+    fields = ('mass', 'mass_std', 'acid', 'acid_std', 'water', 'water_std',
+              'ethanol', 'ethanol_std', 'non_soluble', 'non_soluble_std',
+              'humus', 'humus_std', 'size_class')
+
+class TimedLitterComponent(Record):
+    fields = ('timestep',) + LitterComponent.fields
+
+class AreaChange(Record):
+    fields = ('timestep', 'rel_change')
+
+class YearlyClimate(Record):
+    fields = ('timestep', 'mean_temperature', 'annual_rainfall',
+              'variation_amplitude')
+
+class ConstantClimate(Record):
+    fields = ('mean_temperature', 'annual_rainfall', 'variation_amplitude')
+
+class MonthlyClimate(Record):
+    fields = ('month', 'temperature', 'rainfall')
+
+# the data sections kept in record arrays and their records
+SECTIONS = (('initial_litter', LitterComponent),
+            ('steady_state', LitterComponent),
+            ('constant_litter', LitterComponent),
+            ('monthly_litter', TimedLitterComponent),
+            ('yearly_litter', TimedLitterComponent),
+            ('zero_litter', LitterComponent),
+            ('area_change', AreaChange),
+            ('yearly_climate', YearlyClimate),
+            ('monthly_climate', MonthlyClimate))
+
+
+class ModelData(object):
+    """
+    The input data and the run settings of a simulation, with the same
+    attribute names as the Yasso user interface. ModelRunner sets the
+    moment results (stock_tom, change_tom, co2 etc.) to it.
+    """
+
+    def __init__(self, **settings):
+        """
+        Constructor.
+
+        settings -- values for the run settings, e.g. sample_size=100,
+                    initial_mode='steady state'
+        """
+        self.data_file = ''
+        self.leaching = 0.0
+        self.initial_mode = INITIAL_MODES[0]
+        self.litter_mode = LITTER_MODES[0]
+        self.climate_mode = CLIMATE_MODES[0]
+        self.woody_size_limit = 3.0
+        self.sample_size = 10
+        self.duration_unit = DURATION_UNITS[0]
+        self.timestep_length = 1
+        self.simulation_length = 10
+        self.reset_data()
+        for name, value in settings.items():
+            if not hasattr(self, name):
+                raise Exception("Unknown setting %s." % name)
+            setattr(self, name, value)
+
+    @property
+    def leach_parameter(self):
+        """Leach parameter is 0 when the initialization mode is by steady
+        state, the leaching setting otherwise"""
+        if self.initial_mode=='steady state':
+            return 0
+        else:
+            return self.leaching
+
+    def reset_data(self):
+        """
+        Empties all input data structures
+        """
+        for name, cls in SECTIONS:
+            setattr(self, name, values_array([], cls))
+        self.constant_climate = ConstantClimate()
+
+    def load(self, filename):
+        """
+        Loads the input data from a data file
+        """
+        # io reads the lines a lot faster than codecs
+        f = io.open(filename, 'r', encoding='utf8')
+        try:
+            sections = read_sections(f)
+        finally:
+            f.close()
+        self.data_file = filename
+        self.set_sections(sections)
+
+    def set_sections(self, sections):
+        """
+        Sets the input data from the sections returned by
+        datafile.read_sections
+        """
+        self.reset_data()
+        for section, rows in sections.items():
+            if section=='Initial state':
+                self.initial_litter = _litter_list(rows)
+            elif section=='Constant soil carbon input':
+                self.constant_litter = _litter_list(rows)
+            elif section=='Monthly soil carbon input':
+                self.monthly_litter = _litter_list(rows, True)
+            elif section=='Yearly soil carbon input':
+                self.yearly_litter = _litter_list(rows, True)
+            elif section=='Relative area change':
+                self.area_change = _record_list(rows, AreaChange,
+                                                AREA_CHANGE_ERRMSG)
+            elif section=='Constant climate':
+                climate = _record_list(rows, ConstantClimate,
+                                       CONSTANT_CLIMATE_ERRMSG, max_rows=1)
+                if len(climate):
+                    self.constant_climate = ConstantClimate.from_values(
+                                                climate[0].tolist())
+            elif section=='Monthly climate':
+                self.monthly_climate = _record_list(rows, MonthlyClimate,
+                                                    MONTHLY_CLIMATE_ERRMSG)
+            elif section=='Yearly climate':
+                self.yearly_climate = _record_list(rows, YearlyClimate,
+                                                   YEARLY_CLIMATE_ERRMSG)
+
+    def set_steady_state(self, data):
+        """
+        Sets the steady state computed by ModelRunner.compute_steady_state
+        """
+        self.steady_state = values_array([vals for vals in data if vals],
+                                         LitterComponent)
+
+
+def snapshot(md):
+    """
+    Returns a ModelData copy of the settings and the input data, e.g. to
+    pass them to other processes
+
+    md -- the Yasso user interface or a ModelData
+    """
+    copy = ModelData(**dict((name, getattr(md, name)) for name in SETTINGS))
+    for name, cls in SECTIONS:
+        setattr(copy, name, numpy.array(record_array(getattr(md, name), cls),
+                                        copy=True).view(numpy.recarray))
+    copy.constant_climate = _copy_record(ConstantClimate, md.constant_climate)
+    return copy
+
+def _copy_record(cls, obj):
+    return cls(**dict((name, getattr(obj, name)) for name in cls.fields))
+
+
+def record_array(data, cls):
+    """
+    Returns the rows of a data section as a numpy.recarray with the fields
+    of cls. A record array of the right dtype is returned as such.
+
+    data -- a record array or a sequence of objects with the fields of cls
+            as attributes, e.g. the rows of an older user interface
+    cls -- the Record class of the section
+    """
+    dtype = cls.record_dtype()
+    if isinstance(data, numpy.ndarray):
+        if data.dtype==dtype:
+            return data.view(numpy.recarray)
+        return data.astype(dtype).view(numpy.recarray)
+    return values_array([[getattr(obj, name) for name in cls.fields]
+                         for obj in data], cls)
+
+def values_array(rows, cls):
+    """
+    Returns the value rows of a data section as a numpy.recarray with the
+    fields of cls, the integer fields truncated as by int()
+
+    rows -- sequence of rows of len(cls.fields) values
+    cls -- the Record class of the section
+    """
+    values = numpy.array(rows, dtype=float).reshape(-1, len(cls.fields))
+    records = numpy.empty(len(values), dtype=cls.record_dtype())
+    for i, name in enumerate(cls.fields):
+        records[name] = values[:,i]
+    return records.view(numpy.recarray)
+
+
+def _litter_list(rows, hastime=False):
+    """
+    Converts the section rows into a record array of litter components, an
+    empty row ends the list as in the user interface
+    """
+    if hastime:
+        cls, errmsg = TimedLitterComponent, TIMED_LITTER_ERRMSG
+    else:
+        cls, errmsg = LitterComponent, LITTER_ERRMSG
+    return values_array(rows.table(len(cls.fields), errmsg,
+                                   stop_at_empty=True), cls)
+
+def _record_list(rows, cls, errmsg, max_rows=None):
+    """
+    Converts the non-empty section rows into a record array
+    """
+    return values_array(rows.table(len(cls.fields), errmsg,
+                                   max_rows=max_rows), cls)
+
+
+def check_settings(md):
+    """
+    Returns an error message if the settings and the data cannot be used
+    for a simulation, None otherwise
+
+    md -- the Yasso user interface or a ModelData
+    """
+    if md.initial_mode=='zero' and md.litter_mode=='zero':
+        return ("Both soil carbon input and initial state may not be "
+                "zero simultaneously.")
+    if md.climate_mode=='yearly' and len(md.yearly_climate)==0:
+        return ("Climate mode may not be 'yearly' if there are no "
+                "yearly climate entries in the data file.")
+    if md.leaching>0:
+        return ("Leaching parameter may not be larger than 0.")
+    if md.climate_mode=='monthly' and len(md.monthly_climate)==0:
+        return ("Climate mode may not be 'monthly' if there are no "
+                "monthly climate entries in the data file.")
+    return None
+
+
+def result_header(md, result_type, header):
+    '''Adds metadata about the results into the header'''
+    hstr = '#########################################################\n'
+    hstr += '# ' + result_type + '\n'
+    hstr += '#########################################################\n'
+    hstr += '# Datafile used: ' + md.data_file + '\n'
+    hstr += '# Settings:\n'
+    hstr += '#   initial state: ' + md.initial_mode + '\n'
+    hstr += '#   soil carbon input: ' + md.litter_mode + '\n'
+    hstr += '#   climate: ' + md.climate_mode + '\n'
+    hstr += '#   sample size: ' + str(md.sample_size) + '\n'
+    hstr += ''.join(['#   timestep length: ', str(md.timestep_length),
+                     ' (', md.duration_unit, ')\n'])
+    hstr += '#   woody litter size limit: ' + str(md.woody_size_limit)+'\n'
+    hstr += '#\n'
+    return hstr + header
+
+def write_results(f, md, result_type, site=None, header=True):
+    """
+    Writes the results of all samples and timesteps
+
+    f -- file opened for writing
+    md -- the Yasso user interface or a ModelData after the run
+    result_type -- one of RESULT_TYPES
+    site -- name of the site added as the first column of the rows, when
+            the results of several sites are written into the same file
+    header -- write the header before the rows
+    """
+    if result_type=='C stock':
+        res = md.c_stock
+    elif result_type=='C change':
+        res = md.c_change
+    elif result_type=='CO2 production':
+        res = md.co2_yield
+    if header:
+        write_header(f, md, result_type, site=site is not None)
+    prefix = '' if site is None else site
+    for row in res:
+        f.write(prefix + ''.join([' ' + str(num) for num in row]) + '\n')
+
+def write_moments(f, md, result_type, site=None, header=True):
+    """
+    Writes the moment results of the timesteps
+
+    f -- file opened for writing
+    md -- the Yasso user interface or a ModelData after the run
+    result_type -- one of RESULT_TYPES
+    site -- name of the site added as the first column of the rows
+    header -- write the header before the rows
+    """
+    if result_type=='C stock':
+        comps = (('tom', md.stock_tom), ('woody', md.stock_woody),
+                 ('non-woody', md.stock_non_woody),
+                 ('acid', md.stock_acid), ('water', md.stock_water),
+                 ('ethanol', md.stock_ethanol),
+                 ('non-soluble', md.stock_non_soluble),
+                 ('humus', md.stock_humus))
+    elif result_type=='C change':
+        comps = (('tom', md.change_tom), ('woody', md.change_woody),
+                 ('non-woody', md.change_non_woody),
+                 ('acid', md.change_acid), ('water', md.change_water),
+                 ('ethanol', md.change_ethanol),
+                 ('non-soluble', md.change_non_soluble),
+                 ('humus', md.change_humus))
+    elif result_type=='CO2 production':
+        comps = (('CO2', md.co2),)
+    if header:
+        write_header(f, md, result_type, True, site is not None)
+    prefix = '' if site is None else site + ' '
+    for comp, res in comps:
+        for row in res:
+            f.write(prefix + comp + ' ' +
+                    ''.join([' ' + str(num) for num in row]) + '\n')
+
+def write_header(f, md, result_type, moments=False, site=False):
+    """
+    Writes the header of a result file
+
+    f -- file opened for writing
+    md -- the Yasso user interface or a ModelData
+    result_type -- one of RESULT_TYPES
+    moments -- header of the moment results
+    site -- the rows begin with the site name
+    """
+    columns = MOMENT_COLUMNS if moments else RESULT_COLUMNS[result_type]
+    if site:
+        columns = 'site, ' + columns
+    f.write(result_header(md, result_type, '# ' + columns) + '\n')
+
+
+def write_arrays(path, md):
+    """
+    Writes the results and the moment tables of all the result types as
+    binary arrays into a directory: a .npy file per array in column major
+    order, so that the columns are contiguous, and the run settings and
+    the column names in METADATA_FILE. See read_arrays.
+
+    path -- the directory, created if it does not exist
+    md -- the Yasso user interface or a ModelData after the run
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    metadata = {'settings': dict((name, getattr(md, name))
+                                 for name in SETTINGS),
+                'columns': {}}
+    moment_columns = MOMENT_COLUMNS.split(', ')[1:]
+    for result_type in RESULT_TYPES:
+        name = RESULT_ARRAYS[result_type]
+        metadata['columns'][name] = RESULT_COLUMNS[result_type].split(', ')
+        for moments in MOMENT_ARRAYS[result_type]:
+            metadata['columns'][moments] = moment_columns
+    for name in metadata['columns']:
+        numpy.save(os.path.join(path, name + '.npy'),
+                   numpy.asfortranarray(getattr(md, name)))
+    f = io.open(os.path.join(path, METADATA_FILE), 'w', encoding='utf8')
+    try:
+        f.write(u'%s\n' % json.dumps(metadata, indent=1, sort_keys=True))
+    finally:
+        f.close()
+
+def read_arrays(path, mmap_mode='r'):
+    """
+    Reads a directory written by write_arrays. Returns a dict of the
+    arrays by name (c_stock, stock_tom etc.) and the metadata dict with the
+    run settings and the column names of the arrays. The arrays are memory
+    mapped, so that nothing is read until used.
+
+    path -- the directory
+    mmap_mode -- passed to numpy.load, None reads the arrays into memory
+    """
+    f = io.open(os.path.join(path, METADATA_FILE), 'r', encoding='utf8')
+    try:
+        metadata = json.load(f)
+    finally:
+        f.close()
+    arrays = dict((name, numpy.load(os.path.join(path, name + '.npy'),
+                                    mmap_mode=mmap_mode))
+                  for name in metadata['columns'])
+    return arrays, metadata
+
+
+class ResultStore(object):
+    """
+    The result arrays of a run in .npy files of a directory, written a
+    block of samples at a time during the run: stock.npy with the shape
+    (samples, timesteps + 1, 10), change.npy (samples, timesteps, 10) and
+    co2.npy (samples, timesteps, 3), columns as in c_stock, c_change and
+    co2_yield. The files are memory mapped, so that only the pages written
+    or read are in memory.
+    """
+    # the arrays, their numbers of columns and whether they have the
+    # initial state at timestep 0
+    ARRAYS = (('stock', 10, True), ('change', 10, False), ('co2', 3, False))
+
+    def __init__(self, path, samples=None, timesteps=None):
+        """
+        Constructor.
+
+        path -- the directory
+        samples -- number of samples, creates the files, by default the
+                   files in the directory are opened for writing
+        timesteps -- number of timesteps of the files created
+        """
+        if samples is not None and not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        for name, columns, initial in self.ARRAYS:
+            filename = os.path.join(path, name + '.npy')
+            if samples is None:
+                array = open_memmap(filename, mode='r+')
+            else:
+                shape = (samples, timesteps + int(initial), columns)
+                array = open_memmap(filename, mode='w+', dtype=float,
+                                    shape=shape)
+            setattr(self, name, array)
+        self.timesteps = self.change.shape[1]
+
+    def write(self, first, blocks):
+        """
+        Writes the results of a block of samples
+
+        first -- ordinal of the first sample of the block
+        blocks -- the result arrays of the block by array name, indexed by
+                  sample, timestep and column
+        """
+        for name, columns, initial in self.ARRAYS:
+            block = blocks[name]
+            getattr(self, name)[first:first + len(block)] = block
+
+    def flush(self):
+        """Writes the changes to the files"""
+        for name, columns, initial in self.ARRAYS:
+            getattr(self, name).flush()
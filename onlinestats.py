@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Statistics of the Monte Carlo samples accumulated as the samples finish
+
+The moments are updated a block of samples at a time without keeping the
+samples, so that the memory used does not depend on the number of samples.
+The central moment sums of a block are computed in two passes over the
+block and combined with the sums of the earlier samples with the pairwise
+formulas of Chan et al. and Pébay, which are numerically stable also for
+long runs. The results equal those of stats.var, stats.skew and
+stats.kurtosis up to rounding. The percentiles and the mode are estimated
+with a quantile sketch of a bounded number of weighted centroids, finer in
+the tails where the confidence limits are. All the accumulators can be merged,
+e.g. those of the shards of the samples run in other processes.
+"""
+
+import numpy
+
+import stats
+
+# number of centroids a quantile sketch is compressed into, the sketch is
+# exact up to twice as many samples
+SKETCH_SIZE = 100
+
+
+class MomentAccumulator(object):
+    """
+    The number of samples and the mean and the second, third and fourth
+    central moment sums of each element of the sample arrays added
+    """
+
+    def __init__(self, shape):
+        """
+        Constructor.
+
+        shape -- shape of a sample, e.g. (timesteps, columns)
+        """
+        self.count = 0
+        self.mean = numpy.zeros(shape)
+        self.m2 = numpy.zeros(shape)
+        self.m3 = numpy.zeros(shape)
+        self.m4 = numpy.zeros(shape)
+
+    def add(self, samples):
+        """
+        Adds a block of samples
+
+        samples -- array of the samples on the first axis
+        """
+        samples = numpy.asarray(samples, dtype=float)
+        count = len(samples)
+        if count==0:
+            return
+        mean = samples.mean(axis=0)
+        dev = samples - mean
+        dev2 = dev * dev
+        self._combine(count, mean, dev2.sum(axis=0), (dev2 * dev).sum(axis=0),
+                      (dev2 * dev2).sum(axis=0))
+
+    def merge(self, other):
+        """
+        Adds the samples of another accumulator of the same shape, e.g. of
+        a shard of the samples run in another process
+        """
+        self._combine(other.count, other.mean, other.m2, other.m3, other.m4)
+
+    def _combine(self, count, mean, m2, m3, m4):
+        """
+        Combines the moment sums of other samples with these
+        """
+        na = float(self.count)
+        nb = float(count)
+        n = na + nb
+        if na==0:
+            self.count = count
+            self.mean = numpy.array(mean, dtype=float)
+            self.m2 = numpy.array(m2, dtype=float)
+            self.m3 = numpy.array(m3, dtype=float)
+            self.m4 = numpy.array(m4, dtype=float)
+            return
+        delta = mean - self.mean
+        dn = delta / n
+        dn2 = dn * dn
+        term = delta * dn * na * nb
+        self.m4 = self.m4 + m4 + term * dn2 * (na*na - na*nb + nb*nb) \
+                  + 6 * dn2 * (na*na*m2 + nb*nb*self.m2) \
+                  + 4 * dn * (na*m3 - nb*self.m3)
+        self.m3 = self.m3 + m3 + term * dn * (na - nb) \
+                  + 3 * dn * (na*m2 - nb*self.m2)
+        self.m2 = self.m2 + m2 + term
+        self.mean = self.mean + nb * dn
+        self.count = self.count + count
+
+    def variance(self):
+        """The unbiased variance as stats.var"""
+        return self.m2 / (self.count - 1.0)
+
+    def skewness(self):
+        """The biased skewness as stats.skew, 0 where all the values are
+        equal"""
+        zero = self.m2 == 0
+        m2 = numpy.where(zero, 1.0, self.m2)
+        return numpy.where(zero, 0,
+                           numpy.sqrt(self.count) * self.m3 / m2**1.5)
+
+    def kurtosis(self):
+        """The biased Fisher kurtosis as stats.kurtosis, -3 where all the
+        values are equal"""
+        zero = self.m2 == 0
+        m2 = numpy.where(zero, 1.0, self.m2)
+        return numpy.where(zero, 0, self.count * self.m4 / m2**2) - 3
+
+
+class QuantileSketch(object):
+    """
+    Estimates the percentiles of each element of the sample arrays added
+    from weighted centroids: the samples themselves until there are more
+    than 2 * size of them, then the centroids are merged into size bins of
+    the rank, narrow at the ends and wide in the middle as in a t-digest.
+    The smallest and the largest value are kept exactly.
+    """
+
+    def __init__(self, shape, size=SKETCH_SIZE):
+        """
+        Constructor.
+
+        shape -- shape of a sample, e.g. (timesteps, columns)
+        size -- number of centroids kept after a compression
+        """
+        self.size = size
+        self.count = 0
+        self.exact = True
+        self.values = numpy.empty((0,) + tuple(shape))
+        self.weights = numpy.empty((0,) + tuple(shape))
+        self.minimum = numpy.empty(shape)
+        self.maximum = numpy.empty(shape)
+
+    def add(self, samples):
+        """
+        Adds a block of samples
+
+        samples -- array of the samples on the first axis
+        """
+        samples = numpy.asarray(samples, dtype=float)
+        if len(samples)==0:
+            return
+        self._combine(len(samples), samples, numpy.ones(samples.shape),
+                      samples.min(axis=0), samples.max(axis=0), True)
+
+    def merge(self, other):
+        """
+        Adds the centroids of another sketch of the same shape
+        """
+        if other.count==0:
+            return
+        self._combine(other.count, other.values, other.weights,
+                      other.minimum, other.maximum, other.exact)
+
+    def _combine(self, count, values, weights, minimum, maximum, exact):
+        if self.count==0:
+            self.minimum = numpy.array(minimum, dtype=float)
+            self.maximum = numpy.array(maximum, dtype=float)
+        else:
+            self.minimum = numpy.minimum(self.minimum, minimum)
+            self.maximum = numpy.maximum(self.maximum, maximum)
+        self.values = numpy.concatenate((self.values, values))
+        self.weights = numpy.concatenate((self.weights, weights))
+        self.count += count
+        self.exact = self.exact and exact
+        if len(self.values) > 2 * self.size:
+            self._compress()
+
+    def _sorted(self):
+        """
+        Returns the centroids sorted by value, the empty ones last, and
+        the ranks of their midpoints
+        """
+        order = numpy.argsort(self.values, axis=0, kind='mergesort')
+        values = numpy.take_along_axis(self.values, order, 0)
+        weights = numpy.take_along_axis(self.weights, order, 0)
+        mids = weights.cumsum(axis=0) - weights / 2.
+        return values, weights, mids
+
+    def _compress(self):
+        """
+        Merges the centroids into size bins by the arcsine of their rank
+        """
+        values, weights, mids = self._sorted()
+        q = mids / self.count
+        bins = numpy.floor(self.size * (numpy.arcsin(2 * q - 1) / numpy.pi
+                                        + 0.5)).astype(int)
+        bins = numpy.clip(bins, 0, self.size - 1)
+        shape = values.shape[1:]
+        elements = int(numpy.prod(shape))
+        index = (bins.reshape(len(bins), elements) * elements
+                 + numpy.arange(elements)).ravel()
+        length = self.size * elements
+        wsum = numpy.bincount(index, weights.ravel(), length)
+        vsum = numpy.bincount(index, numpy.where(weights>0, values * weights,
+                                                 0).ravel(), length)
+        empty = wsum==0
+        # the empty bins have no weight and sort after the others
+        self.values = numpy.where(empty, numpy.nan,
+                                  vsum / numpy.where(empty, 1, wsum)).reshape(
+                                      (self.size,) + shape)
+        self.weights = wsum.reshape((self.size,) + shape)
+        self.exact = False
+
+    def percentile(self, p):
+        """
+        Returns the estimated p percentile, interpolated linearly between
+        the ranks as numpy.percentile, which it equals while the sketch is
+        exact
+        """
+        rank = p / 100. * (self.count - 1) + 0.5
+        # the smallest and the largest value are known exactly, at the ranks
+        # of the midpoints of the first and the last sample
+        if rank <= 0.5:
+            return self.minimum.copy()
+        if rank >= self.count - 0.5:
+            return self.maximum.copy()
+        values, weights, mids = self._sorted()
+        ends = (1,) + values.shape[1:]
+        values = numpy.concatenate((self.minimum.reshape(ends), values,
+                                    self.maximum.reshape(ends)))
+        values = numpy.where(numpy.isnan(values), self.maximum, values)
+        ranks = numpy.concatenate((numpy.zeros(ends) + 0.5, mids,
+                                   numpy.zeros(ends) + self.count - 0.5))
+        i = numpy.clip((ranks <= rank).sum(axis=0) - 1, 0, len(ranks) - 2)
+        r0 = numpy.take_along_axis(ranks, i[None], 0)[0]
+        r1 = numpy.take_along_axis(ranks, i[None] + 1, 0)[0]
+        v0 = numpy.take_along_axis(values, i[None], 0)[0]
+        v1 = numpy.take_along_axis(values, i[None] + 1, 0)[0]
+        span = numpy.where(r1>r0, r1 - r0, 1)
+        frac = numpy.clip((rank - r0) / span, 0, 1)
+        return v0 + frac * (v1 - v0)
+
+    def mode(self):
+        """
+        Returns the mode as stats.mode while the sketch is exact, after that
+        an estimate of it: the centroid where the values are the densest,
+        i.e. where the rank grows the fastest with the value over the
+        centroids size / 20 before and after it. Centroids of equal values
+        are taken before the others, the smallest first as in stats.mode.
+        """
+        if self.count==0:
+            return numpy.zeros(self.values.shape[1:]) + numpy.nan
+        if self.exact:
+            return stats.mode(self.values)[0][0]
+        values, weights, mids = self._sorted()
+        values = numpy.where(numpy.isnan(values), self.maximum, values)
+        ends = (1,) + values.shape[1:]
+        bounds = numpy.concatenate((self.minimum.reshape(ends), values,
+                                    self.maximum.reshape(ends)))
+        ranks = numpy.concatenate((numpy.zeros(ends), mids,
+                                   numpy.zeros(ends) + self.count))
+        half = max(1, self.size // 20)
+        i = numpy.arange(1, len(values) + 1)
+        lo = numpy.maximum(i - half, 0)
+        hi = numpy.minimum(i + half, len(values) + 1)
+        width = bounds[hi] - bounds[lo]
+        density = numpy.where(width>0, (ranks[hi] - ranks[lo])
+                                       / numpy.where(width>0, width, 1),
+                              numpy.inf)
+        # the empty centroids are never the mode
+        density = numpy.where(weights>0, density, 0)
+        k = numpy.argmax(density, axis=0)
+        return numpy.take_along_axis(values, k[None], 0)[0]
+
+
+class SampleStatistics(object):
+    """
+    The moments and the quantile sketch of the sample arrays added
+    """
+
+    def __init__(self, shape, size=SKETCH_SIZE):
+        self.moments = MomentAccumulator(shape)
+        self.sketch = QuantileSketch(shape, size)
+
+    @property
+    def count(self):
+        return self.moments.count
+
+    def add(self, samples):
+        """Adds a block of samples, on the first axis"""
+        self.moments.add(samples)
+        self.sketch.add(samples)
+
+    def merge(self, other):
+        """Adds the samples of other SampleStatistics"""
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
@@ -1,4 +1,4 @@
 cd ..
-f2py-script.py -c --fcompiler=gnu95 --compiler=mingw32 -m y15 y15_subroutine.f90 only: mod5c
+f2py-script.py -c --fcompiler=gnu95 --compiler=mingw32 -m y15 y15_subroutine.f90 only: mod5c mod5c_batch mod5c_trajectory
 cd pyinstaller
 
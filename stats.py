@@ -380,6 +380,9 @@ def mode(a, axis=0):
     If there is more than one such value, only the first is returned.
     The bin-count for the modal bins is also returned.
 
+    The values are sorted along the axis and the longest run of equal
+    values is taken, so all the modes are found with a single sort.
+
     Parameters
     ----------
     a : array
@@ -390,17 +393,25 @@ def mode(a, axis=0):
     (array of modal values, array of counts for each mode)
     """
     a, axis = _chk_asarray(a, axis)
-    scores = np.unique(np.ravel(a))       # get ALL unique values
-    testshape = list(a.shape)
-    testshape[axis] = 1
-    oldmostfreq = np.zeros(testshape)
-    oldcounts = np.zeros(testshape)
-    for score in scores:
-        template = (a == score)
-        counts = np.expand_dims(np.sum(template, axis),axis)
-        mostfrequent = np.where(counts > oldcounts, score, oldmostfreq)
-        oldcounts = np.maximum(counts, oldcounts)
-        oldmostfreq = mostfrequent
+    n = a.shape[axis]
+    rolled = np.rollaxis(a, axis, a.ndim)
+    outshape = rolled.shape[:-1]
+    flat = np.sort(rolled.reshape(-1, n), axis=-1)
+    # runs of equal values start where the sorted value changes
+    starts = np.ones(flat.shape, dtype=bool)
+    starts[:, 1:] = flat[:, 1:] != flat[:, :-1]
+    starts = np.flatnonzero(starts)
+    counts = np.diff(np.append(starts, flat.size))
+    groups = starts // n
+    # the longest run of each group, the smallest value on ties
+    order = np.lexsort((starts, -counts, groups))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = groups[order][1:] != groups[order][:-1]
+    longest = order[first]
+    mostfrequent = flat.ravel()[starts[longest]].astype(float)
+    oldcounts = counts[longest].astype(float)
+    mostfrequent = np.expand_dims(mostfrequent.reshape(outshape), axis)
+    oldcounts = np.expand_dims(oldcounts.reshape(outshape), axis)
     return mostfrequent, oldcounts
 
 #####################################
@@ -532,6 +543,12 @@ def kurtosis(a, axis=0, fisher=True, bias=True):
 def describe(a, axis=0):
     """Computes several descriptive statistics of the passed array.
 
+    The moments are computed together from a single set of deviations from
+    the mean, so the data is traversed a few times instead of once per
+    moment and statistic. Any number of dimensions is handled at once, e.g.
+    the (samples, timesteps, columns) results of all the columns. The
+    results equal those of mean, var, skew and kurtosis up to rounding.
+
     Parameters
     ----------
     a : array
@@ -548,11 +565,21 @@ def describe(a, axis=0):
     """
     a, axis = _chk_asarray(a, axis)
     n = a.shape[axis]
-    mm = (np.minimum.reduce(a), np.maximum.reduce(a))
-    m = mean(a, axis)
-    v = var(a, axis)
-    sk = skew(a, axis)
-    kurt = kurtosis(a, axis)
+    mm = (np.minimum.reduce(a, axis), np.maximum.reduce(a, axis))
+    m = a.mean(axis)
+    dev = a - np.expand_dims(m, axis)
+    dev2 = dev * dev
+    ss2 = np.sum(dev2, axis)
+    m2 = ss2 / n
+    m3 = np.mean(dev2 * dev, axis)
+    m4 = np.mean(dev2 * dev2, axis)
+    zero = (m2 == 0)
+    # the variance of a single value is nan, the values of the zero variance
+    # are replaced
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v = ss2 / (n-1.0)
+        sk = np.where(zero, 0, m3 / m2**1.5)
+        kurt = np.where(zero, 0, m4 / m2**2.0) - 3
     return n, mm, m, v, sk, kurt
 
 #####################################
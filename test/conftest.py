@@ -0,0 +1,57 @@
+"""
+Fixtures of the tests: a parameter file and the model data of the input
+files in test/data
+"""
+
+import os
+import sys
+
+import numpy
+import pytest
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTDIR))
+
+import benchmark
+import modelcall
+
+# maximum likelihood estimates of the 35 Yasso15 parameters, the parameter
+# file of the tests perturbs them as the parameter sets of param/ are not
+# in the repository
+ML_PARAMETERS = [0.49, 4.9, 0.24, 0.095, 0.44, 0.25, 0.92, 0.99, 0.084,
+                 0.011, 0.00061, 0.00048, 0.066, 0.00077, 0.1, 0.65, -1.0,
+                 -1.0, -1.0, -1.0, -1.0, 0.091, -0.00021, 0.049, -7.9e-5,
+                 0.035, -0.00021, -1.8, -1.2, -13.0, 0.0046, 0.0013, -0.44,
+                 1.3, 0.26]
+# the backends available on the host
+BACKENDS = [backend for backend in modelcall.BACKENDS
+            if backend != 'fortran' or modelcall.y15 is not None]
+
+
+@pytest.fixture(scope='session')
+def parfile(tmp_path_factory):
+    """
+    A parameter file of the maximum likelihood estimates and PARAM_SAMPLES
+    - 1 sets perturbed by 10% around them
+    """
+    rs = numpy.random.RandomState(1)
+    params = numpy.array(ML_PARAMETERS) * (
+                 1 + 0.1 * rs.standard_normal((modelcall.PARAM_SAMPLES, 35)))
+    params[0] = ML_PARAMETERS
+    path = str(tmp_path_factory.mktemp('param') / 'Yasso15.dat')
+    numpy.savetxt(path, params, fmt='%.6g')
+    return path
+
+
+@pytest.fixture
+def model_data():
+    """
+    Returns a function giving the modeldata.ModelData of the input files
+    in test/data with the settings given to it
+    """
+    def create(**settings):
+        md = benchmark.test_data(os.path.join(TESTDIR, 'data'))
+        for name, value in settings.items():
+            setattr(md, name, value)
+        return md
+    return create
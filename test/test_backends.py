@@ -0,0 +1,36 @@
+"""
+The numpy backend agrees with the compiled fortran one
+"""
+
+import numpy
+import pytest
+
+import modelcall
+from conftest import BACKENDS
+
+MODES = [('constant yearly', 'constant yearly'), ('yearly', 'yearly'),
+         ('monthly', 'monthly')]
+
+
+def run(parfile, md, backend):
+    runner = modelcall.ModelRunner(parfile, backend=backend, seed=1,
+                                   cache_propagators=False)
+    return runner.run_model(md)
+
+
+@pytest.mark.skipif('fortran' not in BACKENDS,
+                    reason='the compiled y15 module is missing')
+@pytest.mark.parametrize('climate_mode,litter_mode', MODES)
+def test_numpy_matches_fortran(parfile, model_data, climate_mode,
+                               litter_mode):
+    settings = dict(climate_mode=climate_mode, litter_mode=litter_mode,
+                    sample_size=5, simulation_length=10)
+    fortran = run(parfile, model_data(**settings), 'fortran')
+    numpy_ = run(parfile, model_data(**settings), 'numpy')
+    # the fortran model computes in single precision, the C stock, C change
+    # and CO2 agree relative to the largest stock
+    scale = numpy.abs(numpy_[0][:, 2:]).max()
+    for f, n in zip(fortran, numpy_):
+        # the sample and timestep columns
+        assert numpy.array_equal(f[:, :2], n[:, :2])
+        assert numpy.abs(f[:, 2:] - n[:, 2:]).max() <= 2e-5 * scale
@@ -0,0 +1,99 @@
+"""
+Reading the sectioned data file format
+"""
+
+import os
+
+import numpy
+import pytest
+
+import datafile
+from conftest import TESTDIR
+
+DEMO_DATA = os.path.join(os.path.dirname(TESTDIR), 'demo_data.txt')
+
+TEXT = """# comment before the sections
+[First]
+1 2 3
+# a comment row
+4 5 6
+
+[Empty]
+# only comments
+[Blank]
+
+[Last]
+7.5 -1e-2
+"""
+
+
+def test_headers_are_not_rows():
+    data = datafile.read_sections(TEXT.splitlines(True))
+    assert sorted(data) == ['Blank', 'First', 'Last']
+    first = data['First']
+    assert first.lengths.tolist() == [3, 3, 0]
+    assert first.lines.tolist() == [3, 5, 6]
+    assert first.table(3, '').tolist() == [[1, 2, 3], [4, 5, 6]]
+    assert data['Last'].table(2, '').tolist() == [[7.5, -0.01]]
+
+
+def test_empty_sections():
+    data = datafile.read_sections(TEXT.splitlines(True))
+    # a section of comments has no rows, one of empty lines empty rows
+    assert 'Empty' not in data
+    blank = data['Blank']
+    assert len(blank) == 1
+    assert blank.table(3, '').shape == (0, 3)
+    assert data['First'].table(3, '', stop_at_empty=True,
+                               max_rows=1).shape == (1, 3)
+
+
+def test_bad_row_is_reported_with_its_line():
+    text = TEXT.replace('4 5 6', '4 5e 6')
+    with pytest.raises(ValueError) as info:
+        datafile.read_sections(text.splitlines(True))
+    assert 'line 5' in str(info.value)
+    assert 'section First' in str(info.value)
+    errors = []
+    data = datafile.read_sections(text.splitlines(True), errors)
+    assert len(errors) == 1 and 'line 5' in errors[0]
+    # the row is skipped, the others are kept
+    assert data['First'].table(3, '').tolist() == [[1, 2, 3]]
+    assert data['First'].lines.tolist() == [3, 6]
+
+
+def test_wrong_number_of_values_is_reported_with_its_line():
+    text = TEXT.replace('4 5 6', '4 5')
+    section = datafile.read_sections(text.splitlines(True))['First']
+    with pytest.raises(ValueError) as info:
+        section.table(3, 'Three values')
+    assert 'on line 5 for section First' in str(info.value)
+    errors = []
+    assert section.table(3, '', errors=errors).tolist() == [[1, 2, 3]]
+    assert len(errors) == 1
+
+
+def assert_same_sections(data, expected):
+    assert set(data) == set(expected)
+    for name in expected:
+        assert numpy.array_equal(data[name].values, expected[name].values)
+        assert numpy.array_equal(data[name].lengths, expected[name].lengths)
+        assert numpy.array_equal(data[name].lines, expected[name].lines)
+
+
+@pytest.mark.parametrize('path', [None, DEMO_DATA])
+def test_section_reader_reads_the_same_rows(path):
+    if path is None:
+        text = TEXT
+    else:
+        with open(path) as f:
+            text = f.read()
+    reader = datafile.SectionReader()
+    assert_same_sections(reader.read(text),
+                         datafile.read_sections(text.splitlines(True)))
+    # read again after a row is added to the section before the last one,
+    # the unchanged sections come from the previous read
+    end = text.rindex('\n[') + 1
+    changed = text[:end] + '1 2 3\n' + text[end:]
+    assert_same_sections(reader.read(changed),
+                         datafile.read_sections(changed.splitlines(True)))
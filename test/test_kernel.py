@@ -0,0 +1,44 @@
+"""
+The solvers and matrix exponentials of the model kernels agree with the
+default dense solution with the Taylor series
+"""
+
+import os
+
+import numpy
+import pytest
+
+import benchmark
+import modelcall
+from conftest import BACKENDS, TESTDIR
+
+# the largest difference to the default solution relative to the largest
+# compartment, the fortran kernel computes in single precision
+TOLERANCE = {'fortran': 1e-3, 'numpy': 1e-7}
+
+
+def kernel(backend):
+    if backend == 'fortran':
+        return modelcall.y15.yasso
+    return modelcall.y15_numpy
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('option,solver,expm', benchmark.KERNEL_OPTIONS)
+def test_kernel_options(parfile, backend, option, solver, expm):
+    # the climates and litter of test/data from a month to 10000 years
+    assert 10000. in benchmark.ACCURACY_TIMESTEPS
+    params = modelcall.load_parameter_set(parfile)
+    params = params[numpy.linspace(0, len(params) - 1, 10).astype(int)]
+    args = benchmark.kernel_inputs(params, os.path.join(TESTDIR, 'data'))
+    model = kernel(backend)
+    default = model.mod5c_batch(*(args + (False,)))
+    result = model.mod5c_batch(*(args + (False,
+                                         modelcall.SOLVERS.index(solver),
+                                         modelcall.EXPMS.index(expm))))
+    scale = numpy.abs(default).max(axis=1)
+    difference = numpy.abs(result - default).max(axis=1) / scale
+    time = args[1]
+    for step in benchmark.ACCURACY_TIMESTEPS:
+        assert difference[time == numpy.float32(step)].max() \
+            <= TOLERANCE[backend], step
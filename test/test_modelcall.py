@@ -0,0 +1,177 @@
+"""
+ModelRunner runs
+"""
+
+import threading
+
+import numpy
+import pytest
+
+import modelcall
+import modeldata
+from conftest import BACKENDS
+
+
+def run(parfile, md, processes=1, **runner_args):
+    runner = modelcall.ModelRunner(parfile, **runner_args)
+    return runner.run_model(md, processes=processes)
+
+
+def assert_same(results, expected):
+    for result, array in zip(results, expected):
+        assert numpy.array_equal(result, array)
+
+
+@pytest.mark.parametrize('climate_mode,litter_mode',
+                         [('constant yearly', 'constant yearly'),
+                          ('monthly', 'monthly')])
+def test_seed_reproduces_the_results(parfile, model_data, climate_mode,
+                                     litter_mode):
+    # the random draws of a sample depend only on the seed and the sample,
+    # not on the worker processes and threads or the batches
+    settings = dict(climate_mode=climate_mode, litter_mode=litter_mode,
+                    sample_size=7, simulation_length=5)
+    serial = run(parfile, model_data(**settings), seed=42)
+    assert_same(run(parfile, model_data(**settings), seed=42), serial)
+    assert_same(run(parfile, model_data(**settings), processes=3, seed=42),
+                serial)
+    assert_same(run(parfile, model_data(**settings), seed=42, threads=3),
+                serial)
+    assert_same(run(parfile, model_data(**settings), seed=42, batch_size=2),
+                serial)
+    other = run(parfile, model_data(**settings), seed=43)
+    assert not numpy.array_equal(other[0], serial[0])
+
+
+# the climate of the timesteps of test/data as computed timestep by timestep
+# for each sample before the climate timeline
+CLIMATE_TIMELINES = [
+    (('yearly', 'year', 3), 3.0,
+     [(3.9965296803652968, 758.0406392694064, 11.189589041095891),
+      (4.595981735159818, 877.4700456621005, 10.590136986301369),
+      (5.195446265938069, 1015.8188524590164, 9.99071038251366),
+      (5.794885844748858, 1175.9105022831052, 9.391232876712328),
+      (3.9965296803652968, 758.0406392694064, 11.189589041095891)]),
+    (('monthly', 'month', 5), 5 / 12.,
+     [(-1.18, 5097.6, 7.95),
+      (11.02, 10281.6, 7.75),
+      (-4.38, 6019.2, 3.65),
+      (10.68, 8956.8, 7.75),
+      (0.12, 7948.8, 8.2)]),
+    (('monthly', 'year', 1), 1.0,
+     [(3.6916666666666678, 7716.0, 11.4)] * 5),
+    ]
+
+
+@pytest.mark.parametrize('settings,duration,climate', CLIMATE_TIMELINES)
+def test_climate_timeline(parfile, model_data, settings, duration, climate):
+    climate_mode, duration_unit, timestep_length = settings
+    md = model_data(climate_mode=climate_mode, duration_unit=duration_unit,
+                    timestep_length=timestep_length)
+    timeline, durations = modelcall.ModelRunner(parfile).climate_timeline(
+                                                                       md, 5)
+    assert numpy.allclose(timeline, climate, rtol=1e-12, atol=1e-12)
+    assert numpy.allclose(durations, duration, rtol=1e-12)
+
+
+# the trajectory passes the state between the timesteps as it is, not
+# through the masses and percentages, which changes the results within the
+# precision of the backend, relative to the largest C stock
+TRAJECTORY_TOLERANCE = {'fortran': 1e-5, 'numpy': 1e-7}
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('area_change', [None, [[2, -0.3], [5, 0.4]]])
+def test_trajectory_matches_timesteps(parfile, model_data, backend,
+                                      area_change):
+    settings = dict(climate_mode='yearly', litter_mode='yearly',
+                    sample_size=6, simulation_length=8)
+    results = []
+    for trajectory in (False, True):
+        md = model_data(**settings)
+        if area_change is not None:
+            md.area_change = modeldata.values_array(area_change,
+                                                    modeldata.AreaChange)
+        results.append(run(parfile, md, backend=backend, seed=11,
+                           trajectory=trajectory))
+    timesteps, trajectory = results
+    atol = TRAJECTORY_TOLERANCE[backend] * abs(timesteps[0][:,2:]).max()
+    for result, expected in zip(trajectory, timesteps):
+        assert numpy.array_equal(result[:,:2], expected[:,:2])
+        assert numpy.allclose(result, expected, rtol=0, atol=atol)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('threads', [2, 4])
+def test_threads_match_serial(parfile, model_data, tmp_path, backend,
+                              threads):
+    settings = dict(climate_mode='yearly', litter_mode='yearly',
+                    sample_size=9, simulation_length=6)
+    serial = run(parfile, model_data(**settings), backend=backend, seed=5)
+    assert_same(run(parfile, model_data(**settings), backend=backend,
+                    seed=5, threads=threads), serial)
+    # streamed into a store, the statistics of the shards are merged
+    md = model_data(**settings)
+    runner = modelcall.ModelRunner(parfile, backend=backend, seed=5,
+                                   threads=threads)
+    stored = runner.run_model(md, store=str(tmp_path / 'threads'))
+    expected = model_data(**settings)
+    runner = modelcall.ModelRunner(parfile, backend=backend, seed=5)
+    assert_same(stored, runner.run_model(expected,
+                                         store=str(tmp_path / 'serial')))
+    for resto, result, column in modelcall.MOMENT_RESULTS:
+        assert numpy.allclose(getattr(md, resto), getattr(expected, resto),
+                              rtol=1e-12, atol=1e-12)
+
+
+class CountingKernel(object):
+    """
+    Records the threads calling mod5c_batch of the compiled model
+    """
+
+    def __init__(self, kernel):
+        self.kernel = kernel
+        self.threads = []
+
+    def mod5c_batch(self, *args):
+        self.threads.append(threading.current_thread())
+        return self.kernel.mod5c_batch(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.kernel, name)
+
+
+@pytest.mark.skipif('fortran' not in BACKENDS,
+                    reason='the compiled y15 module is missing')
+def test_threads_call_the_compiled_model(parfile, model_data, monkeypatch):
+    # the shards solve the timesteps with the compiled model, which
+    # releases the GIL during the calls
+    kernel = CountingKernel(modelcall.y15.yasso)
+    monkeypatch.setattr(modelcall, 'y15', type('y15', (), {'yasso': kernel}))
+    md = model_data(climate_mode='constant yearly',
+                    litter_mode='constant yearly', sample_size=6,
+                    simulation_length=4)
+    modelcall.ModelRunner(parfile, backend='fortran', seed=5,
+                          threads=3).run_model(md)
+    assert len(kernel.threads) == 3 * 4
+    assert threading.main_thread() not in kernel.threads
+
+
+@pytest.mark.skipif('fortran' not in BACKENDS,
+                    reason='the compiled y15 module is missing')
+@pytest.mark.parametrize('kernel_threads,calls', [(None, 1), (1, 1), (2, 5)])
+def test_kernel_threads_turn_the_cache_off(parfile, model_data, monkeypatch,
+                                           kernel_threads, calls):
+    # the steady state and, with kernel threads, the timesteps are solved
+    # with the compiled model
+    kernel = CountingKernel(modelcall.y15.yasso)
+    monkeypatch.setattr(modelcall, 'y15', type('y15', (), {'yasso': kernel}))
+    md = model_data(climate_mode='constant yearly',
+                    litter_mode='constant yearly', sample_size=6,
+                    simulation_length=4)
+    runner = modelcall.ModelRunner(parfile, backend='fortran', seed=5,
+                                   cache_propagators=True,
+                                   kernel_threads=kernel_threads)
+    runner.compute_steady_state(md)
+    runner.run_model(md)
+    assert len(kernel.threads) == calls
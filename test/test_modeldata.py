@@ -0,0 +1,47 @@
+"""
+The binary result arrays of a run
+"""
+
+import numpy
+import pytest
+
+import modelcall
+import modeldata
+
+
+@pytest.fixture
+def results(parfile, model_data):
+    md = model_data(climate_mode='yearly', litter_mode='yearly',
+                    sample_size=4, simulation_length=3)
+    runner = modelcall.ModelRunner(parfile, seed=3)
+    md.c_stock, md.c_change, md.co2_yield = runner.run_model(md)
+    return md
+
+
+def test_arrays_round_trip(results, tmp_path):
+    path = str(tmp_path / 'arrays')
+    modeldata.write_arrays(path, results)
+    arrays, metadata = modeldata.read_arrays(path, mmap_mode=None)
+    names = set(modeldata.RESULT_ARRAYS.values())
+    for moments in modeldata.MOMENT_ARRAYS.values():
+        names.update(moments)
+    assert set(arrays) == names
+    for name in names:
+        expected = getattr(results, name)
+        assert arrays[name].dtype == expected.dtype
+        assert numpy.array_equal(arrays[name], expected, equal_nan=True)
+        assert len(metadata['columns'][name]) == expected.shape[1]
+    assert metadata['settings'] == dict((name, getattr(results, name))
+                                        for name in modeldata.SETTINGS)
+
+
+def test_mapped_arrays_are_read_only(results, tmp_path):
+    path = str(tmp_path / 'arrays')
+    modeldata.write_arrays(path, results)
+    arrays, metadata = modeldata.read_arrays(path)
+    c_stock = arrays['c_stock']
+    assert isinstance(c_stock, numpy.memmap)
+    assert not c_stock.flags.writeable
+    assert numpy.array_equal(c_stock, results.c_stock)
+    with pytest.raises(ValueError):
+        c_stock[0, 0] = 1
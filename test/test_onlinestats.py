@@ -0,0 +1,74 @@
+"""
+The percentiles and the mode of the quantile sketch
+"""
+
+import numpy
+import pytest
+
+import onlinestats
+import stats
+
+PERCENTILES = [0.5, 2.5, 25, 50, 75, 97.5, 99.5]
+
+
+def sketch(samples, block=50, size=onlinestats.SKETCH_SIZE):
+    result = onlinestats.QuantileSketch(samples.shape[1:], size)
+    for start in range(0, len(samples), block):
+        result.add(samples[start:start+block])
+    return result
+
+
+@pytest.mark.parametrize('count', [1, 7, 2 * onlinestats.SKETCH_SIZE])
+def test_exact_percentiles(count):
+    samples = numpy.random.RandomState(count).gamma(2., size=(count, 3, 2))
+    result = sketch(samples)
+    assert result.exact
+    for p in PERCENTILES:
+        assert numpy.allclose(result.percentile(p),
+                              numpy.percentile(samples, p, axis=0),
+                              rtol=1e-12, atol=0)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_compressed_percentiles(seed):
+    # the share of the samples below the estimated p percentile is within a
+    # quarter of the p or 100 - p percent of the samples
+    samples = numpy.random.RandomState(seed).gamma(2., size=(10000, 4))
+    result = sketch(samples, block=250)
+    assert not result.exact
+    for p in PERCENTILES:
+        below = 100. * (samples < result.percentile(p)).mean(axis=0)
+        assert numpy.all(abs(below - p) <= 0.25 * min(p, 100 - p))
+    assert numpy.array_equal(result.percentile(0), samples.min(axis=0))
+    assert numpy.array_equal(result.percentile(100), samples.max(axis=0))
+
+
+def test_merged_sketches():
+    samples = numpy.random.RandomState(1).normal(size=(3000, 2))
+    merged = sketch(samples[:1000])
+    merged.merge(sketch(samples[1000:]))
+    assert merged.count == 3000
+    for p in PERCENTILES:
+        below = 100. * (samples < merged.percentile(p)).mean(axis=0)
+        assert numpy.all(abs(below - p) <= 0.25 * min(p, 100 - p))
+
+
+def test_exact_mode():
+    samples = numpy.random.RandomState(2).randint(0, 5, (150, 3)) * 0.5
+    assert numpy.array_equal(sketch(samples).mode(),
+                             stats.mode(samples)[0][0])
+
+
+def test_compressed_mode():
+    rs = numpy.random.RandomState(3)
+    normal = rs.normal(5., 2., 20000)
+    # a third of the samples at 0, as with no litter of a size class
+    zeros = numpy.where(rs.uniform(size=20000) < 1 / 3., 0, normal)
+    constant = numpy.ones(20000)
+    result = sketch(numpy.column_stack((normal, zeros, constant)), 500)
+    assert not result.exact
+    mode = result.mode()
+    assert not numpy.isnan(mode).any()
+    assert abs(mode[0] - 5.) < 1.
+    assert mode[1] == 0
+    assert mode[2] == 1
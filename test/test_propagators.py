@@ -0,0 +1,43 @@
+"""
+The propagator cache of y15_numpy
+"""
+
+import numpy
+
+import y15_numpy
+from conftest import ML_PARAMETERS
+
+
+def rows(n):
+    """
+    Model inputs of n rows differing by the climate
+    """
+    return (numpy.tile(ML_PARAMETERS, (n, 1)), numpy.ones(n),
+            numpy.column_stack((numpy.arange(n) + 4., numpy.full(n, 600.),
+                                numpy.full(n, 12.))),
+            numpy.ones((n, 5)), numpy.full((n, 5), 0.5), numpy.zeros(n),
+            numpy.zeros(n))
+
+
+def test_predict_matches_mod5c_batch():
+    cache = y15_numpy.PropagatorCache()
+    args = rows(3)
+    expected = y15_numpy.mod5c_batch(*args)
+    assert numpy.allclose(cache.predict([0, 1, 2], *args), expected,
+                          rtol=1e-12, atol=0)
+    assert numpy.allclose(cache.predict([0, 1, 2], *args), expected,
+                          rtol=1e-12, atol=0)
+    assert len(cache) == 3
+
+
+def test_clear_keeps_the_keys_of_the_batch():
+    # a batch of cached and missing keys over the maximum size empties the
+    # cache, the cached keys are then recomputed
+    cache = y15_numpy.PropagatorCache(max_size=3)
+    args = rows(4)
+    cache.predict([0, 1], *[a[:2] for a in args])
+    batch = [a[[0, 2, 3]] for a in args]
+    result = cache.predict([0, 2, 3], *batch)
+    assert numpy.allclose(result, y15_numpy.mod5c_batch(*batch), rtol=1e-12,
+                          atol=0)
+    assert len(cache) == 3
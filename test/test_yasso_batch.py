@@ -0,0 +1,85 @@
+"""
+Runs of several sites with yasso_batch
+"""
+
+import codecs
+import os
+import shutil
+
+import numpy
+
+import yasso_batch
+from conftest import TESTDIR
+
+SETTINGS = dict(sample_size=20, simulation_length=5,
+                litter_mode='constant yearly',
+                climate_mode='constant yearly')
+
+
+def sites(path, names=('a', 'b', 'c')):
+    datadir = path / 'sites'
+    datadir.mkdir(parents=True)
+    demo = os.path.join(os.path.dirname(TESTDIR), 'demo_data.txt')
+    for name in names:
+        shutil.copy(demo, str(datadir / (name + '.txt')))
+    return yasso_batch.site_files(str(datadir))
+
+
+def lines(outdir):
+    """
+    The lines of the result files, the sites are written in the order they
+    finish
+    """
+    result = {}
+    for result_type, resfile, momentfile in yasso_batch.RESULT_FILES:
+        for name in (resfile, momentfile):
+            f = codecs.open(os.path.join(outdir, name), 'r', 'utf8')
+            result[name] = sorted(f.readlines())
+            f.close()
+    return result
+
+
+def test_streamed_site_passes_back_no_results(parfile, tmp_path):
+    site, datafile = sites(tmp_path, ['a'])[0]
+    outdir = str(tmp_path / 'out')
+    os.makedirs(os.path.join(outdir, yasso_batch.PARTS_DIR))
+    yasso_batch._worker_runner = yasso_batch.create_runner(parfile, seed=2)
+    run_args = {'store': os.path.join(outdir, site), 'quantiles': False,
+                'online': False}
+    result = yasso_batch._run_site((site, datafile, SETTINGS, run_args,
+                                    outdir, False))
+    name, parts, msg = result
+    assert name == site and msg is None
+    # only the names of the files the worker wrote
+    for result_type, resfile, momentfile in yasso_batch.RESULT_FILES:
+        for part in parts[result_type]:
+            assert os.path.isfile(part)
+    assert all(isinstance(part, str) for pair in parts.values()
+               for part in pair)
+
+
+def test_streamed_sites_match_kept_results(parfile, tmp_path):
+    runs = {}
+    for stream in (False, True):
+        outdir = str(tmp_path / ('out%d' % stream))
+        failed = yasso_batch.run_sites(sites(tmp_path / str(stream)),
+                                       SETTINGS, parfile, outdir,
+                                       processes=2, stream=stream, seed=2)
+        assert failed == 0
+        assert not os.path.exists(os.path.join(outdir,
+                                                yasso_batch.PARTS_DIR))
+        runs[stream] = lines(outdir)
+    for result_type, resfile, momentfile in yasso_batch.RESULT_FILES:
+        assert runs[True][resfile] == runs[False][resfile]
+        # the moments of a streamed run are accumulated as the samples
+        # finish
+        for streamed, kept in zip(runs[True][momentfile],
+                                  runs[False][momentfile]):
+            streamed, kept = streamed.split(), kept.split()
+            if kept[0].startswith('#'):
+                assert streamed == kept
+            else:
+                assert streamed[:2] == kept[:2]
+                assert numpy.allclose([float(v) for v in streamed[2:]],
+                                      [float(v) for v in kept[2:]],
+                                      rtol=1e-9, equal_nan=True)
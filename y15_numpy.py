@@ -0,0 +1,521 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+NumPy implementation of the Yasso15 core code in y15_subroutine.f90
+
+Offers the same entry points as the compiled y15.yasso module, mod5c for
+a single model call and mod5c_batch for N independent rows, so that it can
+be used as a drop-in backend on hosts without gfortran/f2py. The batched
+version builds all the 5x5 coefficient matrices in broadcast form and uses
+batched matrix exponentials and linear solves. mod5c_trajectory runs one
+parameter set through the timesteps of a simulation. With solver=BLOCK only the
+4x4 AWEN block is exponentiated and humus is solved in closed form, see
+block_solution in y15_subroutine.f90. With expm=PADE the matrix
+exponentials are Pade approximants of the degree and scaling needed for
+double precision instead of the Taylor series, see padeexp.
+"""
+
+import math
+
+import numpy
+
+# temperature annual cycle approximation, see mod5c in y15_subroutine.f90
+_SQ2 = math.sqrt(2.0)
+_TE_WEIGHTS = numpy.array([4 * (1 / _SQ2 - 1) / math.pi,
+                           -4 / _SQ2 / math.pi,
+                           4 * (1 - 1 / _SQ2) / math.pi,
+                           4 / _SQ2 / math.pi])
+# parameter indices (0-based) of the mass flows between the AWEN
+# compartments, the diagonal holds the decomposition rates
+_P_INDEX = numpy.array([[-1, 4, 5, 6],
+                        [7, -1, 8, 9],
+                        [10, 11, -1, 12],
+                        [13, 14, 15, -1]])
+_TOL = 1E-12
+# number of terms in the Taylor series of the matrix exponential
+_TAYLOR_TERMS = 10
+# maximum number of propagators kept in a PropagatorCache
+PROPAGATOR_CACHE_SIZE = 100000
+# the solver argument: the dense 5x5 solution or the block solution
+DENSE = 0
+BLOCK = 1
+# the expm argument: the matrix exponential by the Taylor series or by
+# Pade approximants
+TAYLOR = 0
+PADE = 1
+# the degrees of the Pade approximants, the largest 1-norms for which
+# they are accurate in double precision and their coefficients, see
+# padeexp in y15_subroutine.f90
+_PADE_DEGREES = (3, 5, 7, 9, 13)
+_PADE_THETAS = (1.495585217958292e-2, 2.539398330063230e-1,
+                9.504178996162932e-1, 2.097847961257068e0,
+                5.371920351148152e0)
+_PADE_COEFFICIENTS = {
+    3: (120., 60., 12., 1.),
+    5: (30240., 15120., 3360., 420., 30., 1.),
+    7: (17297280., 8648640., 1995840., 277200., 25200., 1512., 56., 1.),
+    9: (17643225600., 8821612800., 2075673600., 302702400., 30270240.,
+        2162160., 110880., 3960., 90., 1.),
+    13: (64764752532480000., 32382376266240000., 7771770303897600.,
+         1187353796428800., 129060195264000., 10559470521600.,
+         670442572800., 33522128640., 1323241920., 40840800., 960960.,
+         16380., 182., 1.)}
+# the smallest singular value of B - l*I relative to the AWEN block B for
+# which the block solution is used, see restol in block_solution
+_RESONANCE_TOL = 1E-3
+
+
+def mod5c(theta, time, climate, init, b, d, leac, steadystate_pred=False,
+          solver=DENSE, expm=TAYLOR):
+    """
+    Returns the model prediction x(t) for the given parameters, see mod5c
+    in y15_subroutine.f90
+
+    theta -- the 35 model parameters
+    time -- duration of the timestep
+    climate -- mean temperature, annual rainfall and temperature amplitude
+    init -- initial state
+    b -- infall
+    d -- size of the woody material, 0 for non-woody
+    leac -- leaching parameter
+    steadystate_pred -- ignore time and compute the steady state solution
+    solver -- DENSE or BLOCK
+    expm -- TAYLOR or PADE
+    """
+    xt = mod5c_batch(numpy.atleast_2d(theta), [time],
+                     numpy.atleast_2d(climate), numpy.atleast_2d(init),
+                     numpy.atleast_2d(b), [d], [leac], steadystate_pred,
+                     solver, expm)
+    return xt[0]
+
+
+def mod5c_batch(theta, time, climate, init, b, d, leac,
+                steadystate_pred=False, solver=DENSE, expm=TAYLOR,
+                threads=0):
+    """
+    Returns the model predictions x(t) for n independent rows of parameters,
+    climate, initial state and infall, see mod5c_batch in y15_subroutine.f90
+
+    theta -- (n, 35) model parameters
+    time -- (n,) timestep durations
+    climate -- (n, 3) mean temperature, annual rainfall, temperature amplitude
+    init -- (n, 5) initial states
+    b -- (n, 5) infalls
+    d -- (n,) sizes of the woody material
+    leac -- (n,) leaching parameters
+    steadystate_pred -- ignore time and compute the steady state solutions
+    solver -- DENSE solves the 5x5 systems, BLOCK uses the block structure
+              of A, see _block_solution
+    expm -- TAYLOR for matrixexp or PADE for padeexp
+    threads -- OpenMP threads of the Fortran routine, ignored here
+    """
+    theta = numpy.asarray(theta, dtype=numpy.float64)
+    time = numpy.asarray(time, dtype=numpy.float64)
+    init = numpy.asarray(init, dtype=numpy.float64)
+    b = numpy.asarray(b, dtype=numpy.float64)
+    A, tem = coefficient_matrix(theta, climate, d, leac)
+    # rare case where no decomposition happens for some compartments
+    # (basically, if no rain)
+    nodecomp = tem <= _TOL
+    if nodecomp.any():
+        A[nodecomp] = numpy.eye(5)
+    if solver == BLOCK:
+        xt, dense = _block_solution(A, time, init, b, steadystate_pred,
+                                    nodecomp, expm)
+        if dense.any():
+            xt[dense] = _dense_solution(A[dense], time[dense], init[dense],
+                                        b[dense], steadystate_pred, expm)
+    else:
+        xt = _dense_solution(A, time, init, b, steadystate_pred, expm)
+    if nodecomp.any():
+        xt[nodecomp] = init[nodecomp] + b[nodecomp] * time[nodecomp, None]
+    return xt
+
+
+def mod5c_trajectory(theta, time, climate, init, b, d, leac, area=None,
+                     solver=DENSE, expm=TAYLOR):
+    """
+    Returns the (t+1, 5) trajectory of a parameter set and size class run
+    through t consecutive timesteps, see mod5c_trajectory in
+    y15_subroutine.f90. The propagators of all the timesteps are computed
+    in one batch and the states are then chained through them.
+
+    theta -- the 35 model parameters
+    time -- (t,) timestep durations
+    climate -- (t, 3) mean temperature, annual rainfall, temperature amplitude
+    init -- initial state
+    b -- (t, 5) infalls
+    d -- size of the woody material, 0 for non-woody
+    leac -- leaching parameter
+    area -- (t,) relative area changes scaling the state at the end of
+            each timestep before the next one, by default none
+    solver -- DENSE or BLOCK
+    expm -- TAYLOR or PADE
+    """
+    time = numpy.asarray(time, dtype=numpy.float64)
+    t = len(time)
+    b = numpy.asarray(b, dtype=numpy.float64)
+    M, G = propagator_batch(numpy.tile(numpy.asarray(theta), (t, 1)), time,
+                            numpy.asarray(climate).reshape(t, 3),
+                            numpy.repeat(d, t), numpy.repeat(leac, t),
+                            solver, expm)
+    offsets = _matvec(G, b)
+    xt = numpy.empty((t + 1, 5))
+    xt[0] = init
+    x = xt[0]
+    for k in range(t):
+        xt[k+1] = M[k].dot(x) + offsets[k]
+        x = xt[k+1] if area is None else xt[k+1] * area[k]
+    return xt
+
+
+def _dense_solution(A, time, init, b, steadystate_pred, expm):
+    """
+    Solves x'(t) = A*x(t) + b, x(0) = init for the (n, 5, 5) matrices A
+    """
+    if steadystate_pred:
+        # 0 = x'(t) = A*x + b => x = -A^-1*b
+        return _solve(-A, b)
+    z1 = _matvec(A, init) + b
+    mexpAt = _matrixexp(A * time[:, None, None], expm)
+    z2 = _matvec(mexpAt, z1) - b
+    return _solve(A, z2)
+
+
+def _block_solution(A, time, init, b, steadystate_pred, skip, expm):
+    """
+    Solves x'(t) = A*x(t) + b, x(0) = init exponentiating only the AWEN
+    block B = A[:4, :4], nothing flows from humus to AWEN. With the AWEN
+    steady state w = -B^-1*b[:4] and the humus rate l = A[4, 4]
+
+        x[:4](t) = exp(B*t)*(init[:4]-w) + w
+        x[4](t) = exp(l*t)*init[4] + A[4, :4].g + (exp(l*t)-1)/l*(A[4, :4].w + b[4])
+
+    where (B - l*I)*g = (exp(B*t) - exp(l*t)*I)*(init[:4]-w), see
+    block_solution in y15_subroutine.f90. Returns the (n, 5) solutions and
+    the rows left for the dense solution: those in skip and those whose l
+    is too close to an eigenvalue of B.
+    """
+    xt = numpy.zeros((len(A), 5))
+    B = A[:, :4, :4]
+    Bl = B - A[:, 4, 4, None, None] * numpy.eye(4)
+    if steadystate_pred:
+        dense = skip.copy()
+    else:
+        dense = skip | _resonant(B, Bl)
+    rows = ~dense
+    if not rows.any():
+        return xt, dense
+    B, Bl, h, l = B[rows], Bl[rows], A[rows, 4, :4], A[rows, 4, 4]
+    time, init, b = time[rows], init[rows], b[rows]
+    w = -_solve(B, b[:, :4])
+    if steadystate_pred:
+        xt[rows, :4] = w
+        xt[rows, 4] = -((h * w).sum(axis=1) + b[:, 4]) / l
+        return xt, dense
+    x0 = init[:, :4] - w
+    xa = _matvec(_matrixexp(B * time[:, None, None], expm), x0) + w
+    el = numpy.exp(l * time)
+    g = _solve(Bl, xa - w - el[:, None] * x0)
+    xt[rows, :4] = xa
+    xt[rows, 4] = el * init[:, 4] + (h * g).sum(axis=1) \
+                  + _expm1_ratio(l, time) * ((h * w).sum(axis=1) + b[:, 4])
+    return xt, dense
+
+
+def _resonant(B, Bl):
+    """
+    Returns the rows whose B - l*I is too close to singular for the block
+    solution
+    """
+    sv = numpy.linalg.svd(Bl, compute_uv=False)
+    return sv[:, -1] <= _RESONANCE_TOL * numpy.abs(B).max(axis=(1, 2))
+
+
+def _expm1_ratio(l, time):
+    """
+    Returns (exp(l*t)-1)/l without the cancellation for small l*t, t for
+    l = 0
+    """
+    zero = l == 0
+    return numpy.where(zero, time,
+                       numpy.expm1(l * time) / numpy.where(zero, 1.0, l))
+
+
+def propagator_batch(theta, time, climate, d, leac, solver=DENSE,
+                     expm=TAYLOR):
+    """
+    Returns the (n, 5, 5) propagators M = exp(A*t) and G = A^-1*(exp(A*t)-I)
+    of n rows, with which the solution of x'(t) = A*x(t) + b, x(0) = init
+    is x(t) = M*init + G*b
+
+    theta -- (n, 35) model parameters
+    time -- (n,) timestep durations
+    climate -- (n, 3) mean temperature, annual rainfall, temperature amplitude
+    d -- (n,) sizes of the woody material
+    leac -- (n,) leaching parameters
+    solver -- DENSE or BLOCK, see mod5c_batch
+    expm -- TAYLOR or PADE, see mod5c_batch
+    """
+    time = numpy.asarray(time, dtype=numpy.float64)
+    A, tem = coefficient_matrix(theta, climate, d, leac)
+    eye = numpy.eye(5)
+    nodecomp = tem <= _TOL
+    A[nodecomp] = eye
+    if solver == BLOCK:
+        M, G, dense = _block_propagators(A, time, nodecomp, expm)
+        if dense.any():
+            M[dense], G[dense] = _dense_propagators(A[dense], time[dense],
+                                                    expm)
+    else:
+        M, G = _dense_propagators(A, time, expm)
+    # no decomposition: x(t) = init + b*t
+    M[nodecomp] = eye
+    G[nodecomp] = eye * time[nodecomp, None, None]
+    return M, G
+
+
+def _dense_propagators(A, time, expm):
+    M = _matrixexp(A * time[:, None, None], expm)
+    G = numpy.linalg.solve(A, M - numpy.eye(5))
+    return M, G
+
+
+def _block_propagators(A, time, skip, expm):
+    """
+    Returns the propagators of the block solution, see _block_solution,
+    and the rows left for the dense ones
+    """
+    n = len(A)
+    M = numpy.zeros((n, 5, 5))
+    G = numpy.zeros((n, 5, 5))
+    B = A[:, :4, :4]
+    Bl = B - A[:, 4, 4, None, None] * numpy.eye(4)
+    dense = skip | _resonant(B, Bl)
+    rows = ~dense
+    if not rows.any():
+        return M, G, dense
+    B, Bl, h, l, time = B[rows], Bl[rows], A[rows, 4, :4], A[rows, 4, 4], \
+                        time[rows]
+    E = _matrixexp(B * time[:, None, None], expm)
+    el = numpy.exp(l * time)
+    phi = _expm1_ratio(l, time)
+    # humus row of exp(A*t): h^T*(B - l*I)^-1*(exp(B*t) - exp(l*t)*I)
+    f = _matvec(numpy.swapaxes(E - el[:, None, None] * numpy.eye(4), 1, 2),
+                _solve(numpy.swapaxes(Bl, 1, 2), h))
+    M[rows, :4, :4] = E
+    M[rows, 4, :4] = f
+    M[rows, 4, 4] = el
+    G[rows, :4, :4] = numpy.linalg.solve(B, E - numpy.eye(4))
+    G[rows, 4, :4] = _solve(numpy.swapaxes(B, 1, 2), f - phi[:, None] * h)
+    G[rows, 4, 4] = phi
+    return M, G, dense
+
+
+class PropagatorCache(object):
+    """
+    Stores the propagators of model calls by a hashable key so that
+    repeated calls with the same parameters, climate, size, duration and
+    leaching reduce to two 5x5 matrix-vector products
+    """
+
+    def __init__(self, max_size=PROPAGATOR_CACHE_SIZE, solver=DENSE,
+                 expm=TAYLOR):
+        """
+        Constructor.
+
+        max_size -- the cache is emptied when it would grow larger than this
+        solver -- DENSE or BLOCK, see mod5c_batch
+        expm -- TAYLOR or PADE, see mod5c_batch
+        """
+        self.max_size = max_size
+        self.solver = solver
+        self.expm = expm
+        self._propagators = {}
+
+    def __len__(self):
+        return len(self._propagators)
+
+    def clear(self):
+        self._propagators = {}
+
+    def predict(self, keys, theta, time, climate, init, b, d, leac):
+        """
+        Returns the model predictions x(t) for n rows, see mod5c_batch,
+        computing the propagators only for the keys not seen before
+
+        keys -- n hashable keys identifying the propagator of each row
+        """
+        props = self._propagators
+        missing = [i for i, key in enumerate(keys) if key not in props]
+        if missing:
+            if len(props) + len(missing) > self.max_size:
+                self.clear()
+                props = self._propagators
+                # the keys of the batch seen before were cleared too
+                missing = list(range(len(keys)))
+            M, G = propagator_batch(numpy.asarray(theta)[missing],
+                                    numpy.asarray(time)[missing],
+                                    numpy.asarray(climate)[missing],
+                                    numpy.asarray(d)[missing],
+                                    numpy.asarray(leac)[missing],
+                                    self.solver, self.expm)
+            for i, ind in enumerate(missing):
+                props[keys[ind]] = (M[i], G[i])
+        M = numpy.array([props[key][0] for key in keys])
+        G = numpy.array([props[key][1] for key in keys])
+        init = numpy.asarray(init, dtype=numpy.float64)
+        b = numpy.asarray(b, dtype=numpy.float64)
+        return _matvec(M, init) + _matvec(G, b)
+
+
+def coefficient_matrix(theta, climate, d, leac):
+    """
+    Computes the coefficient matrices A of the differential equation
+    x'(t) = A(theta)*x(t) + b for n rows at once. Returns the (n, 5, 5)
+    matrices and the combined temperature and precipitation term for the
+    AWE compartments.
+
+    theta -- (n, 35) model parameters
+    climate -- (n, 3) mean temperature, annual rainfall, temperature amplitude
+    d -- (n,) sizes of the woody material
+    leac -- (n,) leaching parameters
+    """
+    theta = numpy.asarray(theta, dtype=numpy.float64)
+    climate = numpy.asarray(climate, dtype=numpy.float64)
+    d = numpy.asarray(d, dtype=numpy.float64)
+    leac = numpy.asarray(leac, dtype=numpy.float64)
+    n = theta.shape[0]
+    te = climate[:, 0, None] + climate[:, 2, None] * _TE_WEIGHTS
+    # average temperature dependence
+    tem = numpy.exp(theta[:, 21, None] * te
+                    + theta[:, 22, None] * te ** 2).mean(axis=1)
+    temN = numpy.exp(theta[:, 23, None] * te
+                     + theta[:, 24, None] * te ** 2).mean(axis=1)
+    temH = numpy.exp(theta[:, 25, None] * te
+                     + theta[:, 26, None] * te ** 2).mean(axis=1)
+    # precipitation dependence
+    rain = climate[:, 1] / 1000.0
+    tem = tem * (1.0 - numpy.exp(theta[:, 27] * rain))
+    temN = temN * (1.0 - numpy.exp(theta[:, 28] * rain))
+    temH = temH * (1.0 - numpy.exp(theta[:, 29] * rain))
+    # size class dependence -- no effect if d == 0.0
+    size_dep = numpy.minimum(1.0, (1.0 + theta[:, 32] * d
+                                   + theta[:, 33] * d ** 2)
+                             ** (-numpy.abs(theta[:, 34])))
+    # decomposition rates of the AWEN compartments
+    rates = numpy.abs(theta[:, :4])
+    rates[:, :3] *= (tem * size_dep)[:, None]
+    rates[:, 3] *= temN * size_dep
+    A = numpy.zeros((n, 5, 5))
+    flows = theta[:, numpy.where(_P_INDEX < 0, 0, _P_INDEX)]
+    flows[:, numpy.arange(4), numpy.arange(4)] = -1.0
+    A[:, :4, :4] = flows * rates[:, None, :]
+    # mass flows AWEN -> H (size effect is present here)
+    A[:, 4, :4] = theta[:, 30, None] * rates
+    # no size effect in humus
+    A[:, 4, 4] = -numpy.abs(theta[:, 31]) * temH
+    # leaching (no leaching for humus)
+    diag = numpy.arange(4)
+    A[:, diag, diag] += (leac * rain)[:, None]
+    return A, tem
+
+
+def matrixexp(A):
+    """
+    Approximated matrix exponentials of the (n, k, k) matrices A using
+    Taylor series with scaling & squaring, see matrixexp in
+    y15_subroutine.f90
+    """
+    norm = numpy.sqrt((A ** 2).sum(axis=(1, 2)))
+    # the smallest j >= 1 for which norm < 2**j
+    squarings = numpy.maximum(1, numpy.floor(numpy.log2(
+                    numpy.maximum(norm, 1.0))) + 1).astype(int)
+    C = A / (2.0 ** squarings)[:, None, None]
+    B = numpy.eye(A.shape[1]) + C
+    D = C
+    for i in range(2, _TAYLOR_TERMS + 1):
+        D = numpy.matmul(C, D) / i
+        B = B + D
+    for i in range(squarings.max()):
+        square = squarings > i
+        B[square] = numpy.matmul(B[square], B[square])
+    return B
+
+
+def padeexp(A):
+    """
+    Matrix exponentials of the (n, k, k) matrices A using diagonal Pade
+    approximants with scaling & squaring, see padeexp in
+    y15_subroutine.f90. The rows are grouped by the degree their 1-norm
+    needs.
+    """
+    norm = numpy.abs(A).sum(axis=1).max(axis=1)
+    B = numpy.empty(A.shape)
+    done = numpy.zeros(len(A), dtype=bool)
+    for m, theta in zip(_PADE_DEGREES[:-1], _PADE_THETAS[:-1]):
+        rows = ~done & (norm <= theta)
+        if rows.any():
+            B[rows] = _pade(A[rows], m)
+            done |= rows
+    rows = ~done
+    if rows.any():
+        squarings = numpy.maximum(0, numpy.ceil(numpy.log2(
+                        norm[rows] / _PADE_THETAS[-1]))).astype(int)
+        R = _pade(A[rows] / (2.0 ** squarings)[:, None, None],
+                  _PADE_DEGREES[-1])
+        for i in range(squarings.max()):
+            square = squarings > i
+            R[square] = numpy.matmul(R[square], R[square])
+        B[rows] = R
+    return B
+
+
+def _pade(A, m):
+    """
+    The diagonal Pade approximants (V-U)^-1*(V+U) of degree m to the
+    exponentials of the (n, k, k) matrices A
+    """
+    c = _PADE_COEFFICIENTS[m]
+    eye = numpy.eye(A.shape[1])
+    A2 = numpy.matmul(A, A)
+    if m == 13:
+        A4 = numpy.matmul(A2, A2)
+        A6 = numpy.matmul(A4, A2)
+        W = numpy.matmul(A6, c[13] * A6 + c[11] * A4 + c[9] * A2) \
+            + c[7] * A6 + c[5] * A4 + c[3] * A2 + c[1] * eye
+        V = numpy.matmul(A6, c[12] * A6 + c[10] * A4 + c[8] * A2) \
+            + c[6] * A6 + c[4] * A4 + c[2] * A2 + c[0] * eye
+    else:
+        V = c[0] * eye + c[2] * A2
+        W = c[1] * eye + c[3] * A2
+        power = A2
+        for k in range(4, m, 2):
+            power = numpy.matmul(power, A2)
+            V = V + c[k] * power
+            W = W + c[k+1] * power
+    U = numpy.matmul(A, W)
+    return numpy.linalg.solve(V - U, V + U)
+
+
+def _matrixexp(A, expm):
+    """
+    Matrix exponentials of the (n, k, k) matrices A by the method expm
+    """
+    if expm == PADE:
+        return padeexp(A)
+    return matrixexp(A)
+
+
+def _matvec(A, x):
+    """
+    Row-wise matrix-vector products of (n, k, k) and (n, k) arrays
+    """
+    return numpy.matmul(A, x[:, :, None])[:, :, 0]
+
+
+def _solve(A, b):
+    """
+    Solves the (n, k, k) linear systems A*x = b
+    """
+    return numpy.linalg.solve(A, b[:, :, None])[:, :, 0]
@@ -8,7 +8,7 @@
 MODULE yasso
 IMPLICIT NONE
 CONTAINS
-SUBROUTINE mod5c(theta,time,climate,init,b,d,leac,xt,steadystate_pred)
+SUBROUTINE mod5c(theta,time,climate,init,b,d,leac,xt,steadystate_pred,solver,expm)
 IMPLICIT NONE
     !********************************************* &
     ! GENERAL DESCRIPTION FOR ALL THE MEASUREMENTS
@@ -23,6 +23,9 @@ IMPLICIT NONE
     ! 31-32 Humus decomposition parameters: p_H, alpha_H (Note the order!)
     ! 33-35 Woody parameters: theta_1, theta_2, r
 
+    ! the wrapper releases the GIL during the call, so Python threads can run
+    ! the model concurrently; nothing is saved between calls
+    !f2py threadsafe
     REAL,DIMENSION(35),INTENT(IN) :: theta ! parameters
     REAL,INTENT(IN) :: time,d,leac ! time,size,leaching
     REAL,DIMENSION(3),INTENT(IN) :: climate ! climatic conditions
@@ -31,18 +34,29 @@ IMPLICIT NONE
     REAL,DIMENSION(5),INTENT(OUT) :: xt ! the result i.e. x(t)
     LOGICAL,OPTIONAL,INTENT(IN) :: steadystate_pred ! set to true if ignore 'time' and compute solution 
     ! in steady-state conditions (which sould give equal solution as if time is set large enough)
+    INTEGER,OPTIONAL,INTENT(IN) :: solver ! 0 (default) solves the 5x5 system densely,
+    ! 1 uses the block structure of A, see block_solution
+    INTEGER,OPTIONAL,INTENT(IN) :: expm ! matrix exponential: 0 (default) Taylor series,
+    ! see matrixexp, 1 Pade approximant, see padeexp
     REAL,DIMENSION(5,5) :: A,At,mexpAt
-    INTEGER :: i
+    INTEGER :: i,method
     REAL,PARAMETER :: pi = 3.141592653589793
     REAL :: tem,temN,temH,size_dep
     REAL,DIMENSION(5) :: te
     REAL,DIMENSION(5) :: z1,z2
     REAL,PARAMETER :: tol = 1E-12
-    LOGICAL :: ss_pred = .FALSE.
+    LOGICAL :: ss_pred,solved
 
+    ! no initialisation in the declaration, it would imply SAVE and the
+    ! flag would leak from one call to the next
+    ss_pred = .FALSE.
 	IF(PRESENT(steadystate_pred)) THEN
         ss_pred = steadystate_pred
     ENDIF
+    method = 0
+    IF(PRESENT(expm)) THEN
+        method = expm
+    ENDIF
 
     !#########################################################################
     ! Compute the coefficient matrix A for the differential equation
@@ -112,6 +126,13 @@ IMPLICIT NONE
     !#########################################################################
     ! Solve the differential equation x'(t) = A(theta)*x(t) + b, x(0) = init
 
+    IF(PRESENT(solver)) THEN
+        IF(solver == 1) THEN
+            CALL block_solution(A,time,init,b,ss_pred,method,xt,solved)
+            IF(solved) RETURN
+        END IF
+    END IF
+
 	IF(ss_pred) THEN
 		! Solve DE directly in steady state conditions (time = infinity)
 		! using the formula 0 = x'(t) = A*x + b => x = -A^-1*b
@@ -120,25 +141,207 @@ IMPLICIT NONE
 		! Solve DE in given time
 		z1 = MATMUL(A,init) + b
 		At = A*time !At = A*t
-		CALL matrixexp(At,mexpAt)
+		CALL expmat(At,mexpAt,method)
 		z2 = MATMUL(mexpAt,z1) - b
 		CALL solve(A,z2,xt) ! now it can be assumed A is non-singular
     ENDIF
 
     END SUBROUTINE mod5c
 
+SUBROUTINE mod5c_batch(theta,time,climate,init,b,d,leac,xt,steadystate_pred,solver,expm,threads,n)
+!$ USE omp_lib
+IMPLICIT NONE
+    !********************************************* &
+    ! Vectorized entry point for mod5c
+    !********************************************* &
+    ! runs mod5c for n independent rows of parameters, climate, initial
+    ! state and infall in a single call, so that the caller crosses the
+    ! Python/Fortran boundary once per timestep instead of once per row
+    ! row i of every argument corresponds to one call of mod5c
+    ! the rows are independent, compiled with OpenMP (-fopenmp) they are run
+    ! in parallel threads, otherwise threads is ignored
+
+    !f2py threadsafe
+    INTEGER,INTENT(IN) :: n ! number of rows
+    REAL,DIMENSION(n,35),INTENT(IN) :: theta ! parameters
+    REAL,DIMENSION(n),INTENT(IN) :: time,d,leac ! time,size,leaching
+    REAL,DIMENSION(n,3),INTENT(IN) :: climate ! climatic conditions
+    REAL,DIMENSION(n,5),INTENT(IN) :: init ! initial states
+    REAL,DIMENSION(n,5),INTENT(IN) :: b ! infalls
+    REAL,DIMENSION(n,5),INTENT(OUT) :: xt ! the results i.e. x(t)
+    LOGICAL,INTENT(IN) :: steadystate_pred ! see mod5c
+    INTEGER,OPTIONAL,INTENT(IN) :: solver,expm ! see mod5c
+    INTEGER,OPTIONAL,INTENT(IN) :: threads ! number of OpenMP threads, 0 (default)
+    ! for the OpenMP default, e.g. OMP_NUM_THREADS
+    REAL,DIMENSION(5) :: row
+    INTEGER :: i,solv,method,nthreads
+
+    solv = 0
+    IF(PRESENT(solver)) THEN
+        solv = solver
+    ENDIF
+    method = 0
+    IF(PRESENT(expm)) THEN
+        method = expm
+    ENDIF
+    nthreads = 0
+    IF(PRESENT(threads)) THEN
+        nthreads = threads
+    ENDIF
+    !$ IF(nthreads < 1) nthreads = omp_get_max_threads()
+    !$OMP PARALLEL DO PRIVATE(row) NUM_THREADS(nthreads) SCHEDULE(STATIC)
+    DO i = 1,n
+        CALL mod5c(theta(i,:),time(i),climate(i,:),init(i,:),b(i,:),d(i), &
+                   leac(i),row,steadystate_pred,solv,method)
+        xt(i,:) = row
+    END DO
+    !$OMP END PARALLEL DO
+    END SUBROUTINE mod5c_batch
+
+SUBROUTINE mod5c_trajectory(theta,time,climate,init,b,d,leac,xt,area,solver,expm,t)
+IMPLICIT NONE
+    !********************************************* &
+    ! Whole trajectory entry point for mod5c
+    !********************************************* &
+    ! runs mod5c through t consecutive timesteps of one parameter set and
+    ! size class, the state at the end of each timestep is the initial
+    ! state of the next, so that the caller crosses the Python/Fortran
+    ! boundary once per trajectory instead of once per timestep
+    ! xt(1,:) is the initial state and xt(k+1,:) the state at the end of
+    ! timestep k, the relative area change area(k) scales the state at the
+    ! end of timestep k before it is passed on to timestep k+1
+
+    !f2py threadsafe
+    INTEGER,INTENT(IN) :: t ! number of timesteps
+    REAL,DIMENSION(35),INTENT(IN) :: theta ! parameters
+    REAL,DIMENSION(t),INTENT(IN) :: time ! durations of the timesteps
+    REAL,INTENT(IN) :: d,leac ! size,leaching
+    REAL,DIMENSION(t,3),INTENT(IN) :: climate ! climatic conditions
+    REAL,DIMENSION(5),INTENT(IN) :: init ! initial state
+    REAL,DIMENSION(t,5),INTENT(IN) :: b ! infalls of the timesteps
+    REAL,DIMENSION(t+1,5),INTENT(OUT) :: xt ! the trajectory
+    REAL,DIMENSION(t),OPTIONAL,INTENT(IN) :: area ! relative area changes,
+    ! by default none, f2py passes the omitted array as ones
+    !f2py real dimension(t),optional,intent(in) :: area = 1.0
+    INTEGER,OPTIONAL,INTENT(IN) :: solver,expm ! see mod5c
+    REAL,DIMENSION(5) :: x,row
+    INTEGER :: k,solv,method
+
+    solv = 0
+    IF(PRESENT(solver)) THEN
+        solv = solver
+    ENDIF
+    method = 0
+    IF(PRESENT(expm)) THEN
+        method = expm
+    ENDIF
+    x = init
+    xt(1,:) = init
+    DO k = 1,t
+        CALL mod5c(theta,time(k),climate(k,:),x,b(k,:),d,leac,row, &
+                   .FALSE.,solv,method)
+        xt(k+1,:) = row
+        x = row
+        IF(PRESENT(area)) THEN
+            x = row*area(k)
+        ENDIF
+    END DO
+    END SUBROUTINE mod5c_trajectory
+
+SUBROUTINE block_solution(A,time,init,b,ss_pred,method,xt,solved)
+IMPLICIT NONE
+    ! Solves x'(t) = A*x(t) + b, x(0) = init using the block structure of A:
+    ! nothing flows from humus to AWEN, A(1:4,5) = 0, so only the 4x4 AWEN
+    ! block B is exponentiated. With w = -B^-1*b(1:4) the AWEN steady state,
+    !   x(1:4)(t) = exp(B*t)*(init(1:4)-w) + w
+    ! and humus with the rate l = A(5,5) and the inflows h = A(5,1:4) is the
+    ! scalar convolution
+    !   x5(t) = exp(l*t)*init(5) + int_0^t exp(l*(t-s))*(h.x(1:4)(s) + b(5)) ds
+    !         = exp(l*t)*init(5) + h.g + (exp(l*t)-1)/l*(h.w + b(5))
+    ! where (B - l*I)*g = (exp(B*t) - exp(l*t)*I)*(init(1:4)-w). The factor
+    ! of the slow humus is computed without the cancellation of the dense
+    ! solution. solved is false if l is too close to an eigenvalue of B for
+    ! g, the dense solution should be used then. method is the matrix
+    ! exponential, see expmat.
+    REAL,DIMENSION(5,5),INTENT(IN) :: A
+    REAL,INTENT(IN) :: time
+    REAL,DIMENSION(5),INTENT(IN) :: init,b
+    LOGICAL,INTENT(IN) :: ss_pred
+    INTEGER,INTENT(IN) :: method
+    REAL,DIMENSION(5),INTENT(OUT) :: xt
+    LOGICAL,INTENT(OUT) :: solved
+    REAL,DIMENSION(4,4) :: Bt,mexpBt,Bl,U
+    REAL,DIMENSION(4) :: w,x0,v,c,g
+    REAL :: l,el,phi,th
+    INTEGER :: i
+    REAL,PARAMETER :: restol = 1E-3 ! smallest pivot of B - l*I relative to B
+
+    solved = .TRUE.
+    l = A(5,5)
+    CALL solve(-A(1:4,1:4), b(1:4), w)
+    IF(ss_pred) THEN
+        xt(1:4) = w
+        xt(5) = -(DOT_PRODUCT(A(5,1:4),w) + b(5))/l
+        RETURN
+    ENDIF
+
+    x0 = init(1:4) - w
+    Bt = A(1:4,1:4)*time
+    CALL expmat(Bt,mexpBt,method)
+    xt(1:4) = MATMUL(mexpBt,x0) + w
+
+    el = EXP(l*time)
+    Bl = A(1:4,1:4)
+    DO i = 1,4
+        Bl(i,i) = Bl(i,i) - l
+    END DO
+    v = xt(1:4) - w - el*x0
+    CALL pgauss(Bl, v, U, c)
+    IF (MINVAL(ABS((/ (U(i,i), i = 1,4) /))) <= restol*MAXVAL(ABS(A(1:4,1:4)))) THEN
+        solved = .FALSE.
+        RETURN
+    END IF
+    CALL backsubst(U, c, g)
+
+    ! (exp(l*t)-1)/l, for small l*t as 2*tanh(l*t/2)/(1-tanh(l*t/2))/l
+    ! which does not lose the digits of exp(l*t)-1
+    IF (l == 0.0) THEN
+        phi = time
+    ELSE IF (ABS(l*time) < 0.5) THEN
+        th = TANH(l*time/2.0)
+        phi = 2.0*th/(1.0-th)/l
+    ELSE
+        phi = (el-1.0)/l
+    END IF
+    xt(5) = el*init(5) + DOT_PRODUCT(A(5,1:4),g) + phi*(DOT_PRODUCT(A(5,1:4),w) + b(5))
+    END SUBROUTINE block_solution
+
     !#########################################################################
     ! Functions for solving the diff. equation, adapted for the Yasso case
+    SUBROUTINE expmat(A,B,method)
+        ! Matrix exponential B = exp(A) by method, 1 for padeexp, otherwise
+        ! matrixexp
+        IMPLICIT NONE
+        REAL,DIMENSION(:,:),INTENT(IN) :: A
+        REAL,DIMENSION(SIZE(A,1),SIZE(A,1)),INTENT(OUT) :: B
+        INTEGER,INTENT(IN) :: method
+        IF (method == 1) THEN
+            CALL padeexp(A,B)
+        ELSE
+            CALL matrixexp(A,B)
+        END IF
+    END SUBROUTINE expmat
+
     SUBROUTINE matrixexp(A,B)
         IMPLICIT NONE
         ! Approximated matrix exponential using Taylor series with scaling & squaring
         ! Accurate enough for the Yasso case
-        INTEGER,PARAMETER :: n = 5
-        REAL,DIMENSION(n,n),INTENT(IN) :: A
-        REAL,DIMENSION(n,n),INTENT(OUT) :: B
-        REAL,DIMENSION(n,n) :: C,D
+        REAL,DIMENSION(:,:),INTENT(IN) :: A
+        REAL,DIMENSION(SIZE(A,1),SIZE(A,1)),INTENT(OUT) :: B
+        REAL,DIMENSION(SIZE(A,1),SIZE(A,1)) :: C,D
         REAL :: p,normiter
-        INTEGER :: i,q,j
+        INTEGER :: i,q,j,n
+        n = SIZE(A,1)
         q = 10 ! #terms in Taylor
         B = 0.0
         DO i = 1,n
@@ -167,13 +370,122 @@ IMPLICIT NONE
         END DO
     END SUBROUTINE matrixexp
 
+    SUBROUTINE padeexp(A,B)
+        ! Matrix exponential using a diagonal Pade approximant with scaling &
+        ! squaring, Higham (2005) The scaling and squaring method for the
+        ! matrix exponential revisited. The degree m and the number of
+        ! squarings s are the smallest for which the backward error bound of
+        ! the approximant of A/2**s is below the unit roundoff of REAL, found
+        ! from the 1-norm of A, so that short timesteps take few matrix
+        ! products and long ones are not squared more than needed.
+        IMPLICIT NONE
+        REAL,DIMENSION(:,:),INTENT(IN) :: A
+        REAL,DIMENSION(SIZE(A,1),SIZE(A,1)),INTENT(OUT) :: B
+        REAL,DIMENSION(SIZE(A,1),SIZE(A,1)) :: As
+        INTEGER,DIMENSION(5),PARAMETER :: degrees = (/3,5,7,9,13/)
+        ! the largest 1-norms for which the degrees are accurate enough in
+        ! single and double precision, in single precision 7 at most
+        REAL,DIMENSION(3),PARAMETER :: theta_single = &
+            (/4.258730016922831E-1, 1.880152677804762E0, 3.925724783138660E0/)
+        REAL,DIMENSION(5),PARAMETER :: theta_double = &
+            (/1.495585217958292E-2, 2.539398330063230E-1, 9.504178996162932E-1, &
+              2.097847961257068E0, 5.371920351148152E0/)
+        REAL,DIMENSION(5) :: thetas
+        REAL :: norm
+        INTEGER :: i,m,s,ndeg
+
+        IF (EPSILON(1.0) > 1E-10) THEN
+            ndeg = 3
+            thetas(1:3) = theta_single
+        ELSE
+            ndeg = 5
+            thetas = theta_double
+        END IF
+        norm = MAXVAL(SUM(ABS(A),1))
+        DO i = 1,ndeg
+            IF (norm <= thetas(i)) THEN
+                CALL pade(A,degrees(i),B)
+                RETURN
+            END IF
+        END DO
+        m = degrees(ndeg)
+        s = MAX(0,CEILING(LOG(norm/thetas(ndeg))/LOG(2.0)))
+        As = A/2.0**s ! scale
+        CALL pade(As,m,B)
+        DO i = 1,s ! square
+            B = MATMUL(B,B)
+        END DO
+    END SUBROUTINE padeexp
+
+    SUBROUTINE pade(A,m,R)
+        ! Diagonal Pade approximant R = (V-U)^-1*(V+U) of degree m (3, 5, 7, 9
+        ! or 13) to exp(A), U and V are the odd and the even terms
+        IMPLICIT NONE
+        REAL,DIMENSION(:,:),INTENT(IN) :: A
+        INTEGER,INTENT(IN) :: m
+        REAL,DIMENSION(SIZE(A,1),SIZE(A,1)),INTENT(OUT) :: R
+        REAL,DIMENSION(SIZE(A,1),SIZE(A,1)) :: A2,A4,A6,Ap,U,V,W
+        DOUBLE PRECISION,DIMENSION(14) :: c
+        INTEGER :: i,k,n
+
+        n = SIZE(A,1)
+        SELECT CASE (m)
+        CASE (3)
+            c(1:4) = (/120D0, 60D0, 12D0, 1D0/)
+        CASE (5)
+            c(1:6) = (/30240D0, 15120D0, 3360D0, 420D0, 30D0, 1D0/)
+        CASE (7)
+            c(1:8) = (/17297280D0, 8648640D0, 1995840D0, 277200D0, 25200D0, &
+                       1512D0, 56D0, 1D0/)
+        CASE (9)
+            c(1:10) = (/17643225600D0, 8821612800D0, 2075673600D0, 302702400D0, &
+                        30270240D0, 2162160D0, 110880D0, 3960D0, 90D0, 1D0/)
+        CASE DEFAULT
+            c = (/64764752532480000D0, 32382376266240000D0, 7771770303897600D0, &
+                  1187353796428800D0, 129060195264000D0, 10559470521600D0, &
+                  670442572800D0, 33522128640D0, 1323241920D0, 40840800D0, &
+                  960960D0, 16380D0, 182D0, 1D0/)
+        END SELECT
+        A2 = MATMUL(A,A)
+        IF (m == 13) THEN
+            A4 = MATMUL(A2,A2)
+            A6 = MATMUL(A4,A2)
+            W = MATMUL(A6,REAL(c(14))*A6 + REAL(c(12))*A4 + REAL(c(10))*A2) &
+                + REAL(c(8))*A6 + REAL(c(6))*A4 + REAL(c(4))*A2
+            V = MATMUL(A6,REAL(c(13))*A6 + REAL(c(11))*A4 + REAL(c(9))*A2) &
+                + REAL(c(7))*A6 + REAL(c(5))*A4 + REAL(c(3))*A2
+            DO i = 1,n
+                W(i,i) = W(i,i) + REAL(c(2))
+                V(i,i) = V(i,i) + REAL(c(1))
+            END DO
+        ELSE
+            ! V = sum of c(k+1)*A**k over even k, W*A the odd terms
+            V = 0.0
+            W = 0.0
+            DO i = 1,n
+                V(i,i) = REAL(c(1))
+                W(i,i) = REAL(c(2))
+            END DO
+            Ap = A2
+            DO k = 2,m-1,2
+                IF (k > 2) THEN
+                    Ap = MATMUL(Ap,A2)
+                END IF
+                V = V + REAL(c(k+1))*Ap
+                W = W + REAL(c(k+2))*Ap
+            END DO
+        END IF
+        U = MATMUL(A,W)
+        CALL msolve(V-U, V+U, R)
+    END SUBROUTINE pade
+
     SUBROUTINE matrixnorm(A,B)
         !returns elementwise (i.e. Frobenius) norm of a square matrix
         IMPLICIT NONE
-        INTEGER,PARAMETER :: n = 5
-        REAL,DIMENSION(n,n),INTENT(IN) :: A
+        REAL,DIMENSION(:,:),INTENT(IN) :: A
         REAL,INTENT(OUT) :: b
-        INTEGER :: i
+        INTEGER :: i,n
+        n = SIZE(A,1)
         b = 0.0
         DO i = 1,n
             b = b+SUM(A(:,i)**2.0)
@@ -185,36 +497,83 @@ IMPLICIT NONE
     SUBROUTINE solve(A, b, x)
         ! Solve linear system A*x = b
         IMPLICIT NONE
-        INTEGER,PARAMETER :: n = 5
-        REAL,DIMENSION(n,n),INTENT(IN) :: A
-        REAL,DIMENSION(n),INTENT(IN) :: b
-        REAL,DIMENSION(n),INTENT(OUT) :: x
-        REAL,DIMENSION(n,n) :: U
-        REAL,DIMENSION(n) :: c
-        INTEGER :: i
+        REAL,DIMENSION(:,:),INTENT(IN) :: A
+        REAL,DIMENSION(SIZE(A,1)),INTENT(IN) :: b
+        REAL,DIMENSION(SIZE(A,1)),INTENT(OUT) :: x
+        REAL,DIMENSION(SIZE(A,1),SIZE(A,1)) :: U
+        REAL,DIMENSION(SIZE(A,1)) :: c
 
         ! transform the problem to upper diagonal form
         CALL pgauss(A, b, U, c)
 
         ! solve U*x = c via back substitution
+        CALL backsubst(U, c, x)
+    END SUBROUTINE solve
+
+    SUBROUTINE backsubst(U, c, x)
+        ! Solve the upper diagonal system U*x = c via back substitution
+        IMPLICIT NONE
+        REAL,DIMENSION(:,:),INTENT(IN) :: U
+        REAL,DIMENSION(SIZE(U,1)),INTENT(IN) :: c
+        REAL,DIMENSION(SIZE(U,1)),INTENT(OUT) :: x
+        INTEGER :: i,n
+        n = SIZE(U,1)
         x(n) = c(n)/U(n,n)
         DO i = n-1,1,-1
             x(i) = (c(i) - DOT_PRODUCT(U(i,i+1:n),x(i+1:n)))/U(i,i)
         END DO
-    END SUBROUTINE solve
+    END SUBROUTINE backsubst
+
+    SUBROUTINE msolve(A, B, X)
+        ! Solve the linear systems A*X = B of the columns of B with gaussian
+        ! elimination with pivoting, see pgauss
+        IMPLICIT NONE
+        REAL,DIMENSION(:,:),INTENT(IN) :: A,B
+        REAL,DIMENSION(SIZE(B,1),SIZE(B,2)),INTENT(OUT) :: X
+        REAL,DIMENSION(SIZE(A,1),SIZE(A,1)) :: U
+        REAL,DIMENSION(SIZE(A,1)) :: urow
+        REAL,DIMENSION(SIZE(B,2)) :: xrow
+        INTEGER :: k, j, q, n
+
+        n = SIZE(A,1)
+        U = A
+        X = B
+        DO k = 1,n-1
+            q = k-1+MAXLOC(ABS(U(k:n,k)),1)
+            IF (q /= k) THEN
+                urow = U(k,:)
+                U(k,:) = U(q,:)
+                U(q,:) = urow
+                xrow = X(k,:)
+                X(k,:) = X(q,:)
+                X(q,:) = xrow
+            END IF
+            U(k+1:n,k) = U(k+1:n,k)/U(k,k)
+            DO j = k+1,n
+                U(j,k+1:n) = U(j,k+1:n) - U(j,k)*U(k,k+1:n)
+                X(j,:) = X(j,:) - U(j,k)*X(k,:)
+            END DO
+        END DO
+        ! back substitution
+        DO j = 1,SIZE(B,2)
+            DO k = n,1,-1
+                X(k,j) = (X(k,j) - DOT_PRODUCT(U(k,k+1:n),X(k+1:n,j)))/U(k,k)
+            END DO
+        END DO
+    END SUBROUTINE msolve
 
     SUBROUTINE pgauss(A, b, U, c)
         ! Transform the lin. system to upper diagonal form using gaussian elimination
         ! with pivoting
         IMPLICIT NONE
-        INTEGER,PARAMETER :: n = 5
-        REAL,DIMENSION(n,n),INTENT(IN) :: A
-        REAL,DIMENSION(n),INTENT(IN) :: b
-        REAL,DIMENSION(n,n),INTENT(OUT) :: U
-        REAL,DIMENSION(n),INTENT(OUT) :: c
-        INTEGER :: k, j
+        REAL,DIMENSION(:,:),INTENT(IN) :: A
+        REAL,DIMENSION(SIZE(A,1)),INTENT(IN) :: b
+        REAL,DIMENSION(SIZE(A,1),SIZE(A,1)),INTENT(OUT) :: U
+        REAL,DIMENSION(SIZE(A,1)),INTENT(OUT) :: c
+        INTEGER :: k, j, n
         REAL,PARAMETER :: tol = 1E-12
 
+        n = SIZE(A,1)
         U = A
         c = b
         DO k = 1,n-1
@@ -233,12 +592,12 @@ IMPLICIT NONE
     SUBROUTINE pivot(A, b, k)
         ! perform pivoting to matrix A and vector b at row k
         IMPLICIT NONE
-        INTEGER,PARAMETER :: n = 5
-        REAL,DIMENSION(n,n),INTENT(INOUT) :: A
-        REAL,DIMENSION(n),INTENT(INOUT) :: b
+        REAL,DIMENSION(:,:),INTENT(INOUT) :: A
+        REAL,DIMENSION(SIZE(A,1)),INTENT(INOUT) :: b
         INTEGER,INTENT(IN) :: k
-        INTEGER :: q, pk
+        INTEGER :: q, pk, n
 
+        n = SIZE(A,1)
         !write(*,*) 'Pivot elements are: ', A(k:n,k)
         q = MAXLOC(ABS(A(k:n,k)),1)
         !write(*,*) q
@@ -1,10 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
-from collections import defaultdict
 import ConfigParser
 import codecs
-import re
 import sys
 import os
 import glob
@@ -15,15 +13,16 @@ sys.stderr = codecs.open('yasso_stderr.log', 'w', 'utf8')
 
 from numpy import empty, float32
 
-from traits.api import Array, Button, Enum, Float, HasTraits,\
-    Instance, Int, List, Range, Str
+from traits.api import Any, Array, Button, Enum, Float, HasTraits,\
+    Instance, Int, Range, Str
     
 from traitsui.api import CodeEditor, Group, HGroup, VGroup, Item,\
     Label, spring, TabularEditor, View, EnumEditor
 from traitsui.menu import \
     UndoAction, RedoAction, RevertAction, CloseAction, \
     Menu, MenuBar, NoButtons
-from pyface.api import FileDialog, OK as Pyface_OK
+from pyface.api import DirectoryDialog, FileDialog, ProgressDialog,\
+    OK as Pyface_OK
 from traitsui.message import error
 from traits.trait_errors import TraitError
 from traitsui.tabular_adapter import TabularAdapter
@@ -31,6 +30,12 @@ from chaco.api import ArrayPlotData, Plot, GridContainer
 from enable.component_editor import ComponentEditor
 
 from modelcall import ModelRunner
+from modeldata import check_settings, write_arrays, write_moments,\
+    write_results, values_array, AreaChange, ConstantClimate as ConstantClimateRecord,\
+    LitterComponent, MonthlyClimate, TimedLitterComponent, YearlyClimate,\
+    AREA_CHANGE_ERRMSG, CONSTANT_CLIMATE_ERRMSG, LITTER_ERRMSG,\
+    MONTHLY_CLIMATE_ERRMSG, TIMED_LITTER_ERRMSG, YEARLY_CLIMATE_ERRMSG
+from datafile import SectionReader
 import sys
 
 def open_file():
@@ -51,6 +56,13 @@ def save_file():
         return dialog.path
     return ''
 
+def save_directory():
+    dialog = DirectoryDialog(message='Select the directory to save into',
+        new_directory=True)
+    if dialog.open() == Pyface_OK:
+        return dialog.path
+    return ''
+
 APP_INFO="""
 For detailed information, including a user's manual, see:
 http://www.syke.fi/projects/yasso
@@ -153,52 +165,15 @@ def _get_parameter_files():
 # Basic data container classes
 ###############################################################################
 
-class LitterComponent(HasTraits):
-    mass = Float()
-    mass_std = Float()
-    acid = Range(low=0.0, high=100.0)
-    acid_std = Float()
-    water = Range(low=0.0, high=100.0)
-    water_std = Float()
-    ethanol = Range(low=0.0, high=100.0)
-    ethanol_std = Float()
-    non_soluble = Range(low=0.0, high=100.0)
-    non_soluble_std = Float()
-    humus = Range(low=0.0, high=100.0)
-    humus_std = Float()
-    size_class = Float(default=0.0)
-
-class TimedLitterComponent(HasTraits):
-    timestep = Int()
-    mass = Float()
-    mass_std = Float()
-    acid = Range(low=0.0, high=100.0)
-    acid_std = Float()
-    water = Range(low=0.0, high=100.0)
-    water_std = Float()
-    ethanol = Range(low=0.0, high=100.0)
-    ethanol_std = Float()
-    non_soluble = Range(low=0.0, high=100.0)
-    non_soluble_std = Float()
-    humus = Range(low=0.0, high=100.0)
-    humus_std = Float()
-    size_class = Float(default_value=0.0)
-
-class AreaChange(HasTraits):
-    timestep = Int()
-    rel_change = Float()
-
-class YearlyClimate(HasTraits):
-    timestep = Int()
+# The data sections are numpy record arrays with the fields of the records
+# in modeldata, shown in the tables as such. The constant climate is shown
+# field by field.
+
+class ConstantClimate(HasTraits):
     mean_temperature = Float()
     annual_rainfall = Float()
     variation_amplitude = Float()
 
-class MonthlyClimate(HasTraits):
-    month = Int()
-    temperature = Float()
-    rainfall = Float()
-
 ###############################################################################
 # Table editors
 ###############################################################################
@@ -208,7 +183,6 @@ class MonthlyClimateAdapter(TabularAdapter):
     columns = [('month', 'month'), ('temperature', 'temperature'),
                ('rainfall', 'rainfall')]
     font  = 'Arial 9'
-    default_value = MonthlyClimate()
 
 monthly_climate_te = TabularEditor(
     adapter = MonthlyClimateAdapter(),
@@ -220,7 +194,6 @@ class YearlyClimateAdapter(TabularAdapter):
                ('annual rainfall', 'annual_rainfall'),
                ('temp variation amplitude', 'variation_amplitude')]
     font  = 'Arial 9'
-    default_value = YearlyClimate()
 
 yearly_climate_te = TabularEditor(
     adapter = YearlyClimateAdapter(),
@@ -238,7 +211,6 @@ class LitterAdapter(TabularAdapter):
     font = 'Arial 9'
     acid_width = 50
     acid_std_width = 50
-    default_value = LitterComponent()
 
 litter_te = TabularEditor(
     adapter = LitterAdapter(),
@@ -249,7 +221,6 @@ class ChangeAdapter(TabularAdapter):
     columns = [('timestep', 'timestep'),
                ('relative change in area', 'rel_change')]
     font = 'Arial 9'
-    default_value = AreaChange()
 
 change_te = TabularEditor(
     adapter = ChangeAdapter(),
@@ -267,7 +238,6 @@ class TimedLitterAdapter(TabularAdapter):
     font = 'Arial 9'
     acid_width = 50
     acid_std_width = 50
-    default_value = TimedLitterComponent()
 
 timed_litter_te = TabularEditor(
     adapter = TimedLitterAdapter(),
@@ -314,37 +284,28 @@ class Yasso(HasTraits):
     leaching = Float()
     # Initial condition
     initial_mode = Enum(['non zero', 'zero', 'steady state'])
-    initial_litter = List(trait=LitterComponent)
-    steady_state = List(trait=LitterComponent)
+    initial_litter = Any(values_array([], LitterComponent))
+    steady_state = Any(values_array([], LitterComponent))
     # Litter input at each timestep in the simulation
     litter_mode = Enum(['zero', 'yearly', 'constant yearly', 'monthly'])
-    constant_litter = List(trait=LitterComponent)
-    monthly_litter = List(trait=TimedLitterComponent)
-    yearly_litter = List(trait=TimedLitterComponent)
-    zero_litter = List(trait=LitterComponent) # Assumes that this defaults to 0
+    constant_litter = Any(values_array([], LitterComponent))
+    monthly_litter = Any(values_array([], TimedLitterComponent))
+    yearly_litter = Any(values_array([], TimedLitterComponent))
+    # Assumes that this defaults to 0
+    zero_litter = Any(values_array([], LitterComponent))
     woody_size_limit = Float(default_value=3.0)
-    area_change = List(trait=AreaChange)
+    area_change = Any(values_array([], AreaChange))
     # Climate definition for the simulation
     climate_mode = Enum(['yearly', 'constant yearly', 'monthly'])
-    constant_climate = YearlyClimate()
-    monthly_climate = List(trait=MonthlyClimate,
-            value=[MonthlyClimate(month=1),
-                   MonthlyClimate(month=2),
-                   MonthlyClimate(month=3),
-                   MonthlyClimate(month=4),
-                   MonthlyClimate(month=5),
-                   MonthlyClimate(month=6),
-                   MonthlyClimate(month=7),
-                   MonthlyClimate(month=8),
-                   MonthlyClimate(month=9),
-                   MonthlyClimate(month=10),
-                   MonthlyClimate(month=11),
-                   MonthlyClimate(month=12)]
-            )
-    yearly_climate = List(trait=YearlyClimate)
+    constant_climate = ConstantClimate()
+    monthly_climate = Any(values_array([[m, 0., 0.] for m in range(1, 13)],
+                                       MonthlyClimate))
+    yearly_climate = Any(values_array([], YearlyClimate))
     # All data as text
     all_data = Str()
     data_file = Str()
+    # the sections of all_data read
+    section_reader = Instance(SectionReader, ())
     # How the model will be run
     sample_size = Int()
     duration_unit = Enum(['year', 'month'])
@@ -361,6 +322,7 @@ class Yasso(HasTraits):
     modelrun_event = Button('Run model')
     save_result_event = Button('Save raw results...')
     save_moment_event = Button('Save moment results...')
+    save_binary_event = Button('Save binary results...')
     # and the results stored
     # Individual model calls
     #     iteration,time, total, woody, acid, water, ethanol, non_soluble, humus
@@ -542,6 +504,7 @@ class Yasso(HasTraits):
                      emphasized=True, ),
                 Item('save_result_event', show_label=False,),
                 Item('save_moment_event', show_label=False,),
+                Item('save_binary_event', show_label=False,),
                 ),
             HGroup(
                 Item('presentation_type', style='custom', label='As',
@@ -790,30 +753,11 @@ class Yasso(HasTraits):
         pdir = os.path.join(exedir, 'param')
         parfile = os.path.join(pdir, '%s.dat' % self.parameter_set)
         
-        if self.initial_mode=='zero' and self.litter_mode=='zero':
-            errmsg = ("Both soil carbon input and initial state may not be "
-                     "zero simultaneously.")
-            error(errmsg, title='Invalid model parameters', buttons=['OK'])
-            return
-        
-        if self.climate_mode=='yearly' and not self.yearly_climate:
-            errmsg = ("Climate mode may not be 'yearly' if there are no "
-                      "yearly climate entries in the data file.")
-            error(errmsg, title='Invalid model parameters', buttons=['OK'])
-            return
-
-        if self.leaching>0:
-            errmsg = ("Leaching parameter may not be larger than 0.")
-            error(errmsg, title='Invalid model parameters', buttons=['OK'])
-            return
-        
-        if self.climate_mode=='monthly' and not self.monthly_climate:
-            errmsg = ("Climate mode may not be 'monthly' if there are no "
-                      "monthly climate entries in the data file.")
+        errmsg = check_settings(self)
+        if errmsg is not None:
             error(errmsg, title='Invalid model parameters', buttons=['OK'])
             return
             
-            
         yassorunner = ModelRunner(parfile)
         
         if not yassorunner.is_usable_parameter_file():
@@ -827,8 +771,20 @@ class Yasso(HasTraits):
             steady_state = self.yassorunner.compute_steady_state(self)
             self._set_steady_state(steady_state)
         self._init_results()
+        msg = "Simulating %d samples for %d timesteps" % (self.sample_size,
+                                                    self.simulation_length)
+        progress = ProgressDialog(title="Simulation", message=msg,
+                                  max=self.sample_size, show_time=True,
+                                  can_cancel=True)
+        progress.open()
+        def update_progress(done, total):
+            (cont, skip) = progress.update(done)
+            return cont and not skip
         self.c_stock, self.c_change, self.co2_yield = \
-                self.yassorunner.run_model(self)
+                self.yassorunner.run_model(self, update_progress)
+        if self.yassorunner.timemsg is not None:
+            error(self.yassorunner.timemsg, title='Error handling timesteps',
+                  buttons=['OK'])
                 
         self._create_co2_plot()
         self._chart_type_changed()
@@ -896,311 +852,138 @@ class Yasso(HasTraits):
         Loads all data from a single file. Data in sections defined by [name],
         data in whitespace delimited rows
         """
+        self.all_data = datafile.read()
+        self._set_all_data()
+
+    def _save_all_data(self):
+        f = codecs.open(self.data_file, 'w', 'utf8')
+        f.write(self.all_data)
+        f.close()
+        # only the sections edited since they were last read are parsed
+        self._set_all_data()
+
+    def _set_all_data(self):
+        """
+        Sets the data tables from the sections of all_data
+        """
         self._reset_data()
-        sectionp = re.compile('\[([\w+\s*]+)\]')
-        datap = re.compile('[+-Ee\d+\.\d*\s*]+')
-        active = None
-        data = defaultdict(list)
-        alldata = ''
-        linecount = 0
-        for line in datafile:
-            linecount += 1
-            alldata += line
-            m = re.match(sectionp, line)
-            if m is not None:
-                active = m.group(1)
-            d = re.match(datap, line)
-            if d is not None:
-                try:
-                    vals = [float(val) for val in d.group(0).split()]
-                    data[active].append(vals)
-                except ValueError:
-                    errmsg="There's an error on line %s\n  %s"\
-                        "for section %s\n"\
-                        "Values must be space separated and . is the decimal"\
-                        " separator" % (linecount, d.group(0), active)
-                    error(errmsg, title='Error saving data', buttons=['OK'])
-        self.all_data = alldata
-        for section, vallist in data.items():
+        errors = []
+        data = self.section_reader.read(self.all_data, errors)
+        for errmsg in errors:
+            error(errmsg, title='Error reading data', buttons=['OK'])
+        for section, rows in data.items():
             if section=='Initial state':
-                self._set_initial_state(vallist)
+                self._set_initial_state(rows)
             elif section=='Constant soil carbon input':
-                self._set_constant_litter(vallist)
+                self._set_constant_litter(rows)
             elif section=='Monthly soil carbon input':
-                self._set_monthly_litter(vallist)
+                self._set_monthly_litter(rows)
             elif section=='Yearly soil carbon input':
-                self._set_yearly_litter(vallist)
+                self._set_yearly_litter(rows)
             elif section=='Relative area change':
-                self._set_area_change(vallist)
+                self._set_area_change(rows)
             elif section=='Constant climate':
-                self._set_constant_climate(vallist)
+                self._set_constant_climate(rows)
             elif section=='Monthly climate':
-                self._set_monthly_climate(vallist)
+                self._set_monthly_climate(rows)
             elif section=='Yearly climate':
-                self._set_yearly_climate(vallist)
-
-    def _save_all_data(self):
-        f = codecs.open(self.data_file, 'w', 'utf8')
-        f.write(self.all_data)
-        f.close()
-        f = codecs.open(self.data_file, 'r', 'utf8')
-        self._load_all_data(f)
-        f.close()
+                self._set_yearly_climate(rows)
 
     def _reset_data(self):
         """
         Empties all input data structures
         """
-        self.initial_litter = []
-        self.steady_state = []
-        self.constant_litter = []
-        self.monthly_litter = []
-        self.yearly_litter = []
-        self.area_change = []
+        self.initial_litter = values_array([], LitterComponent)
+        self.steady_state = values_array([], LitterComponent)
+        self.constant_litter = values_array([], LitterComponent)
+        self.monthly_litter = values_array([], TimedLitterComponent)
+        self.yearly_litter = values_array([], TimedLitterComponent)
+        self.area_change = values_array([], AreaChange)
         self.constant_climate.mean_temperature = 0
         self.constant_climate.annual_rainfall = 0
         self.constant_climate.variation_amplitude = 0
-        self.yearly_climate = []
-        self.monthly_climate = []
+        self.yearly_climate = values_array([], YearlyClimate)
+        self.monthly_climate = values_array([], MonthlyClimate)
 
     def _set_initial_state(self, data):
-        errmsg = 'Soil carbon components should contain: \n'\
-                      ' mass, mass std, acid, acid std, water, water std,\n'\
-                      ' ethanol, ethanol std, non soluble, non soluble std,'\
-                      '\n humus, humus std, size class'
-        for vals in data:
-            ok, obj = self._load_litter_object(vals, errmsg)
-            if not ok:
-                break
-            self.initial_litter.append(obj)
+        self.initial_litter = self._load_records(data, LitterComponent,
+                                                 LITTER_ERRMSG, True)
 
     def _set_steady_state(self, data):
-        errmsg = 'Soil carbon components should contain: \n'\
-                      ' mass, mass std, acid, acid std, water, water std,\n'\
-                      ' ethanol, ethanol std, non soluble, non soluble std,'\
-                      '\n humus, humus std, size class'
-        self.steady_state = []
-        for vals in data:
-            ok, obj = self._load_litter_object(vals, errmsg)
-            if not ok:
-                break
-            self.steady_state.append(obj)
+        self.steady_state = values_array(data, LitterComponent)
 
     def _set_constant_litter(self, data):
-        errmsg = 'Soil carbon components should contain: \n'\
-                      ' mass, mass std, acid, acid std, water, water std,\n'\
-                      ' ethanol, ethanol std, non soluble, non soluble std,'\
-                      '\n humus, humus std, size class'
-        for vals in data:
-            ok, obj = self._load_litter_object(vals, errmsg)
-            if not ok:
-                break
-            self.constant_litter.append(obj)
+        self.constant_litter = self._load_records(data, LitterComponent,
+                                                  LITTER_ERRMSG, True)
 
     def _set_monthly_litter(self, data):
-        errmsg = 'timed soil carbon components should contain: \n'\
-                      ' timestep, mass, mass std, acid, acid std, water, '\
-                      'water std,\n'\
-                      ' ethanol, ethanol std, non soluble, non soluble std,'\
-                      '\n humus, humus std, size class'
-        for vals in data:
-            ok, obj = self._load_litter_object(vals, errmsg, True)
-            if not ok:
-                break
-            self.monthly_litter.append(obj)
+        self.monthly_litter = self._load_records(data, TimedLitterComponent,
+                                                 TIMED_LITTER_ERRMSG, True)
 
     def _set_yearly_litter(self, data):
-        errmsg = 'timed soil carbon components should contain: \n'\
-                  ' timestep, mass, mass std, acid, acid std, water, '\
-                  'water std,\n'\
-                  ' ethanol, ethanol std, non soluble, non soluble std,'\
-                  '\n humus, humus std, size class'
-        for vals in data:
-            ok, obj = self._load_litter_object(vals, errmsg, True)
-            if not ok:
-                break
-            self.yearly_litter.append(obj)
+        self.yearly_litter = self._load_records(data, TimedLitterComponent,
+                                                TIMED_LITTER_ERRMSG, True)
 
     def _set_area_change(self, data):
-        errmsg = 'Area change should contain:\n  timestep, relative area change'
-        for vals in data:
-            if len(vals)==2:
-                obj = AreaChange(timestep=int(vals[0]),
-                          rel_change=vals[1])
-                self.area_change.append(obj)
-            elif vals!=[]:
-                errmsg = errmsg + '\n%s data values found, 2 needed' % (len(data))
-                error(errmsg, title='error reading data',
-                      buttons=['OK'])
-                break
+        self.area_change = self._load_records(data, AreaChange,
+                                              AREA_CHANGE_ERRMSG)
 
     def _set_yearly_climate(self, data):
-        errmsg = 'Yearly climate should contain: timestep, mean temperature,\n'\
-                 'annual rainfall and temperature variation amplitude'
-        for vals in data:
-            if len(vals)==4:
-                obj = YearlyClimate(timestep=int(vals[0]),
-                          mean_temperature=vals[1],
-                          annual_rainfall=vals[2],
-                          variation_amplitude=vals[3])
-                self.yearly_climate.append(obj)
-            elif vals!=[]:
-                errmsg = errmsg + '\n%s data values found, 4 needed' % (len(data))
-                error(errmsg, title='error reading data',
-                      buttons=['OK'])
-                break
+        self.yearly_climate = self._load_records(data, YearlyClimate,
+                                                 YEARLY_CLIMATE_ERRMSG)
 
     def _set_constant_climate(self, data):
-        errmsg = 'Constant climate should contain: mean temperature,\n'\
-                 'annual rainfall and temperature variation amplitude'
-        if len(data[0])==3:
-            self.constant_climate.mean_temperature = data[0][0]
-            self.constant_climate.annual_rainfall = data[0][1]
-            self.constant_climate.variation_amplitude = data[0][2]
-        elif data[0]!=[]:
-            errmsg = errmsg + '\n%s data values found, 3 needed' % (len(data))
-            error(errmsg, title='error reading data',
-                  buttons=['OK'])
+        climate = self._load_records(data, ConstantClimateRecord,
+                                     CONSTANT_CLIMATE_ERRMSG, max_rows=1)
+        if len(climate):
+            self.constant_climate.mean_temperature = \
+                climate.mean_temperature[0]
+            self.constant_climate.annual_rainfall = climate.annual_rainfall[0]
+            self.constant_climate.variation_amplitude = \
+                climate.variation_amplitude[0]
 
     def _set_monthly_climate(self, data):
-        errmsg = 'Monthly climate data should contain: month,\n'\
-                 'temperature and rainfall'
-        for vals in data:
-            if len(vals)==3:
-                obj = MonthlyClimate(month=int(vals[0]),
-                          temperature=vals[1],
-                          rainfall=vals[2])
-                self.monthly_climate.append(obj)
-            elif vals!=[]:
-                errmsg = errmsg + '\n%s data values found, 3 needed' % (len(data))
-                error(errmsg, title='Error reading data',
-                      buttons=['OK'])
-                break
-
-    def _load_litter_object(self, data, errmsg, hastime=False):
-        obj = None
-        loaded = True
-        if hastime:
-            if len(data)==14:
-                obj = TimedLitterComponent(timestep=int(data[0]),
-                        mass=data[1],
-                        mass_std=data[2],
-                        acid=data[3],
-                        acid_std=data[4],
-                        water=data[5],
-                        water_std=data[6],
-                        ethanol=data[7],
-                        ethanol_std=data[8],
-                        non_soluble=data[9],
-                        non_soluble_std=data[10],
-                        humus=data[11],
-                        humus_std=data[12],
-                        size_class=data[13])
-            elif data!=[]:
-                errmsg = errmsg + '\n%s data values found, 14 needed' % (len(data))
-                error(errmsg, title='Error reading data',
-                      buttons=['OK'])
-                loaded = False
-            elif data==[]:
-                loaded = False
-        else:
-            if len(data)==13:
-                obj = LitterComponent(mass=data[0],
-                        mass_std=data[1],
-                        acid=data[2],
-                        acid_std=data[3],
-                        water=data[4],
-                        water_std=data[5],
-                        ethanol=data[6],
-                        ethanol_std=data[7],
-                        non_soluble=data[8],
-                        non_soluble_std=data[9],
-                        humus=data[10],
-                        humus_std=data[11],
-                        size_class=data[12])
-            elif data!=[]:
-                errmsg = errmsg + '\n%s data values found, 13 needed' % (len(data))
-                error(errmsg, title='Error reading data',
-                      buttons=['OK'])
-                loaded = False
-            elif data==[]:
-                loaded = False
-        return loaded, obj
+        self.monthly_climate = self._load_records(data, MonthlyClimate,
+                                                  MONTHLY_CLIMATE_ERRMSG)
+
+    def _load_records(self, data, cls, errmsg, stop_at_empty=False,
+                      max_rows=None):
+        """
+        Converts the rows of a data section into a record array, up to the
+        first row with a wrong number of values
+
+        data -- the datafile.Section
+        cls -- the modeldata record class of the section
+        errmsg -- what the rows should contain
+        stop_at_empty -- the litter lists end at the first empty row
+        max_rows -- number of rows read at most
+        """
+        errors = []
+        values = data.table(len(cls.fields), errmsg, stop_at_empty,
+                            max_rows, errors)
+        for msg in errors:
+            error(msg, title='Error reading data', buttons=['OK'])
+        return values_array(values, cls)
 
     def _save_moment_event_fired(self):
         filename = save_file()
         if filename != '':
             f=codecs.open(filename, 'w', 'utf8')
-            if self.result_type=='C stock':
-                comps = (('tom', self.stock_tom), ('woody', self.stock_woody),
-                        ('non-woody', self.stock_non_woody),
-                       ('acid', self.stock_acid), ('water', self.stock_water),
-                       ('ethanol', self.stock_ethanol),
-                       ('non-soluble', self.stock_non_soluble),
-                       ('humus', self.stock_humus))
-            elif self.result_type=='C change':
-                comps = (('tom', self.change_tom), ('woody', self.change_woody),
-                        ('non-woody', self.change_non_woody),
-                       ('acid', self.change_acid), ('water', self.change_water),
-                       ('ethanol', self.change_ethanol),
-                       ('non-soluble', self.change_non_soluble),
-                       ('humus', self.change_humus))
-            elif self.result_type=='CO2 production':
-                comps = (('CO2', self.co2),)
-            header = '# component, time step, mean, mode, var, skewness, '\
-                     'kurtosis, 95% confidence lower limit, 95% upper limit'
-            header = self._make_result_header(header)
-            f.write(header+'\n')
-            for comp, res in comps:
-                for row in res:
-                    resrow = ''
-                    for num in row:
-                        resrow = ' '.join([resrow, str(num)])
-                    resrow = ' '.join((comp, resrow))
-                    f.write(resrow+'\n')
+            write_moments(f, self, self.result_type)
             f.close()
 
+    def _save_binary_event_fired(self):
+        dirname = save_directory()
+        if dirname != '':
+            write_arrays(dirname, self)
+
     def _save_result_event_fired(self):
         filename = save_file()
         if filename != '':
             f=codecs.open(filename, 'w', 'utf8')
-            if self.result_type=='C stock':
-                res = self.c_stock
-                header = '# sample, time step, total om, woody om, non-woody om,'\
-                         ' acid, water, ethanol, non-soluble, humus'
-            elif self.result_type=='C change':
-                res = self.c_change
-                header = '# sample, time step, total om, woody om, non-woody om,'\
-                         ' acid, water, ethanol, non soluble, humus'
-            elif self.result_type=='CO2 production':
-                res = self.co2_yield
-                header = '# sample, time step, CO2 production (in carbon)'
-            header = self._make_result_header(header)
-            f.write(header+'\n')
-            for row in res:
-                resrow = ''
-                for num in row:
-                    resrow = ' '.join([resrow, str(num)])
-                f.write(resrow+'\n')
+            write_results(f, self, self.result_type)
             f.close()
 
-    def _make_result_header(self, header):
-        '''Adds metadata about the results into the header'''
-        hstr = '#########################################################\n'
-        hstr += '# ' + self.result_type + '\n'
-        hstr += '#########################################################\n'
-        hstr += '# Datafile used: ' + self.data_file + '\n'
-        hstr += '# Settings:\n'
-        hstr += '#   initial state: ' + self.initial_mode + '\n'
-        hstr += '#   soil carbon input: ' + self.litter_mode + '\n'
-        hstr += '#   climate: ' + self.climate_mode + '\n'
-        hstr += '#   sample size: ' + str(self.sample_size) + '\n'
-        hstr += ''.join(['#   timestep length: ', str(self.timestep_length),
-                         ' (', self.duration_unit, ')\n'])
-        hstr += '#   woody litter size limit: ' + str(self.woody_size_limit)+'\n'
-        hstr += '#\n'
-        return hstr + header
-
     def _init_results(self):
         """
         model results: stock & change
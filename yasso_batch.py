@@ -0,0 +1,501 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Runs the Yasso15 model from the command line without the user interface
+
+Reads a data file in the format of the user interface and a parameter file,
+runs the simulation and writes the results and their moments as text files
+into the output directory. No GUI toolkit is imported, so that the model
+can be run on hosts without a display.
+
+    python yasso_batch.py [options] datafile outdir
+
+Given a directory of data files, or a manifest file listing the data files
+with --manifest, the sites are run in a pool of worker processes with the
+same settings and the results of all sites are written into combined
+files with the site name as the first column.
+
+    python yasso_batch.py [options] --processes 64 datadir outdir
+
+The samples of a single site can be split into shards run in worker
+processes with --processes, or in threads of a single process with
+--threads. With --seed the results are reproducible regardless of the
+number of processes and threads. A y15 module compiled with OpenMP runs
+the batched model calls in --kernel-threads threads. With --trajectory each
+sample is run through all the timesteps with one model call per size
+class.
+
+With --binary the results and their moments are written as NumPy arrays
+that can be memory mapped instead, see modeldata.write_arrays, into
+the output directory or into a subdirectory per site.
+
+With --stream the results of the samples are written into .npy files in
+the output directory, or in a subdirectory per site, a block of samples at
+a time as the run proceeds, see modeldata.ResultStore, and the moments are
+accumulated on the fly, so that the memory used does not grow with the
+sample size. With --online only the moments are accumulated and no sample
+results are kept. --quantiles gives the 95% confidence limits as the 2.5
+and 97.5 percentiles of the samples instead of the mean -+ 2 std.
+"""
+
+import argparse
+import codecs
+import glob
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+try:
+    import ConfigParser as configparser
+except ImportError:
+    import configparser
+
+import modeldata
+from modelcall import ModelRunner, BACKENDS, BATCH_SIZE, SOLVERS, EXPMS
+
+# result file names by result type
+RESULT_FILES = (('C stock', 'c_stock.txt', 'stock_moments.txt'),
+                ('C change', 'c_change.txt', 'change_moments.txt'),
+                ('CO2 production', 'co2.txt', 'co2_moments.txt'))
+# subdirectory of the output directory for the result rows of the sites
+# until they are appended to the combined result files
+PARTS_DIR = '.parts'
+
+
+def program_dir():
+    """
+    Returns the directory of the program, where the param directory and
+    yasso.ini are
+    """
+    fn = os.path.split(sys.executable)
+    if fn[1].lower().startswith('python'):
+        return os.path.abspath(os.path.split(__file__)[0])
+    return fn[0]
+
+def default_parameter_set(exedir):
+    """
+    Returns the default parameter set named in yasso.ini
+    """
+    cfg = configparser.ConfigParser()
+    inipath = os.path.join(exedir, 'yasso.ini')
+    if not cfg.read(inipath):
+        return 'Yasso15'
+    return cfg.get("data", "default_param")
+
+def parameter_file(param, exedir):
+    """
+    Returns the path of the parameter file, param is either a path or the
+    name of a parameter set in the param directory
+    """
+    if os.path.isfile(param):
+        return param
+    return os.path.join(exedir, 'param', '%s.dat' % param)
+
+def print_progress(done, total):
+    """
+    Progress callback writing the number of samples done to stderr
+    """
+    sys.stderr.write('\rSimulated %d/%d samples' % (done, total))
+    if done==total:
+        sys.stderr.write('\n')
+    sys.stderr.flush()
+
+def create_runner(parfile, **runner_args):
+    """
+    Returns a ModelRunner for the parameter file
+
+    parfile -- the model parameter file
+    runner_args -- passed to the ModelRunner constructor
+    """
+    runner = ModelRunner(parfile, **runner_args)
+    if not runner.is_usable_parameter_file():
+        raise Exception("The parameter file %s has wrong number of columns "
+                        "and cannot be used." % parfile)
+    return runner
+
+def run(md, runner, progress=None, processes=1, **run_args):
+    """
+    Runs the simulation for the model data, computing the steady state
+    first if it is the initial state. The results are set to the model
+    data.
+
+    md -- modeldata.ModelData with the input data and settings
+    runner -- the ModelRunner
+    progress -- optional progress callback, see ModelRunner.run_model
+    processes -- number of worker processes for the samples
+    run_args -- passed to ModelRunner.run_model: store, quantiles and
+                online
+    """
+    errmsg = modeldata.check_settings(md)
+    if errmsg is not None:
+        raise Exception(errmsg)
+    if md.initial_mode=='steady state':
+        md.set_steady_state(runner.compute_steady_state(md))
+    md.c_stock, md.c_change, md.co2_yield = runner.run_model(md, progress,
+                                                             processes,
+                                                             **run_args)
+
+def write_output(md, outdir, binary=False):
+    """
+    Writes the results and their moments into the output directory
+
+    binary -- write binary arrays instead of text, see
+              modeldata.write_arrays
+    """
+    if binary:
+        modeldata.write_arrays(outdir, md)
+        return
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    for result_type, resfile, momentfile in RESULT_FILES:
+        f = codecs.open(os.path.join(outdir, resfile), 'w', 'utf8')
+        modeldata.write_results(f, md, result_type)
+        f.close()
+        f = codecs.open(os.path.join(outdir, momentfile), 'w', 'utf8')
+        modeldata.write_moments(f, md, result_type)
+        f.close()
+
+def site_files(path, manifest=False, pattern='*.txt'):
+    """
+    Returns the (site name, data file) pairs of the sites to run
+
+    path -- a data file, a directory of data files or a manifest file
+    manifest -- path is a manifest with one data file per line, relative
+                paths are relative to the manifest, # starts a comment
+    pattern -- file name pattern of the data files in a directory
+    """
+    if manifest:
+        basedir = os.path.dirname(os.path.abspath(path))
+        f = codecs.open(path, 'r', 'utf8')
+        files = [os.path.join(basedir, line.strip()) for line in f
+                 if line.strip() and not line.strip().startswith('#')]
+        f.close()
+    elif os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, pattern)))
+    else:
+        files = [path]
+    sites = []
+    names = set()
+    for datafile in files:
+        name = os.path.splitext(os.path.basename(datafile))[0]
+        # the site name is a column in the whitespace delimited results
+        name = re.sub(r'\s+', '_', name)
+        site = name
+        i = 1
+        while site in names:
+            i += 1
+            site = '%s_%d' % (name, i)
+        names.add(site)
+        sites.append((site, datafile))
+    return sites
+
+# the model runner of a worker process, the parameter file is read once
+# per process
+_worker_runner = None
+
+def _init_worker(parfile, runner_args):
+    global _worker_runner
+    _worker_runner = create_runner(parfile, **runner_args)
+
+def _run_site(task):
+    """
+    Runs one site in a worker process and writes its results, see
+    _write_site. Returns the site name, the part files of the result types
+    or None if the site failed, and the error or timestep message. The
+    results themselves are not passed back to the parent process.
+    """
+    site, datafile, settings, run_args, outdir, binary = task
+    md = modeldata.ModelData(**settings)
+    try:
+        md.load(datafile)
+        run(md, _worker_runner, **run_args)
+        parts = _write_site(md, site, outdir, binary)
+    except Exception as error:
+        return site, None, str(error)
+    return site, parts, _worker_runner.timemsg
+
+def _write_site(md, site, outdir, binary):
+    """
+    Writes the results of a site: the binary arrays into a subdirectory of
+    the output directory, or the rows of the combined result and moment
+    files into part files in PARTS_DIR. Returns the (result file, moment
+    file) part files by result type, empty for binary arrays.
+    """
+    if binary:
+        modeldata.write_arrays(os.path.join(outdir, site), md)
+        return {}
+    parts = {}
+    for result_type, resfile, momentfile in RESULT_FILES:
+        resfile, momentfile = [os.path.join(outdir, PARTS_DIR,
+                                            '%s.%s' % (site, name))
+                               for name in (resfile, momentfile)]
+        f = codecs.open(resfile, 'w', 'utf8')
+        modeldata.write_results(f, md, result_type, site, header=False)
+        f.close()
+        f = codecs.open(momentfile, 'w', 'utf8')
+        modeldata.write_moments(f, md, result_type, site, header=False)
+        f.close()
+        parts[result_type] = (resfile, momentfile)
+    return parts
+
+def _append_part(f, part):
+    """
+    Appends a part file written by _write_site to a result file and
+    removes it
+    """
+    partf = codecs.open(part, 'r', 'utf8')
+    try:
+        shutil.copyfileobj(partf, f)
+    finally:
+        partf.close()
+    os.remove(part)
+
+def run_sites(sites, settings, parfile, outdir, processes=None,
+              progress=None, binary=False, stream=False, quantiles=False,
+              online=False, **runner_args):
+    """
+    Runs the sites in a pool of worker processes and writes the results of
+    each site into the combined result files as they are finished. The
+    workers write the results, only the names of their files are passed
+    back, so the parent process does not hold the results of any site. The
+    status of each site is written into sites.txt. Returns the number of
+    sites that failed.
+
+    sites -- (site name, data file) pairs, see site_files
+    settings -- the run settings of modeldata.ModelData
+    parfile -- the model parameter file
+    outdir -- directory for the result files
+    processes -- number of worker processes, by default the number of CPUs
+    progress -- optional callback called as progress(done, total) with the
+                number of sites done
+    binary -- write binary arrays into a subdirectory per site instead of
+              the combined text files
+    stream -- stream the results of each site into a subdirectory during
+              the run, see ModelRunner.run_model
+    quantiles, online -- passed to ModelRunner.run_model
+    runner_args -- passed to the ModelRunner constructor
+    """
+    global _worker_runner
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(sites)))
+    # fails here on an unusable parameter file instead of in the workers
+    runner = create_runner(parfile, **runner_args)
+    partdir = os.path.join(outdir, PARTS_DIR)
+    if not binary and not os.path.isdir(partdir):
+        os.makedirs(partdir)
+    elif not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    # the settings common to all sites for the headers
+    md = modeldata.ModelData(**settings)
+    md.data_file = '%d sites' % len(sites)
+    files = []
+    for result_type, resfile, momentfile in RESULT_FILES:
+        if binary:
+            break
+        resf = codecs.open(os.path.join(outdir, resfile), 'w', 'utf8')
+        modeldata.write_header(resf, md, result_type, site=True)
+        momentf = codecs.open(os.path.join(outdir, momentfile), 'w', 'utf8')
+        modeldata.write_header(momentf, md, result_type, True, True)
+        files.append((result_type, resf, momentf))
+    statusf = codecs.open(os.path.join(outdir, 'sites.txt'), 'w', 'utf8')
+    statusf.write('# site, data file, status\n')
+    datafiles = dict(sites)
+    tasks = [(site, datafile, settings,
+              {'store': os.path.join(outdir, site) if stream else None,
+               'quantiles': quantiles, 'online': online}, outdir, binary)
+             for site, datafile in sites]
+    if processes==1:
+        _worker_runner = runner
+        results = (_run_site(task) for task in tasks)
+        pool = None
+    else:
+        if runner_args.get('kernel_threads') is None:
+            # the worker processes already use the CPUs
+            runner_args = dict(runner_args, kernel_threads=1)
+        pool = multiprocessing.Pool(processes, _init_worker,
+                                    (parfile, runner_args))
+        results = pool.imap_unordered(_run_site, tasks)
+    failed = 0
+    try:
+        for done, (site, parts, msg) in enumerate(results):
+            if parts is None:
+                failed += 1
+                status = 'error: %s' % msg
+            else:
+                for result_type, resf, momentf in files:
+                    resfile, momentfile = parts[result_type]
+                    _append_part(resf, resfile)
+                    _append_part(momentf, momentfile)
+                status = 'ok' if msg is None else 'warning: %s' % msg
+            statusf.write('%s %s %s\n' % (site, datafiles[site],
+                                           ' '.join(status.split())))
+            if progress is not None:
+                progress(done + 1, len(tasks))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        for result_type, resf, momentf in files:
+            resf.close()
+            momentf.close()
+        statusf.close()
+        if not binary:
+            shutil.rmtree(partdir, ignore_errors=True)
+    return failed
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+                description='Runs the Yasso15 model without the user '
+                            'interface')
+    parser.add_argument('datafile', help='data file in the format of the '
+                        'user interface, or a directory of data files')
+    parser.add_argument('outdir', help='directory for the result files')
+    parser.add_argument('-p', '--param', default=None,
+                        help='parameter set name in the param directory or '
+                        'path to a parameter file, by default the one in '
+                        'yasso.ini')
+    parser.add_argument('-n', '--sample-size', type=int, default=10)
+    parser.add_argument('-l', '--simulation-length', type=int, default=10,
+                        help='number of timesteps')
+    parser.add_argument('-t', '--timestep-length', type=int, default=1)
+    parser.add_argument('-u', '--duration-unit', default='year',
+                        choices=modeldata.DURATION_UNITS)
+    parser.add_argument('--initial-mode', default='non zero',
+                        choices=modeldata.INITIAL_MODES)
+    parser.add_argument('--litter-mode', default='zero',
+                        choices=modeldata.LITTER_MODES)
+    parser.add_argument('--climate-mode', default='yearly',
+                        choices=modeldata.CLIMATE_MODES)
+    parser.add_argument('--leaching', type=float, default=0.0)
+    parser.add_argument('--woody-size-limit', type=float, default=3.0)
+    parser.add_argument('--backend', default=None, choices=BACKENDS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--solver', default='dense', choices=SOLVERS,
+                        help='block solves only the AWEN compartments as a '
+                        'system and humus in closed form')
+    parser.add_argument('--cache-propagators', action='store_true',
+                        help='with constant yearly climate and litter, '
+                        'compute the solution operators of the model once '
+                        'per parameter set and size class and reuse them in '
+                        'the later timesteps')
+    parser.add_argument('--expm', default='taylor', choices=EXPMS,
+                        help='matrix exponential, pade chooses the degree '
+                        'and scaling from the norm of the matrix')
+    parser.add_argument('-m', '--manifest', action='store_true',
+                        help='datafile is a manifest listing the data files '
+                        'of the sites, one per line')
+    parser.add_argument('--pattern', default='*.txt',
+                        help='file name pattern of the data files in a '
+                        'directory')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='number of worker processes, by default the '
+                        'number of CPUs for several sites and 1 for a single '
+                        'site, whose samples are then split between the '
+                        'processes')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='number of threads the samples of a site are '
+                        'split between when it is run in a single process')
+    parser.add_argument('--kernel-threads', type=int, default=None,
+                        help='number of OpenMP threads of the batched model '
+                        'calls of a y15 module compiled with OpenMP, by '
+                        'default the OpenMP default, or 1 with several '
+                        'processes or threads, more than one turns '
+                        '--cache-propagators off')
+    parser.add_argument('--trajectory', action='store_true',
+                        help='run each sample through all the timesteps '
+                        'with one model call per size class')
+    parser.add_argument('-s', '--seed', type=int, default=None,
+                        help='seed of the random draws, the same seed '
+                        'reproduces the results')
+    parser.add_argument('-b', '--binary', action='store_true',
+                        help='write the results as NumPy arrays instead of '
+                        'text, into a subdirectory per site for several '
+                        'sites')
+    parser.add_argument('--stream', action='store_true',
+                        help='write the results of the samples into the '
+                        'output directory during the run instead of keeping '
+                        'them in memory, into a subdirectory per site for '
+                        'several sites')
+    parser.add_argument('--online', action='store_true',
+                        help='accumulate the moments as the samples finish '
+                        'without keeping the results of the samples, the '
+                        'result files are then empty')
+    parser.add_argument('--quantiles', action='store_true',
+                        help='the 95%% confidence limits are the 2.5 and '
+                        '97.5 percentiles of the samples, estimated with '
+                        '--online')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not report progress')
+    args = parser.parse_args(argv)
+    for name in ('sample_size', 'simulation_length', 'timestep_length',
+                 'threads', 'kernel_threads'):
+        if getattr(args, name) is not None and getattr(args, name) < 1:
+            parser.error('%s must be at least 1' % name.replace('_', '-'))
+    return args
+
+def print_site_progress(done, total):
+    """
+    Progress callback writing the number of sites done to stderr
+    """
+    sys.stderr.write('\rFinished %d/%d sites' % (done, total))
+    if done==total:
+        sys.stderr.write('\n')
+    sys.stderr.flush()
+
+def main(argv=None):
+    args = parse_args(argv)
+    exedir = program_dir()
+    if args.param is None:
+        args.param = default_parameter_set(exedir)
+    parfile = parameter_file(args.param, exedir)
+    settings = dict(sample_size=args.sample_size,
+                    simulation_length=args.simulation_length,
+                    timestep_length=args.timestep_length,
+                    duration_unit=args.duration_unit,
+                    initial_mode=args.initial_mode,
+                    litter_mode=args.litter_mode,
+                    climate_mode=args.climate_mode,
+                    leaching=args.leaching,
+                    woody_size_limit=args.woody_size_limit)
+    runner_args = dict(batch_size=args.batch_size, backend=args.backend,
+                       cache_propagators=args.cache_propagators,
+                       seed=args.seed, solver=args.solver, expm=args.expm,
+                       threads=args.threads,
+                       kernel_threads=args.kernel_threads,
+                       trajectory=args.trajectory)
+    if args.manifest or os.path.isdir(args.datafile):
+        try:
+            sites = site_files(args.datafile, args.manifest, args.pattern)
+            progress = None if args.quiet else print_site_progress
+            failed = run_sites(sites, settings, parfile, args.outdir,
+                               args.processes, progress, args.binary,
+                               args.stream, args.quantiles, args.online,
+                               **runner_args)
+        except Exception as error:
+            sys.stderr.write('Error: %s\n' % error)
+            return 1
+        if failed:
+            sys.stderr.write('%d of %d sites failed, see sites.txt\n'
+                             % (failed, len(sites)))
+            return 1
+        return 0
+    md = modeldata.ModelData(**settings)
+    try:
+        md.load(args.datafile)
+        runner = create_runner(parfile, **runner_args)
+        run(md, runner, None if args.quiet else print_progress,
+            args.processes or 1,
+            store=args.outdir if args.stream else None,
+            quantiles=args.quantiles, online=args.online)
+    except Exception as error:
+        sys.stderr.write('Error: %s\n' % error)
+        return 1
+    if runner.timemsg is not None:
+        sys.stderr.write('Warning: %s\n' % runner.timemsg)
+    write_output(md, args.outdir, args.binary)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())